@@ -0,0 +1,170 @@
+"""
+Benchmark ``analytics/anomaly_report.py`` on a synthetic ``telemetry_receiver`` store.
+
+A store is written with ``--vms`` VMs (half ``web``, a quarter ``db``, and the rest
+``worker``) sampled for ``--hours`` hours, with each VM's collectors started at a
+different time:
+
+* ``iowait.0`` -- every second, around a level which depends on the role.
+* ``analytics.system_memory_tracking.percent`` -- every five seconds.
+* ``analytics.network_io_tracking.ens2.bytes_recv`` -- a cumulative counter, every
+  second.
+
+Two anomalies are injected: ``web-7`` has ten times the ``iowait`` of the other
+``web`` VMs, and the memory of ``db-3`` steps up by 30% halfway through. The
+benchmark reports the time to build the report, its peak memory (which should stay
+under ``--memory-mb``), and the rank of each anomaly in the report (``1`` is the
+highest, and ``0`` means it was missed)::
+
+    python benchmarks/anomaly_report.py --vms 1000 --hours 1 --output before.json
+    # ... make changes ...
+    python benchmarks/anomaly_report.py --vms 1000 --hours 1 --compare before.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+from graph_build import compare, git_commit
+
+REPORT = (
+    Path(__file__).resolve().parent.parent
+    / "src"
+    / "firewheel_repo_utilities"
+    / "analytics"
+    / "anomaly_report.py"
+)
+_spec = importlib.util.spec_from_file_location("anomaly_report", REPORT)
+anomaly_report = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(anomaly_report)
+
+# Role -> the share of the VMs, and their iowait and memory percent
+ROLES = {"web": (0.5, 2.0, 40.0), "db": (0.25, 8.0, 70.0), "worker": (0.25, 1.0, 25.0)}
+
+
+def _write(directory, metric, timestamps, values):
+    samples = np.empty((len(timestamps), 2), dtype="<f8")
+    samples[:, 0] = timestamps
+    samples[:, 1] = values
+    samples.tofile(directory / f"{metric}.0.seg")
+
+
+def write_store(store, vms, hours, seed=0):
+    """
+    Write a synthetic store.
+
+    Arguments:
+        store (pathlib.Path): The directory to write the segments to.
+        vms (int): The number of VMs.
+        hours (float): The hours of samples of each VM.
+        seed (int): The seed of the random samples.
+    """
+    rng = np.random.default_rng(seed)
+    seconds = int(hours * 3600)
+    start = 1700000000.0
+    hosts = []
+    for role, (share, _iowait, _memory) in ROLES.items():
+        hosts += [
+            (f"{role}-{index}", role) for index in range(max(1, int(vms * share)))
+        ]
+    for host, role in hosts:
+        _share, iowait, memory = ROLES[role]
+        directory = store / host
+        directory.mkdir(parents=True)
+        offset = start + rng.uniform(0, 5)
+
+        timestamps = offset + np.arange(seconds) + rng.normal(0, 0.01, seconds)
+        level = iowait * (10 if host == "web-7" else 1)
+        _write(
+            directory,
+            "iowait.0",
+            timestamps,
+            np.abs(rng.normal(level, level / 4, seconds)).round(2),
+        )
+        _write(
+            directory,
+            "analytics.network_io_tracking.ens2.bytes_recv",
+            timestamps,
+            np.cumsum(rng.integers(50000, 150000, seconds)),
+        )
+
+        timestamps = offset + np.arange(0, seconds, 5)
+        values = rng.normal(memory, 2, len(timestamps))
+        if host == "db-3":
+            values[len(values) // 2 :] += 30
+        _write(
+            directory,
+            "analytics.system_memory_tracking.percent",
+            timestamps,
+            values.round(1),
+        )
+
+
+def _rank(entries, host, metric):
+    for rank, entry in enumerate(entries, 1):
+        if entry["host"] == host and entry["metric"] == metric:
+            return rank
+    return 0
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--vms", type=int, default=1000)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--memory-mb", type=int, default=256)
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store = Path(workdir)
+        write_store(store, args.vms, args.hours)
+        store_bytes = sum(path.stat().st_size for path in store.rglob("*.seg"))
+        tracemalloc.start()
+        start = time.perf_counter()
+        report = anomaly_report.build_report(store, memory_mb=args.memory_mb)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    results = {
+        "commit": git_commit(),
+        "size": args.vms,
+        "python": sys.version.split()[0],
+        "results": {
+            "report": {
+                "seconds": round(elapsed, 2),
+                "us_per_vm_hour": round(elapsed * 1e6 / args.vms / args.hours, 1),
+                "store_mb": round(store_bytes / (1 << 20), 1),
+                "peak_mb": round(peak / (1 << 20), 1),
+                "budget_mb": args.memory_mb,
+                "iowait_outlier_rank": _rank(report["outliers"], "web-7", "iowait.0"),
+                "memory_change_rank": _rank(
+                    report["change_points"],
+                    "db-3",
+                    "analytics.system_memory_tracking.percent",
+                ),
+            }
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
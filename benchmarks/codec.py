@@ -0,0 +1,310 @@
+"""
+Benchmark ``analytics_gorilla`` against gzip'd JSON for storing metric samples.
+
+An hour of samples (at each collector's default interval) is simulated for the CPU,
+system memory, disk IO, and network IO collectors with a fixed random seed, and each
+is stored in three ways:
+
+* ``json`` -- The lean records (one line of JSON per sample, as written by
+  ``analytics_records``).
+* ``gzip_json`` -- The lean records compressed with :py:mod:`gzip`.
+* ``gorilla`` -- One stream of Gorilla blocks per collector (a column per field).
+
+The benchmark reports the bytes per sample (of all of a collector's fields) and the
+time to encode and decode each sample::
+
+    python benchmarks/codec.py --hours 1 --output before.json
+    # ... make changes ...
+    python benchmarks/codec.py --hours 1 --compare before.json
+"""
+
+import io
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+from collectors import load_vm_resource
+from graph_build import compare, git_commit
+
+gorilla = load_vm_resource("analytics_gorilla.py")
+
+START = 1760950800.0
+
+
+def _walk(rng, value, step, low, high):
+    return min(max(value + rng.uniform(-step, step), low), high)
+
+
+def cpu_samples(rng, count):
+    """
+    Simulate the samples of the CPU collector on a 4 vCPU VM.
+
+    Arguments:
+        rng (random.Random): The random number generator.
+        count (int): The number of samples.
+
+    Returns:
+        list: The fields of each sample.
+    """
+    levels = [5.0, 12.0, 3.0, 20.0]
+    samples = []
+    for _ in range(count):
+        levels = [_walk(rng, level, 4, 0, 100) for level in levels]
+        samples.append(
+            {f"cpu{cpu}": round(level, 1) for cpu, level in enumerate(levels)}
+        )
+    return samples
+
+
+def system_memory_samples(rng, count):
+    """
+    Simulate the samples of the system memory collector on an 8 GiB VM.
+
+    Arguments:
+        rng (random.Random): The random number generator.
+        count (int): The number of samples.
+
+    Returns:
+        list: The fields of each sample.
+    """
+    prefix = "analytics.system_memory_tracking."
+    total = 8343789568
+    used = 2147483648
+    cached = 3221225472
+    samples = []
+    for _ in range(count):
+        if rng.random() < 0.3:
+            used += rng.randint(-64, 64) * 4096
+        if rng.random() < 0.1:
+            cached += rng.randint(0, 256) * 4096
+        free = total - used - cached - 104857600
+        available = free + cached
+        samples.append(
+            {
+                f"{prefix}total": total,
+                f"{prefix}available": available,
+                f"{prefix}percent": round((total - available) / total * 100, 1),
+                f"{prefix}used": used,
+                f"{prefix}free": free,
+                f"{prefix}active": used + cached // 2,
+                f"{prefix}inactive": cached // 2,
+                f"{prefix}buffers": 104857600,
+                f"{prefix}cached": cached,
+                f"{prefix}shared": 9711616,
+                f"{prefix}slab": 27787264,
+            }
+        )
+    return samples
+
+
+def _counter_samples(rng, count, prefix, fields):
+    counters = dict.fromkeys(fields, 0)
+    samples = []
+    for _ in range(count):
+        for field, (probability, unit, most) in fields.items():
+            if rng.random() < probability:
+                counters[field] += rng.randint(1, most) * unit
+        samples.append({f"{prefix}{field}": value for field, value in counters.items()})
+    return samples
+
+
+def disk_io_samples(rng, count):
+    """
+    Simulate the samples of the disk IO collector for one disk.
+
+    Arguments:
+        rng (random.Random): The random number generator.
+        count (int): The number of samples.
+
+    Returns:
+        list: The fields of each sample.
+    """
+    return _counter_samples(
+        rng,
+        count,
+        "analytics.disk_io_tracking.vda.",
+        {
+            "read_count": (0.2, 1, 20),
+            "write_count": (0.6, 1, 50),
+            "read_bytes": (0.2, 4096, 200),
+            "write_bytes": (0.6, 4096, 400),
+            "read_time": (0.2, 1, 30),
+            "write_time": (0.6, 1, 80),
+            "read_merged_count": (0.1, 1, 10),
+            "write_merged_count": (0.4, 1, 40),
+            "busy_time": (0.6, 1, 100),
+        },
+    )
+
+
+def network_io_samples(rng, count):
+    """
+    Simulate the samples of the network IO collector for one NIC.
+
+    Arguments:
+        rng (random.Random): The random number generator.
+        count (int): The number of samples.
+
+    Returns:
+        list: The fields of each sample.
+    """
+    return _counter_samples(
+        rng,
+        count,
+        "analytics.network_io_tracking.ens3.",
+        {
+            "bytes_sent": (0.9, 1, 150000),
+            "bytes_recv": (0.9, 1, 900000),
+            "packets_sent": (0.9, 1, 200),
+            "packets_recv": (0.9, 1, 800),
+            "errin": (0.0, 1, 1),
+            "errout": (0.0, 1, 1),
+            "dropin": (0.001, 1, 2),
+            "dropout": (0.0, 1, 1),
+        },
+    )
+
+
+# Name -> (simulated samples, default interval in seconds)
+COLLECTORS = {
+    "cpu": (cpu_samples, 1),
+    "system_memory": (system_memory_samples, 5),
+    "disk_io": (disk_io_samples, 5),
+    "network_io": (network_io_samples, 1),
+}
+
+
+def encode_json(timestamps, samples):
+    """
+    Write the samples as lean records.
+
+    Arguments:
+        timestamps (list): The time of each sample.
+        samples (list): The fields of each sample.
+
+    Returns:
+        bytes: The records.
+    """
+    lines = []
+    for timestamp, sample in zip(timestamps, samples):
+        fields = json.dumps(sample, separators=(",", ":"))
+        lines.append(f'{{"host":"vm1","ts":{timestamp:.6f},{fields[1:]}\n')
+    return "".join(lines).encode()
+
+
+def encode_gorilla(timestamps, samples):
+    """
+    Write the samples as a stream of Gorilla blocks with a column per field.
+
+    Arguments:
+        timestamps (list): The time of each sample.
+        samples (list): The fields of each sample.
+
+    Returns:
+        bytes: The stream.
+    """
+    stream = io.BytesIO()
+    encoder = gorilla.Encoder(stream)
+    for timestamp, sample in zip(timestamps, samples):
+        encoder.add(timestamp, *sample.values())
+    encoder.flush()
+    return stream.getvalue()
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run_collector(name, hours, seed):
+    """
+    Simulate a collector's samples and measure each way of storing them.
+
+    Arguments:
+        name (str): The name of the collector in :py:data:`COLLECTORS`.
+        hours (float): The length of the simulation, in hours.
+        seed (int): The seed of the random number generator.
+
+    Returns:
+        dict: The measurements for the collector.
+    """
+    simulate, interval = COLLECTORS[name]
+    rng = random.Random(seed)
+    count = int(hours * 3600 / interval)
+    samples = simulate(rng, count)
+    timestamps = [
+        round(START + index * interval + rng.uniform(0, 0.003), 6)
+        for index in range(count)
+    ]
+
+    records, json_encode = _timed(encode_json, timestamps, samples)
+    compressed, gzip_encode = _timed(gzip.compress, records)
+    _, gzip_decode = _timed(
+        lambda data: [json.loads(line) for line in gzip.decompress(data).splitlines()],
+        compressed,
+    )
+    stream, gorilla_encode = _timed(encode_gorilla, timestamps, samples)
+    decoded, gorilla_decode = _timed(
+        lambda data: list(gorilla.Decoder(io.BytesIO(data))), stream
+    )
+    assert [row[1:] for row in decoded] == [
+        tuple(sample.values()) for sample in samples
+    ], f"{name} did not round trip"
+
+    gorilla_bytes = len(stream)
+    return {
+        "samples": count,
+        "fields": len(samples[0]),
+        "json_bytes_per_sample": round(len(records) / count, 1),
+        "gzip_json_bytes_per_sample": round(len(compressed) / count, 2),
+        "gorilla_bytes_per_sample": round(gorilla_bytes / count, 2),
+        "gorilla_vs_gzip_json": round(len(compressed) / gorilla_bytes, 2),
+        "gzip_json_encode_us_per_sample": round(
+            (json_encode + gzip_encode) * 1e6 / count, 2
+        ),
+        "gorilla_encode_us_per_sample": round(gorilla_encode * 1e6 / count, 2),
+        "gzip_json_decode_us_per_sample": round(gzip_decode * 1e6 / count, 2),
+        "gorilla_decode_us_per_sample": round(gorilla_decode * 1e6 / count, 2),
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--collector", action="append", choices=list(COLLECTORS), dest="collectors"
+    )
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    results = {
+        "commit": git_commit(),
+        "size": args.hours,
+        "python": sys.version.split()[0],
+        "results": {
+            name: run_collector(name, args.hours, args.seed)
+            for name in (args.collectors or COLLECTORS)
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Benchmark a single sampling step of each analytics collector.
+
+The collectors in ``analytics/vm_resources`` normally run forever inside a VM.
+This benchmark loads them on the host, replaces :py:mod:`psutil` with
+:py:mod:`fake_psutil` (which parses a recorded ``/proc`` snapshot from
+``fixtures/``) and replaces ``netstat``/``pgrep`` with their recorded output. Each
+collector's ``sample()`` step is then called repeatedly and the benchmark reports:
+
+* ``us_per_sample`` -- The time to take one sample, in microseconds.
+* ``peak_bytes_per_sample`` -- The peak memory allocated (via :py:mod:`tracemalloc`)
+  while taking one sample.
+* ``retained_bytes_per_sample`` -- The memory still allocated after a sample (i.e.
+  growth that would accumulate over the life of an experiment).
+* ``bytes_per_sample`` -- The bytes written to the collector's log files and stdout.
+* ``bytes_per_hour`` -- ``bytes_per_sample`` scaled by the collector's default
+  interval from ``Analytics``.
+
+Results are printed as JSON (tagged with the current git commit) so that they can
+be saved and compared across commits::
+
+    python benchmarks/collectors.py --samples 2000 --output before.json
+    # ... make changes ...
+    python benchmarks/collectors.py --samples 2000 --compare before.json
+
+Use ``--live`` inside a VM to sample the real ``/proc`` (with the real
+:py:mod:`psutil`, ``netstat``, and ``pgrep``) instead, and ``--record`` to save a
+new snapshot of the current machine for use with ``--fixture``. Use ``--procfs`` to
+run the collectors with ``analytics_procfs`` (reading the snapshot's ``/proc``
+files directly) rather than :py:mod:`fake_psutil`. The ``cpu_extended`` collector
+(``psutil.cpu_tracking.py --extended``) and the ``pressure`` collector
+(``analytics.pressure_tracking.py``) always use ``analytics_procfs``.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import logging
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import importlib.util
+from pathlib import Path
+
+import fake_psutil
+from graph_build import compare, git_commit
+
+BENCHMARK_PATH = Path(__file__).resolve().parent
+VM_RESOURCES = (
+    BENCHMARK_PATH.parent
+    / "src"
+    / "firewheel_repo_utilities"
+    / "analytics"
+    / "vm_resources"
+)
+DEFAULT_FIXTURE = BENCHMARK_PATH / "fixtures" / "ubuntu2204"
+
+# The /proc files which make up a snapshot
+PROC_FILES = [
+    "stat",
+    "meminfo",
+    "diskstats",
+    "net/dev",
+    "mounts",
+    "loadavg",
+    "vmstat",
+    "pressure/cpu",
+    "pressure/io",
+    "pressure/memory",
+    "filesystems",
+]
+
+NETSTAT_COMMAND = ["netstat", "-t", "-u", "-l", "-p", "-n"]
+STRACE_PROCESS_REGEX = "nginx"
+
+
+class CountingStream(io.TextIOBase):
+    """A text stream which discards everything written to it but counts the bytes."""
+
+    def __init__(self):
+        """Start counting from zero."""
+        super().__init__()
+        self.bytes_written = 0
+
+    def writable(self):
+        """Mark the stream as writable.
+
+        Returns:
+            bool: Always ``True``.
+        """
+        return True
+
+    def write(self, text):
+        """Count the bytes in ``text``.
+
+        Args:
+            text (str | bytes): The text (or encoded text) to write.
+
+        Returns:
+            int: The number of characters written.
+        """
+        if isinstance(text, str):
+            self.bytes_written += len(text.encode("utf-8"))
+        else:
+            self.bytes_written += len(text)
+        return len(text)
+
+
+def load_vm_resource(filename):
+    """Load an analytics VM resource as a module, without running its main block.
+
+    Args:
+        filename (str): The filename of the VM resource.
+
+    Returns:
+        module: The loaded VM resource.
+    """
+    name = filename[: -len(".py")].replace(".", "_")
+    spec = importlib.util.spec_from_file_location(name, VM_RESOURCES / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _fake_check_output(recorded_output):
+    output = recorded_output.read_bytes()
+
+    def check_output(_command, **_kwargs):
+        return output
+
+    return check_output
+
+
+def _cpu(module, _workdir, lean, procfs):
+    collector = module.CPUTracking(1, lean=lean, procfs=procfs)
+    outfile = CountingStream()
+    return lambda _state: collector.sample(outfile), outfile
+
+
+def _cpu_extended(module, _workdir, lean, _procfs):
+    collector = module.CPUTracking(1, lean=lean, extended=True)
+    outfile = CountingStream()
+    return lambda _state: collector.sample(outfile), outfile
+
+
+def _system_memory(module, _workdir, lean, procfs):
+    collector = module.SystemMemoryTracking(5, lean=lean, procfs=procfs)
+    return lambda _state: collector.sample(), None
+
+
+def _disk_io(module, _workdir, lean, procfs):
+    collector = module.DiskIOTracking(5, lean=lean, procfs=procfs)
+    return lambda _state: collector.sample(), None
+
+
+def _disk_usage(module, _workdir, lean, procfs):
+    collector = module.DiskUsageTracking(5, lean=lean, procfs=procfs)
+    collector.disk_partitions = collector.backend.disk_partitions(all=False)
+    return lambda _state: collector.sample(), None
+
+
+def _network_io(module, _workdir, lean, procfs):
+    collector = module.NetworkIOTracking(1, lean=lean, procfs=procfs)
+    collector.nics = collector.backend.net_if_addrs()
+    return lambda _state: collector.sample(), None
+
+
+def _pressure(module, workdir, lean, _procfs):
+    options = workdir / "pressure_tracking.options"
+    options.write_bytes(pickle.dumps({"lean": lean}, protocol=0))
+    collector = module.PressureTracking(str(options))
+    return lambda _state: collector._emit(collector.sample()), None
+
+
+def _port(module, _workdir, _lean, _procfs):
+    collector = module.PortTracking(None)
+    collector.full_command = NETSTAT_COMMAND
+    return collector.sample, None
+
+
+def _strace(module, workdir, _lean, _procfs):
+    collector = module.Strace(None)
+    collector.process_regex = STRACE_PROCESS_REGEX
+    collector.first_match_only = False
+    collector.output_dir = str(workdir)
+    # Only the pgrep supervisor is measured, never start a real strace
+    collector._execute_strace = lambda *_args: None
+    already_matched = {}
+    return lambda state: collector._scan_pgrep(state, already_matched), None
+
+
+# Name -> (VM resource, setup, default interval in seconds, initial sample state,
+#          recorded command output)
+COLLECTORS = {
+    "cpu": ("psutil.cpu_tracking.py", _cpu, 1, None, None),
+    "cpu_extended": ("psutil.cpu_tracking.py", _cpu_extended, 1, None, None),
+    "system_memory": (
+        "psutil.system_memory_tracking.py",
+        _system_memory,
+        5,
+        None,
+        None,
+    ),
+    "disk_io": ("psutil.disk_io_tracking.py", _disk_io, 5, None, None),
+    "disk_usage": ("psutil.disk_usage_tracking.py", _disk_usage, 5, None, None),
+    "network_io": ("psutil.network_io_tracking.py", _network_io, 1, None, None),
+    "pressure": ("analytics.pressure_tracking.py", _pressure, 5, None, None),
+    "port": ("analytics.port_tracking.py", _port, 1, set(), "netstat.txt"),
+    "strace": ("analytics.strace.py", _strace, 1, None, "pgrep.txt"),
+}
+
+
+@contextlib.contextmanager
+def _captured_logging(stream):
+    """Send the collectors' stdout and log files to ``stream`` while they are built.
+
+    Args:
+        stream (CountingStream): The stream which counts the bytes written.
+
+    Yields:
+        None: Control returns to the caller while the output is captured.
+    """
+    file_handler = logging.FileHandler
+    logging.FileHandler = lambda *_args, **_kwargs: logging.StreamHandler(stream)
+    if "analytics_records" not in sys.modules:
+        sys.modules["analytics_records"] = load_vm_resource("analytics_records.py")
+    records = sys.modules["analytics_records"]
+    open_streams = records.open_streams
+    records.open_streams = lambda _path, stdout=True, **_kwargs: [stream] * (1 + stdout)
+    try:
+        with contextlib.redirect_stdout(stream):
+            yield
+    finally:
+        logging.FileHandler = file_handler
+        records.open_streams = open_streams
+
+
+def run_collector(name, samples, fixture, live, lean=False, procfs=False):
+    """
+    Take ``samples`` samples with a collector and measure the cost.
+
+    Arguments:
+        name (str): The name of the collector in :py:data:`COLLECTORS`.
+        samples (int): The number of samples to take.
+        fixture (pathlib.Path): The snapshot to sample (ignored if ``live``).
+        live (bool): Sample the current machine instead of ``fixture``.
+        lean (bool): Run the ``psutil`` collectors with ``--lean``.
+        procfs (bool): Run the ``psutil`` collectors with ``--procfs``.
+
+    Returns:
+        dict: The measurements for the collector.
+    """
+    filename, setup, interval, state, recorded_output = COLLECTORS[name]
+    module = load_vm_resource(filename)
+    if recorded_output and not live:
+        module.check_output = _fake_check_output(fixture / recorded_output)
+
+    stream = CountingStream()
+    with tempfile.TemporaryDirectory() as workdir, _captured_logging(stream):
+        sample, outfile = setup(module, Path(workdir), lean, procfs)
+        outputs = [stream] + ([outfile] if outfile else [])
+
+        # Warm up (e.g. the first CPU sample and the first pgrep match)
+        for _ in range(10):
+            state = sample(state)
+
+        start_bytes = sum(output.bytes_written for output in outputs)
+        start = time.perf_counter()
+        for _ in range(samples):
+            state = sample(state)
+        elapsed = time.perf_counter() - start
+        written = sum(output.bytes_written for output in outputs) - start_bytes
+
+        tracemalloc.start()
+        peak_total = 0
+        for _ in range(samples):
+            tracemalloc.clear_traces()
+            state = sample(state)
+            peak_total += tracemalloc.get_traced_memory()[1]
+        tracemalloc.clear_traces()
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(samples):
+            state = sample(state)
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    bytes_per_sample = written / samples
+    return {
+        "us_per_sample": round(elapsed * 1e6 / samples, 2),
+        "peak_bytes_per_sample": round(peak_total / samples),
+        "retained_bytes_per_sample": round((after - before) / samples, 2),
+        "bytes_per_sample": round(bytes_per_sample, 1),
+        "bytes_per_hour": round(bytes_per_sample * 3600 / interval),
+    }
+
+
+def use_procfs(fixture, live):
+    """
+    Load ``analytics_procfs`` for the collectors to use with ``--procfs``.
+
+    Arguments:
+        fixture (pathlib.Path): The snapshot to sample (ignored if ``live``).
+        live (bool): Sample the current machine instead of ``fixture``.
+    """
+    procfs = load_vm_resource("analytics_procfs.py")
+    sys.modules["analytics_procfs"] = procfs
+    if live:
+        return
+
+    procfs.PROC = str(fixture / "proc")
+    statvfs = json.loads((fixture / "statvfs.json").read_text(encoding="utf-8"))
+
+    def fake_statvfs(path):
+        # Use a fragment size of one byte so that the blocks are the recorded bytes
+        usage = statvfs[path]
+        return os.statvfs_result(
+            (0, 1, usage["total"], usage["total"] - usage["used"], usage["free"])
+            + (0,) * 5
+        )
+
+    procfs._statvfs = fake_statvfs
+
+
+def record(destination):
+    """
+    Save a snapshot of the current machine for use with ``--fixture``.
+
+    This must be called after ``fake_psutil.use_fixture("/")`` so that the mounted
+    partitions are read from the real ``/proc/mounts``.
+
+    Arguments:
+        destination (pathlib.Path): The directory in which to save the snapshot.
+    """
+    for proc_file in PROC_FILES:
+        source = Path("/proc") / proc_file
+        if source.exists():
+            (destination / "proc" / proc_file).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, destination / "proc" / proc_file)
+
+    statvfs = {}
+    for partition in fake_psutil.disk_partitions():
+        usage = shutil.disk_usage(partition.mountpoint)
+        statvfs[partition.mountpoint] = {
+            "total": usage.total,
+            "used": usage.used,
+            "free": usage.free,
+        }
+    (destination / "statvfs.json").write_text(
+        json.dumps(statvfs, indent=2) + "\n", encoding="utf-8"
+    )
+
+    for filename, command in (
+        ("netstat.txt", NETSTAT_COMMAND),
+        ("pgrep.txt", ["pgrep", "-l", "-f", STRACE_PROCESS_REGEX]),
+    ):
+        result = subprocess.run(command, capture_output=True, check=False)  # noqa: S603
+        (destination / filename).write_bytes(result.stdout)
+    print(f"Recorded a snapshot of this machine in {destination}")
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", "-n", type=int, default=2000)
+    parser.add_argument(
+        "--collector", action="append", choices=list(COLLECTORS), dest="collectors"
+    )
+    parser.add_argument("--fixture", type=Path, default=DEFAULT_FIXTURE)
+    parser.add_argument(
+        "--live", action="store_true", help="Sample this machine instead."
+    )
+    parser.add_argument(
+        "--lean", action="store_true", help="Run the collectors with --lean."
+    )
+    parser.add_argument(
+        "--procfs", action="store_true", help="Run the collectors with --procfs."
+    )
+    parser.add_argument("--record", type=Path, help="Save a snapshot of this machine.")
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        fake_psutil.use_fixture("/")
+        record(args.record)
+        return
+
+    if not args.live:
+        fake_psutil.use_fixture(args.fixture)
+        sys.modules["psutil"] = fake_psutil
+    # The extended CPU collector reads /proc with analytics_procfs regardless
+    use_procfs(args.fixture, args.live)
+
+    results = {
+        "commit": git_commit(),
+        "size": args.samples,
+        "fixture": "live" if args.live else args.fixture.name,
+        "lean": args.lean,
+        "backend": "procfs" if args.procfs else "psutil",
+        "python": sys.version.split()[0],
+        "results": {
+            name: run_collector(
+                name, args.samples, args.fixture, args.live, args.lean, args.procfs
+            )
+            for name in (args.collectors or COLLECTORS)
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark the CPU collector's ``/proc/stat`` parsing as the number of CPUs grows.
+
+A ``/proc/stat`` with ``--cpus`` CPUs is generated from the ``cpu0`` line of the
+fixture (with different times for each CPU, and an ``intr`` line with a counter per
+interrupt as on a large VM), and each way of reading it is timed:
+
+* ``cpu_percent`` -- ``analytics_procfs.cpu_percent(percpu=True)``, the busy
+  percentage of each CPU recorded by ``psutil.cpu_tracking.py``.
+* ``extended`` -- ``analytics_procfs.CPUStats.sample()``, the user, system, iowait,
+  irq, softirq, and steal percentages of each CPU, the context switches,
+  interrupts, run queue, and load average recorded with ``--extended``.
+
+The benchmark reports the time per sample and per CPU for each::
+
+    python benchmarks/cpu_stats.py --cpus 4 --cpus 64 --cpus 256 --output before.json
+    # ... make changes ...
+    python benchmarks/cpu_stats.py --cpus 4 --cpus 64 --cpus 256 --compare before.json
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+from collectors import DEFAULT_FIXTURE, load_vm_resource
+from graph_build import compare, git_commit
+
+procfs = load_vm_resource("analytics_procfs.py")
+
+
+def write_proc(cpus, fixture, proc):
+    """
+    Write a ``/proc`` with ``cpus`` CPUs, based on the fixture's.
+
+    Arguments:
+        cpus (int): The number of CPUs.
+        fixture (pathlib.Path): The snapshot to base the files on.
+        proc (pathlib.Path): The directory to write ``stat`` and ``loadavg`` to.
+    """
+    lines = (fixture / "proc" / "stat").read_text(encoding="utf-8").splitlines()
+    template = [int(value) for value in lines[1].split()[1:]]
+    cpu_times = [[value + cpu * 7 for value in template] for cpu in range(cpus)]
+    cpu_lines = [
+        " ".join([f"cpu{cpu}", *map(str, times)]) for cpu, times in enumerate(cpu_times)
+    ]
+    total = [sum(column) for column in zip(*cpu_times)]
+    other_lines = [
+        " ".join(["intr", "123456789"] + ["1234"] * (cpus * 8))
+        if line.startswith("intr ")
+        else line
+        for line in lines
+        if not line.startswith("cpu")
+    ]
+    stat = ["cpu  " + " ".join(map(str, total)), *cpu_lines, *other_lines]
+    proc.mkdir()
+    (proc / "stat").write_text("\n".join(stat) + "\n", encoding="utf-8")
+    shutil.copyfile(fixture / "proc" / "loadavg", proc / "loadavg")
+
+
+def _measure(sample, cpus, samples):
+    sample()
+    start = time.perf_counter()
+    for _ in range(samples):
+        sample()
+    elapsed = time.perf_counter() - start
+    return {
+        "us_per_sample": round(elapsed * 1e6 / samples, 2),
+        "us_per_cpu": round(elapsed * 1e6 / samples / cpus, 3),
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cpus", action="append", type=int)
+    parser.add_argument("--samples", "-n", type=int, default=2000)
+    parser.add_argument("--fixture", type=Path, default=DEFAULT_FIXTURE)
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    results = {
+        "commit": git_commit(),
+        "size": args.samples,
+        "python": sys.version.split()[0],
+        "results": {},
+    }
+    for cpus in args.cpus or [4, 64, 256]:
+        with tempfile.TemporaryDirectory() as workdir:
+            proc = Path(workdir) / "proc"
+            write_proc(cpus, args.fixture, proc)
+            procfs.PROC = str(proc)
+            procfs._files.clear()
+            results["results"][f"cpu_percent_{cpus}"] = _measure(
+                lambda: procfs.cpu_percent(percpu=True), cpus, args.samples
+            )
+            results["results"][f"extended_{cpus}"] = _measure(
+                procfs.CPUStats().sample, cpus, args.samples
+            )
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
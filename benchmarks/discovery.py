@@ -0,0 +1,131 @@
+"""
+Benchmark finding the processes for ``--regexes`` concurrent ``strace`` requests.
+
+Each call to ``Analytics.strace`` normally runs its own ``analytics.strace.py``,
+which runs ``pgrep -l -f <regex>`` every second until a process matches. With
+``init_kwargs={"shared_strace": True}``, a single ``StraceDiscovery`` reads the
+command lines in ``/proc`` once a second and matches them against all of the
+regexes at once. This benchmark measures one second's worth of polling for each on
+the current machine, while none of the regexes match (the usual state while
+waiting for a service to start):
+
+* ``pgrep`` -- ``--regexes`` runs of ``pgrep -l -f``, as the separate requests do.
+* ``shared`` -- One ``StraceDiscovery.scan()`` with ``--regexes`` requests.
+
+The benchmark reports the wall and CPU time (including child processes) per second
+of polling::
+
+    python benchmarks/discovery.py --regexes 10 --output before.json
+    # ... make changes ...
+    python benchmarks/discovery.py --regexes 10 --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from collectors import load_vm_resource
+from graph_build import compare, git_commit
+
+strace = load_vm_resource("analytics.strace.py")
+
+
+def _measure(poll, rounds):
+    start_times = os.times()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        poll()
+    elapsed = time.perf_counter() - start
+    end_times = os.times()
+    cpu = sum(end_times[:4]) - sum(start_times[:4])
+    return {
+        "ms_per_poll": round(elapsed * 1000 / rounds, 3),
+        "cpu_ms_per_poll": round(cpu * 1000 / rounds, 3),
+    }
+
+
+def poll_pgrep(regexes):
+    """
+    Run ``pgrep`` once for each regex, as the separate ``strace`` requests do.
+
+    Arguments:
+        regexes (list): The regexes of the requests.
+    """
+    for regex in regexes:
+        subprocess.run(  # noqa: S603
+            ["/usr/bin/pgrep", "-l", "-f", regex], capture_output=True, check=False
+        )
+
+
+def shared_discovery(regexes, workdir):
+    """
+    Create a ``StraceDiscovery`` with a request for each regex.
+
+    Arguments:
+        regexes (list): The regexes of the requests.
+        workdir (pathlib.Path): A directory for the requests and output.
+
+    Returns:
+        StraceDiscovery: The discovery, with its requests loaded.
+    """
+    requests = workdir / "requests"
+    requests.mkdir()
+    for index, regex in enumerate(regexes):
+        (requests / f"strace.1.{index}.request").write_bytes(
+            pickle.dumps(
+                {
+                    "process_regex": regex,
+                    "first_match_only": True,
+                    "output_dir": str(workdir / str(index)),
+                },
+                protocol=0,
+            )
+        )
+    discovery = strace.StraceDiscovery(str(requests))
+    discovery.load_requests()
+    return discovery
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--regexes", "-n", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    # Regexes which match no process, not even the pgrep started for them
+    regexes = [f"^benchmark-service-{index}[.]py" for index in range(args.regexes)]
+    with tempfile.TemporaryDirectory() as workdir:
+        discovery = shared_discovery(regexes, Path(workdir))
+        results = {
+            "commit": git_commit(),
+            "size": args.regexes,
+            "python": sys.version.split()[0],
+            "processes": sum(name.isdigit() for name in os.listdir("/proc")),
+            "results": {
+                "pgrep": _measure(lambda: poll_pgrep(regexes), args.rounds),
+                "shared": _measure(discovery.scan, args.rounds),
+            },
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
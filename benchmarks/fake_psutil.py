@@ -0,0 +1,224 @@
+"""
+A stand-in for the parts of :py:mod:`psutil` used by the analytics collectors.
+
+Every call parses the files of a recorded snapshot (see ``fixtures/``) the same
+way that :py:mod:`psutil` parses ``/proc`` on Linux, so that the cost of a sample
+is representative without depending on the host running the benchmark. Call
+:py:func:`use_fixture` before importing any collectors.
+"""
+
+import json
+from pathlib import Path
+from collections import namedtuple
+
+svmem = namedtuple(
+    "svmem",
+    "total available percent used free active inactive buffers cached shared slab",
+)
+sdiskio = namedtuple(
+    "sdiskio",
+    "read_count write_count read_bytes write_bytes read_time write_time "
+    "read_merged_count write_merged_count busy_time",
+)
+sdiskusage = namedtuple("sdiskusage", "total used free percent")
+sdiskpart = namedtuple("sdiskpart", "device mountpoint fstype opts")
+snetio = namedtuple(
+    "snetio",
+    "bytes_sent bytes_recv packets_sent packets_recv errin errout dropin dropout",
+)
+
+SECTOR_SIZE = 512
+
+_fixture = {"path": None}
+_last_cpu_times = {"percpu": None}
+
+
+def use_fixture(path):
+    """
+    Read all subsequent samples from the given snapshot directory.
+
+    Arguments:
+        path (pathlib.Path): The snapshot directory (e.g. ``fixtures/ubuntu2204``).
+    """
+    _fixture["path"] = Path(path)
+    _last_cpu_times["percpu"] = None
+
+
+def _read(name):
+    with open(_fixture["path"] / name, encoding="utf-8") as fhand:
+        return fhand.read()
+
+
+def cpu_percent(percpu=False):
+    """
+    Return the CPU utilization since the previous call, as :py:mod:`psutil` does.
+
+    Arguments:
+        percpu (bool): Return a list with one entry per CPU.
+
+    Returns:
+        float | list: The utilization as a percentage.
+    """
+    times = []
+    for line in _read("proc/stat").splitlines():
+        if not line.startswith("cpu"):
+            break
+        if line.startswith("cpu ") != (not percpu):
+            continue
+        times.append([int(value) for value in line.split()[1:]])
+
+    previous = _last_cpu_times["percpu"] or times
+    _last_cpu_times["percpu"] = times
+    percents = []
+    for old, new in zip(previous, times):
+        total = sum(new) - sum(old)
+        idle = (new[3] + new[4]) - (old[3] + old[4])
+        percents.append(round((total - idle) / total * 100, 1) if total else 0.0)
+    return percents if percpu else percents[0]
+
+
+def virtual_memory():
+    """
+    Return the system memory statistics from ``/proc/meminfo``.
+
+    Returns:
+        svmem: The memory statistics in bytes.
+    """
+    mems = {}
+    for line in _read("proc/meminfo").splitlines():
+        fields = line.split()
+        mems[fields[0].rstrip(":")] = int(fields[1]) * 1024
+
+    total = mems["MemTotal"]
+    free = mems["MemFree"]
+    buffers = mems["Buffers"]
+    cached = mems["Cached"] + mems.get("SReclaimable", 0)
+    available = mems["MemAvailable"]
+    used = total - free - cached - buffers
+    percent = round((total - available) / total * 100, 1)
+    return svmem(
+        total,
+        available,
+        percent,
+        used,
+        free,
+        mems["Active"],
+        mems["Inactive"],
+        buffers,
+        cached,
+        mems["Shmem"],
+        mems["Slab"],
+    )
+
+
+def disk_io_counters(perdisk=False):
+    """
+    Return the disk IO counters from ``/proc/diskstats``.
+
+    Arguments:
+        perdisk (bool): Return a dictionary keyed by disk name.
+
+    Returns:
+        dict | sdiskio: The IO counters.
+    """
+    counters = {}
+    for line in _read("proc/diskstats").splitlines():
+        fields = line.split()
+        name = fields[2]
+        reads, rmerged, rsectors, rtime = map(int, fields[3:7])
+        writes, wmerged, wsectors, wtime = map(int, fields[7:11])
+        busy_time = int(fields[12])
+        counters[name] = sdiskio(
+            reads,
+            writes,
+            rsectors * SECTOR_SIZE,
+            wsectors * SECTOR_SIZE,
+            rtime,
+            wtime,
+            rmerged,
+            wmerged,
+            busy_time,
+        )
+    if perdisk:
+        return counters
+    return sdiskio(*[sum(column) for column in zip(*counters.values())])
+
+
+def disk_partitions(all=False):  # noqa: A002
+    """
+    Return the mounted partitions from ``/proc/mounts``.
+
+    Arguments:
+        all (bool): Include pseudo file systems as well as physical devices.
+
+    Returns:
+        list: A :py:class:`sdiskpart` for each mounted partition.
+    """
+    partitions = []
+    for line in _read("proc/mounts").splitlines():
+        device, mountpoint, fstype, opts = line.split()[:4]
+        if all or device.startswith("/dev/"):
+            partitions.append(sdiskpart(device, mountpoint, fstype, opts))
+    return partitions
+
+
+def disk_usage(path):
+    """
+    Return the usage of a mounted partition from the recorded ``statvfs`` results.
+
+    Arguments:
+        path (str): The mount point of the partition.
+
+    Returns:
+        sdiskusage: The usage statistics in bytes.
+    """
+    usage = json.loads(_read("statvfs.json"))[path]
+    total_user = usage["used"] + usage["free"]
+    percent = round(usage["used"] / total_user * 100, 1) if total_user else 0.0
+    return sdiskusage(usage["total"], usage["used"], usage["free"], percent)
+
+
+def _net_dev():
+    counters = {}
+    for line in _read("proc/net/dev").splitlines()[2:]:
+        name, data = line.split(":", 1)
+        fields = [int(value) for value in data.split()]
+        counters[name.strip()] = snetio(
+            fields[8],
+            fields[0],
+            fields[9],
+            fields[1],
+            fields[2],
+            fields[10],
+            fields[3],
+            fields[11],
+        )
+    return counters
+
+
+def net_io_counters(pernic=False):
+    """
+    Return the network IO counters from ``/proc/net/dev``.
+
+    Arguments:
+        pernic (bool): Return a dictionary keyed by NIC name.
+
+    Returns:
+        dict | snetio: The IO counters.
+    """
+    counters = _net_dev()
+    if pernic:
+        return counters
+    return snetio(*[sum(column) for column in zip(*counters.values())])
+
+
+def net_if_addrs():
+    """
+    Return the NICs from ``/proc/net/dev``.
+
+    The collectors only use the NIC names, so no addresses are recorded.
+
+    Returns:
+        dict: An empty list of addresses keyed by NIC name.
+    """
+    return {nic: [] for nic in _net_dev()}
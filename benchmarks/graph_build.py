@@ -0,0 +1,200 @@
+"""
+Benchmark the cost of decorating experiment graph vertices with the model
+component objects in this repository.
+
+Each scenario decorates ``N`` vertices with one of the model component objects
+(on top of a stubbed Ubuntu 22.04 VM) and calls a common mix of its methods.
+For each scenario, the benchmark reports:
+
+* ``wall_seconds`` -- The total time to build all ``N`` vertices.
+* ``wall_us_per_vertex`` -- The time to build a single vertex, in microseconds.
+* ``peak_kib_per_vertex`` -- The peak memory allocated (via :py:mod:`tracemalloc`)
+  divided by ``N``.
+* ``entries_per_vertex`` -- The number of schedule entries created per vertex.
+* ``file_refs_per_vertex`` -- The number of VM resource files referenced per vertex.
+
+Results are printed as JSON (tagged with the current git commit) so that they can
+be saved and compared across commits::
+
+    python benchmarks/graph_build.py --vertices 10000 --output before.json
+    # ... make changes ...
+    python benchmarks/graph_build.py --vertices 10000 --compare before.json
+"""
+
+import gc
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+from stubs import FakeVertex, Ubuntu2204Server, load_model_components
+
+
+def _analytics(mcs, vertex):
+    vertex.decorate(mcs["analytics"].Analytics)
+    vertex.add_cpu_tracking()
+    vertex.add_system_memory_tracking()
+    vertex.add_network_io_tracking()
+    vertex.add_disk_io_tracking()
+    vertex.add_disk_usage_tracking()
+    vertex.add_port_tracking()
+    vertex.run_tcpdump()
+    vertex.strace(10, "nginx")
+
+
+def _python(mcs, vertex):
+    vertex.decorate(mcs["utilities.python"].PythonVM)
+    vertex.install_pip_package_list(
+        -90, ["requests-2.21.0-py2.py3-none-any.whl"], python_version="python3"
+    )
+    vertex.add_ipython(-80)
+
+
+def _utilities(mcs, vertex):
+    vertex.decorate(mcs["utilities.tools"].Utilities)
+    vertex.add_tcpdump()
+    vertex.add_docker()
+    vertex.add_wireshark()
+
+
+def _nodejs(mcs, vertex):
+    vertex.decorate(mcs["utilities.nodejs"].NodeJSVM, init_kwargs={"symlink": True})
+    vertex.install_npm_packages(
+        -40, "app-lock.tgz", "/opt/app", npm_cache_archive="npm-cache.tgz"
+    )
+
+
+SCENARIOS = {
+    "analytics": _analytics,
+    "python": _python,
+    "utilities": _utilities,
+    "nodejs": _nodejs,
+}
+
+
+def run_scenario(mcs, scenario, vertices):
+    """
+    Build ``vertices`` vertices for a scenario and measure the cost.
+
+    Arguments:
+        mcs (dict): The loaded model component modules.
+        scenario (str): The name of the scenario in :py:data:`SCENARIOS`.
+        vertices (int): The number of vertices to build.
+
+    Returns:
+        dict: The measurements for the scenario.
+    """
+    build = SCENARIOS[scenario]
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = []
+    for index in range(vertices):
+        vertex = FakeVertex(f"{scenario}-{index}")
+        vertex.decorate(Ubuntu2204Server)
+        build(mcs, vertex)
+        graph.append(vertex)
+    wall_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    entries = sum(len(vertex.schedule) for vertex in graph)
+    file_refs = sum(
+        entry.file_references() for vertex in graph for entry in vertex.schedule
+    )
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "wall_us_per_vertex": round(wall_seconds * 1e6 / vertices, 2),
+        "peak_kib_per_vertex": round(peak / 1024 / vertices, 3),
+        "entries_per_vertex": entries / vertices,
+        "file_refs_per_vertex": file_refs / vertices,
+    }
+
+
+def git_commit():
+    """
+    Get the commit that the benchmark is being run against.
+
+    Returns:
+        str: The abbreviated hash of ``HEAD``, or ``None`` outside of a git checkout.
+    """
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+                capture_output=True,
+                check=True,
+                cwd=Path(__file__).parent,
+            )
+            .stdout.decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Print the relative change of each measurement against a baseline.
+
+    Arguments:
+        results (dict): The current benchmark results.
+        baseline (dict): Previously saved benchmark results.
+    """
+    print(f"Comparing {results['commit']} against {baseline['commit']}")
+    if results["size"] != baseline["size"]:
+        print(
+            f"  Warning: the baseline used a size of {baseline['size']} rather "
+            f"than {results['size']}, so only normalized metrics are comparable."
+        )
+    for scenario, metrics in results["results"].items():
+        if scenario not in baseline["results"]:
+            continue
+        for metric, value in metrics.items():
+            old = baseline["results"][scenario].get(metric)
+            if old is None:
+                continue
+            change = (value - old) / old * 100 if old else 0.0
+            print(
+                f"  {scenario:<10} {metric:<22} {old:>12} -> {value:>12} ({change:+.1f}%)"
+            )
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--vertices", "-n", type=int, default=10000)
+    parser.add_argument(
+        "--scenario", action="append", choices=sorted(SCENARIOS), dest="scenarios"
+    )
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    mcs = load_model_components()
+    results = {
+        "commit": git_commit(),
+        "size": args.vertices,
+        "python": sys.version.split()[0],
+        "results": {
+            scenario: run_scenario(mcs, scenario, args.vertices)
+            for scenario in (args.scenarios or SCENARIOS)
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
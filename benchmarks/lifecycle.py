@@ -0,0 +1,156 @@
+"""
+Benchmark ``analytics.process_lifecycle.py`` during a fork storm.
+
+The tracker is started (with ``--method netlink`` or ``proc``, writing lean
+records to a temporary file), then a shell runs ``--processes`` short-lived
+``/bin/true`` processes back to back. This requires root for the proc connector and
+should be run in a VM or on an idle host, as every other process is tracked too.
+
+The benchmark reports how many of the storm's ``exec`` and exit events were
+recorded, the events which were reported as lost (or, with ``proc``, unseen), and
+the CPU time used by the tracker::
+
+    python benchmarks/lifecycle.py --processes 20000 --output before.json
+    # ... make changes ...
+    python benchmarks/lifecycle.py --processes 20000 --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import signal
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from collectors import VM_RESOURCES
+from graph_build import compare, git_commit
+
+TRACKER = VM_RESOURCES / "analytics.process_lifecycle.py"
+
+
+def start_tracker(method, workdir):
+    """
+    Start the tracker and wait until it has subscribed to the events.
+
+    Arguments:
+        method (str): Either ``netlink`` or ``proc``.
+        workdir (pathlib.Path): A directory for the options and records.
+
+    Returns:
+        tuple: The tracker's process and the path to its records.
+
+    Raises:
+        RuntimeError: If the tracker exits before it starts writing records.
+    """
+    records = workdir / "process_lifecycle.log"
+    options = workdir / "options"
+    options.write_bytes(
+        pickle.dumps(
+            {"method": method, "interval": 1, "lean": True, "path": str(records)},
+            protocol=0,
+        )
+    )
+    process = subprocess.Popen(
+        [sys.executable, str(TRACKER), str(options)], stdout=subprocess.DEVNULL
+    )
+    while not (records.exists() and records.stat().st_size):
+        if process.poll() is not None:
+            raise RuntimeError(f"The tracker exited with {process.returncode}")
+        time.sleep(0.01)
+    return process, records
+
+
+def run_storm(method, processes, workdir):
+    """
+    Run a fork storm while the tracker is running.
+
+    Arguments:
+        method (str): Either ``netlink`` or ``proc``.
+        processes (int): The number of processes to start.
+        workdir (pathlib.Path): A directory for the options and records.
+
+    Returns:
+        dict: The measurements.
+    """
+    tracker, records = start_tracker(method, workdir)
+    start = time.perf_counter()
+    storm = subprocess.Popen(
+        [
+            "/bin/sh",
+            "-c",
+            f'i=0; while [ "$i" -lt {processes} ]; do /bin/true; i=$((i + 1)); done',
+        ]
+    )
+    storm.wait()
+    elapsed = time.perf_counter() - start
+    # Let the tracker drain its receive buffer (or list /proc once more)
+    time.sleep(1.5)
+    tracker.send_signal(signal.SIGTERM)
+    _, _, usage = os.wait4(tracker.pid, 0)
+
+    events = [json.loads(line) for line in records.read_bytes().splitlines()]
+    children = set()
+    execs = exits = lost = unseen = 0
+    for event in events:
+        if event["event"] == "exec" and event["ppid"] == storm.pid:
+            children.add(event["pid"])
+            execs += 1
+        elif event["event"] == "exit" and event["pid"] in children:
+            exits += 1
+        elif event["event"] == "lost":
+            lost += 1
+        elif event["event"] == "unseen":
+            unseen += event["forks"]
+    return {
+        "processes_per_sec": round(processes / elapsed),
+        "execs_recorded": execs,
+        "exits_recorded": exits,
+        "overflows": lost,
+        "unseen_forks": unseen,
+        "tracker_cpu_ms": round((usage.ru_utime + usage.ru_stime) * 1000),
+        "tracker_cpu_us_per_process": round(
+            (usage.ru_utime + usage.ru_stime) * 1e6 / processes, 1
+        ),
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--processes", "-n", type=int, default=5000)
+    parser.add_argument(
+        "--method", action="append", choices=["netlink", "proc"], dest="methods"
+    )
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    results = {
+        "commit": git_commit(),
+        "size": args.processes,
+        "python": sys.version.split()[0],
+        "results": {},
+    }
+    for method in args.methods or ["netlink", "proc"]:
+        with tempfile.TemporaryDirectory() as workdir:
+            results["results"][method] = run_storm(
+                method, args.processes, Path(workdir)
+            )
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Load test ``telemetry_receiver`` with ``N`` simulated VMs.
+
+The receiver runs in this process while a second process simulates ``--vms`` VMs,
+each of which sends a frame of ``--records`` lean records (like those of the
+``psutil`` collectors) every ``--interval`` seconds over its own Unix or TCP
+connection (or, with ``--scheme udp``, as datagrams). An ``--interval`` of ``0``
+sends the frames back to back to find the receiver's maximum throughput.
+
+The benchmark reports the records ingested per second, the ingest latency (from a
+record's timestamp to its frame being ingested) and whether any frames were lost::
+
+    python benchmarks/receiver.py --vms 2000 --duration 20 --output before.json
+    # ... make changes ...
+    python benchmarks/receiver.py --vms 2000 --duration 20 --compare before.json
+"""
+
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import importlib.util
+import multiprocessing
+from pathlib import Path
+
+from graph_build import compare, git_commit
+
+BENCHMARK_PATH = Path(__file__).resolve().parent
+RECEIVER = (
+    BENCHMARK_PATH.parent
+    / "src"
+    / "firewheel_repo_utilities"
+    / "analytics"
+    / "telemetry_receiver.py"
+)
+
+_spec = importlib.util.spec_from_file_location("telemetry_receiver", RECEIVER)
+telemetry_receiver = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(telemetry_receiver)
+transport = telemetry_receiver.analytics_transport
+
+
+def make_bodies(vm, records):
+    """
+    Create the fields of each record that a simulated VM sends, after ``ts``.
+
+    Arguments:
+        vm (int): The number of the VM.
+        records (int): The number of records in each frame.
+
+    Returns:
+        list: The fields of each record, as JSON without the opening brace.
+    """
+    bodies = []
+    for record in range(records):
+        fields = {
+            f"cpu{cpu}": round((vm * 7 + record * 3 + cpu) % 100 / 1.7, 1)
+            for cpu in range(4)
+        }
+        fields["analytics.system_memory_tracking.used"] = 2147483648 + vm * 4096
+        fields["analytics.network_io_tracking.ens3"] = {
+            "bytes_sent": vm * 1000 + record,
+            "bytes_recv": vm * 2000 + record,
+        }
+        bodies.append(json.dumps(fields, separators=(",", ":")).encode()[1:])
+    return bodies
+
+
+async def simulate_vm(vm, args, address, udp_socket, deadline):
+    """
+    Send frames from one simulated VM until ``deadline``.
+
+    Arguments:
+        vm (int): The number of the VM.
+        args (argparse.Namespace): The benchmark options.
+        address (str | tuple): The address of the receiver.
+        udp_socket (socket.socket): The shared socket for ``--scheme udp``.
+        deadline (float): When to stop sending, from :py:func:`time.monotonic`.
+
+    Returns:
+        int: The number of frames sent.
+    """
+    prefix = b'{"host":"vm%d","ts":' % vm
+    bodies = make_bodies(vm, args.records)
+    if args.scheme == "unix":
+        _, writer = await asyncio.open_unix_connection(address)
+    elif args.scheme == "tcp":
+        _, writer = await asyncio.open_connection(*address)
+
+    sender = vm
+    sequence = 0
+    # Spread the VMs across the interval
+    await asyncio.sleep(args.interval * vm / args.vms)
+    while time.monotonic() < deadline:
+        now = b"%.6f," % time.time()
+        frame = transport.encode_frame(
+            sender, sequence, 0, [prefix + now + body + b"\n" for body in bodies]
+        )
+        sequence += 1
+        if args.scheme == "udp":
+            udp_socket.sendto(frame, address)
+        else:
+            writer.write(frame)
+            await writer.drain()
+        await asyncio.sleep(args.interval)
+    if args.scheme != "udp":
+        writer.close()
+    return sequence
+
+
+def run_vms(args, address):
+    """
+    Simulate every VM in a separate process.
+
+    Arguments:
+        args (argparse.Namespace): The benchmark options.
+        address (str | tuple): The address of the receiver.
+    """
+
+    async def simulate():
+        udp_socket = None
+        if args.scheme == "udp":
+            udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8 << 20)
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(
+            *(
+                simulate_vm(vm, args, address, udp_socket, deadline)
+                for vm in range(args.vms)
+            )
+        )
+
+    asyncio.run(simulate())
+
+
+async def run_benchmark(args, workdir):
+    """
+    Run the receiver while the simulated VMs send frames to it.
+
+    Arguments:
+        args (argparse.Namespace): The benchmark options.
+        workdir (pathlib.Path): A directory for the Unix socket and segments.
+
+    Returns:
+        dict: The measurements.
+    """
+    store = workdir / "store"
+    receiver = telemetry_receiver.TelemetryReceiver(
+        None if args.no_store else store, codec=args.codec
+    )
+    loop = asyncio.get_running_loop()
+    if args.scheme == "udp":
+        server, _ = await loop.create_datagram_endpoint(
+            lambda: telemetry_receiver.FrameProtocol(receiver),
+            local_addr=("127.0.0.1", 0),
+        )
+        server.get_extra_info("socket").setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20
+        )
+        address = server.get_extra_info("sockname")
+    elif args.scheme == "tcp":
+        server = await asyncio.start_server(receiver.handle_stream, "127.0.0.1", 0)
+        address = server.sockets[0].getsockname()
+    else:
+        address = str(workdir / "receiver.sock")
+        server = await asyncio.start_unix_server(
+            receiver.handle_stream, address, backlog=args.vms
+        )
+    flusher = asyncio.ensure_future(receiver.flush_periodically(5.0))
+
+    process = multiprocessing.Process(target=run_vms, args=(args, address))
+    start = time.perf_counter()
+    process.start()
+    await loop.run_in_executor(None, process.join)
+    # Let the receiver finish the frames which are still queued
+    await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - start - 0.5
+    flusher.cancel()
+    server.close()
+    receiver.flush()
+
+    stats = receiver.stats()
+    stored = sum(path.stat().st_size for path in store.rglob("*.*"))
+    latencies = sorted(receiver.latencies)
+    return {
+        "records_per_sec": round(stats["records"] / elapsed),
+        "frames_per_sec": round(stats["frames"] / elapsed),
+        "latency_ms_p50": round(statistics.median(latencies) * 1000, 2),
+        "latency_ms_p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "records": stats["records"],
+        "senders": stats["senders"],
+        "lost_frames": stats["lost_frames"],
+        "metrics": stats["metrics"],
+        "stored_bytes_per_record": round(stored / max(stats["records"], 1), 1),
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--vms", type=int, default=1000)
+    parser.add_argument("--records", type=int, default=5, help="Records per frame.")
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--scheme", choices=["unix", "tcp", "udp"], default="unix")
+    parser.add_argument(
+        "--no-store", action="store_true", help="Only aggregate in memory."
+    )
+    parser.add_argument("--codec", choices=["raw", "gorilla"], default="raw")
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {
+            "commit": git_commit(),
+            "size": args.vms,
+            "scheme": args.scheme,
+            "interval": args.interval,
+            "codec": args.codec,
+            "python": sys.version.split()[0],
+            "results": {"receiver": asyncio.run(run_benchmark(args, Path(workdir)))},
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
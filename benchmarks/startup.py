@@ -0,0 +1,169 @@
+"""
+Benchmark the startup (compile and import) time of each analytics VM resource.
+
+Each analytics VM resource is started in a fresh interpreter in two ways:
+
+* ``script`` -- As a standalone script, which is compiled on every start and uses
+  ``pythonjsonlogger``. This is how ``Analytics`` runs them by default.
+* ``bundle`` -- From ``analytics.pyz`` (``Analytics(bundle=True)``) after it has been
+  compiled with ``--compile``, using the bundled ``analytics_jsonlog`` formatter.
+
+The module is loaded without running its ``__main__`` block, and the benchmark
+reports the median over ``--runs`` of:
+
+* ``wall_ms`` -- The time for the whole interpreter to start, load the VM resource,
+  and exit.
+* ``import_ms`` -- The total import time reported by ``python -X importtime``.
+
+If :py:mod:`psutil` is not installed, :py:mod:`fake_psutil` is imported in its place
+(``"psutil": "fake"`` in the results)::
+
+    python benchmarks/startup.py --runs 20 --output before.json
+    # ... make changes ...
+    python benchmarks/startup.py --runs 20 --compare before.json
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+from pathlib import Path
+
+from stubs import load_model_components
+from graph_build import compare, git_commit
+
+BENCHMARK_PATH = Path(__file__).resolve().parent
+
+SCRIPT_LOADER = (
+    "import sys; path = sys.argv[1]; source = open(path).read(); "
+    "exec(compile(source, path, 'exec'), {'__name__': 'vm_resource'})"
+)
+BUNDLE_LOADER = (
+    "import sys, importlib; sys.path.insert(0, sys.argv[1]); "
+    "importlib.import_module(sys.argv[2])"
+)
+
+
+def _run(command, env):
+    """Run an interpreter once and measure it.
+
+    Args:
+        command (list): The command to run.
+        env (dict): The environment for the command.
+
+    Returns:
+        tuple: The wall time and the total import time, in milliseconds.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        command, capture_output=True, check=True, env=env, cwd=tempfile.gettempdir()
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    import_us = sum(
+        int(line.split("|")[0].split(":")[1])
+        for line in result.stderr.decode().splitlines()
+        if line.startswith("import time:") and "self [us]" not in line
+    )
+    return wall_ms, import_us / 1000
+
+
+def run_vm_resource(fn, bundle, runs, env):
+    """
+    Start a VM resource ``runs`` times as a script and from the bundle.
+
+    Arguments:
+        fn (str): The filename of the VM resource.
+        bundle (pathlib.Path): The compiled ``analytics.pyz``.
+        runs (int): The number of times to start each variant.
+        env (dict): The environment for the interpreters.
+
+    Returns:
+        dict: The measurements for the VM resource.
+    """
+    script = bundle.parent / fn
+    variants = {
+        "script": [sys.executable, "-X", "importtime", "-c", SCRIPT_LOADER, script],
+        "bundle": [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            BUNDLE_LOADER,
+            bundle,
+            fn[: -len(".py")].replace(".", "_"),
+        ],
+    }
+    results = {}
+    for variant, command in variants.items():
+        samples = [_run([str(arg) for arg in command], env) for _ in range(runs)]
+        results[f"{variant}_wall_ms"] = round(
+            statistics.median(wall for wall, _ in samples), 2
+        )
+        results[f"{variant}_import_ms"] = round(
+            statistics.median(imports for _, imports in samples), 2
+        )
+    return results
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    analytics = load_model_components()["analytics"]
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", "-n", type=int, default=10)
+    parser.add_argument(
+        "--vm-resource",
+        action="append",
+        choices=analytics.BUNDLED_VM_RESOURCES,
+        dest="vm_resources",
+    )
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        bundle = shutil.copy(
+            analytics.build_analytics_bundle(workdir), workdir / "a.pyz"
+        )
+        subprocess.run([sys.executable, bundle, "--compile"], check=True)
+        for fn in analytics.BUNDLED_VM_RESOURCES:
+            shutil.copy(analytics.VM_RESOURCES_DIR / fn, workdir / fn)
+
+        env = {"PATH": "/usr/bin:/bin"}
+        fake_psutil = importlib.util.find_spec("psutil") is None
+        if fake_psutil:
+            (workdir / "fake").mkdir()
+            shutil.copy(
+                BENCHMARK_PATH / "fake_psutil.py", workdir / "fake" / "psutil.py"
+            )
+            env["PYTHONPATH"] = str(workdir / "fake")
+
+        results = {
+            "commit": git_commit(),
+            "size": args.runs,
+            "psutil": "fake" if fake_psutil else "real",
+            "python": sys.version.split()[0],
+            "results": {
+                fn: run_vm_resource(fn, Path(bundle), args.runs, env)
+                for fn in (args.vm_resources or analytics.BUNDLED_VM_RESOURCES)
+            },
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
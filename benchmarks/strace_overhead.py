@@ -0,0 +1,157 @@
+"""
+Benchmark the overhead of each ``Analytics.strace`` option set on a traced process.
+
+A synthetic workload which makes many cheap system calls (opening, reading, and
+closing a file, sending and receiving on a socket pair, and ``getpid``) is run
+untraced and then started under ``strace`` with each option set:
+
+* ``default`` -- ``-ff -tt -s 1024``, the default of ``Analytics.strace``.
+* ``file``, ``network``, ``process`` -- ``syscall_classes=[<class>]``, which traces
+  only that class with ``--seccomp-bpf`` and 64 byte strings.
+* ``summary`` -- ``summary_only=True`` (``-c``).
+* ``summary_network`` -- ``summary_only=True`` and ``syscall_classes=["network"]``.
+
+The benchmark reports the workload's time and its slowdown relative to the untraced
+run, and the bytes of trace output. This requires strace 5.3 or later::
+
+    python benchmarks/strace_overhead.py --iterations 20000 --output before.json
+    # ... make changes ...
+    python benchmarks/strace_overhead.py --iterations 20000 --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from graph_build import compare, git_commit
+
+_LOW_OVERHEAD = "-ff -tt -s 64 --seccomp-bpf -e trace=%{}"
+
+# Name -> the strace options (``None`` to run untraced)
+OPTION_SETS = {
+    "untraced": None,
+    "default": "-ff -tt -s 1024",
+    "file": _LOW_OVERHEAD.format("file"),
+    "network": _LOW_OVERHEAD.format("network"),
+    "process": _LOW_OVERHEAD.format("process"),
+    "summary": "-f -c",
+    "summary_network": "-f -c --seccomp-bpf -e trace=%network",
+}
+
+
+def workload(iterations):
+    """
+    Make ``6 * iterations`` cheap system calls and print the time taken.
+
+    Arguments:
+        iterations (int): The number of iterations.
+    """
+    with tempfile.NamedTemporaryFile() as data:
+        data.write(b"x" * 4096)
+        data.flush()
+        sender, receiver = socket.socketpair()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fd = os.open(data.name, os.O_RDONLY)
+            os.read(fd, 4096)
+            os.close(fd)
+            sender.send(b"ping")
+            receiver.recv(4)
+            os.getpid()
+        print(time.perf_counter() - start)
+
+
+def run_option_set(options, iterations, workdir):
+    """
+    Run the workload, under ``strace`` with ``options`` unless they are ``None``.
+
+    Arguments:
+        options (str): The strace options.
+        iterations (int): The number of iterations of the workload.
+        workdir (pathlib.Path): An empty directory for the trace output.
+
+    Returns:
+        tuple: The workload's time in seconds and the bytes of trace output.
+    """
+    command = [sys.executable, __file__, "--workload", str(iterations)]
+    if options is not None:
+        command = [
+            "strace",
+            *options.split(),
+            "-o",
+            str(workdir / "workload.trace"),
+            "--",
+            *command,
+        ]
+    output = subprocess.run(command, capture_output=True, check=True)  # noqa: S603
+    trace_bytes = sum(path.stat().st_size for path in workdir.iterdir())
+    return float(output.stdout.split()[-1]), trace_bytes
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", "-n", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3, help="Keep the fastest run.")
+    parser.add_argument(
+        "--option-set", action="append", choices=list(OPTION_SETS), dest="option_sets"
+    )
+    parser.add_argument("--workload", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    if args.workload is not None:
+        workload(args.workload)
+        return
+    if shutil.which("strace") is None:
+        parser.error("strace is not installed")
+
+    names = args.option_sets or list(OPTION_SETS)
+    if "untraced" not in names:
+        names.insert(0, "untraced")
+    measurements = {}
+    for name in names:
+        runs = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as workdir:
+                runs.append(
+                    run_option_set(OPTION_SETS[name], args.iterations, Path(workdir))
+                )
+        measurements[name] = min(runs)
+
+    untraced = measurements["untraced"][0]
+    results = {
+        "commit": git_commit(),
+        "size": args.iterations,
+        "python": sys.version.split()[0],
+        "results": {
+            name: {
+                "us_per_iteration": round(seconds * 1e6 / args.iterations, 2),
+                "slowdown": round(seconds / untraced, 2),
+                "trace_bytes": trace_bytes,
+            }
+            for name, (seconds, trace_bytes) in measurements.items()
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Lightweight stand-ins for the FIREWHEEL objects which the model component objects
+in this repository depend on.
+
+These stubs record what would have been scheduled instead of talking to a real
+experiment graph, which allows the model component objects to be exercised
+without a FIREWHEEL installation. Call :py:func:`load_model_components` to
+install the stubs and import the model component objects under the same names
+that FIREWHEEL uses (e.g. ``utilities.python``).
+"""
+
+import sys
+import types
+import importlib.util
+from pathlib import Path
+
+REPO_PATH = Path(__file__).resolve().parent.parent / "src" / "firewheel_repo_utilities"
+
+# Model component name -> directory, in dependency order
+MODEL_COMPONENTS = {
+    "utilities.tools": "tools",
+    "utilities.python": "python_vm",
+    "utilities.nodejs": "nodejs_vm",
+    "analytics": "analytics",
+}
+
+
+class FakeScheduleEntry:
+    """A schedule entry which only records the files and content it references."""
+
+    __slots__ = ("arguments", "content", "files", "program", "time", "vm_resource")
+
+    def __init__(self, time, program, arguments=None, vm_resource=True):
+        """
+        Initialize an entry with no files.
+
+        Arguments:
+            time (int): The time at which the entry runs.
+            program (str): The program to run (if any).
+            arguments (str): The arguments for the program.
+            vm_resource (bool): Whether the program is itself a VM resource.
+        """
+        self.time = time
+        self.program = program
+        self.arguments = arguments
+        self.vm_resource = vm_resource
+        self.files = []
+        self.content = []
+
+    def add_file(self, location, filename, executable=False):  # noqa: ARG002
+        """
+        Record a VM resource file referenced by this entry.
+
+        Arguments:
+            location (str): Where the file is placed on the VM.
+            filename (str): The name of the VM resource.
+            executable (bool): Whether the file should be executable.
+        """
+        self.files.append((location, filename))
+
+    def add_content(self, location, content, executable=False):  # noqa: ARG002
+        """
+        Record content written to a file by this entry.
+
+        Arguments:
+            location (str): Where the content is placed on the VM.
+            content (str): The content of the file.
+            executable (bool): Whether the file should be executable.
+        """
+        self.content.append((location, content))
+
+    def file_references(self):
+        """
+        Count the VM resources which must be transferred for this entry.
+
+        Returns:
+            int: The number of referenced VM resource files.
+        """
+        return len(self.files) + (1 if self.vm_resource else 0)
+
+
+def require_class(required):
+    """
+    Mimic :py:func:`firewheel.control.experiment_graph.require_class`.
+
+    Arguments:
+        required (type): The class which must decorate a vertex first.
+
+    Returns:
+        function: A class decorator recording the requirement.
+    """
+
+    def decorator(cls):
+        cls._required_classes = [required, *cls.__dict__.get("_required_classes", [])]
+        return cls
+
+    return decorator
+
+
+class FakeVertex:
+    """A vertex which supports decorating with model component objects."""
+
+    def __init__(self, name):
+        """
+        Initialize an undecorated vertex.
+
+        Arguments:
+            name (str): The name of the vertex.
+        """
+        self.name = name
+        self.decorators = []
+
+    def decorate(self, cls, init_args=None, init_kwargs=None):
+        """
+        Decorate the vertex with a class (and the classes it requires).
+
+        Arguments:
+            cls (type): The class to decorate the vertex with.
+            init_args (list): Positional arguments for the class's ``__init__``.
+            init_kwargs (dict): Keyword arguments for the class's ``__init__``.
+        """
+        if cls in self.decorators:
+            return
+        for required in cls.__dict__.get("_required_classes", []):
+            self.decorate(required)
+        self.decorators.append(cls)
+        self.__class__ = type(
+            f"{self.__class__.__name__}_{cls.__name__}", (self.__class__, cls), {}
+        )
+        if "__init__" in cls.__dict__:
+            cls.__init__(self, *(init_args or []), **(init_kwargs or {}))
+
+
+class VMEndpoint:
+    """Stand-in for ``base_objects.VMEndpoint`` which records the schedule."""
+
+    def __init__(self):
+        """Initialize the VM with an empty schedule."""
+        self.vm = {"image": "ubuntu-22.04-server.qcow2"}
+        self.schedule = []
+
+    def _schedule(self, time, program, arguments=None, vm_resource=True):
+        entry = FakeScheduleEntry(time, program, arguments, vm_resource)
+        self.schedule.append(entry)
+        return entry
+
+    def run_executable(self, time, program, arguments=None, vm_resource=True):
+        """
+        Schedule a program to run.
+
+        Arguments:
+            time (int): The time at which to run the program.
+            program (str): The program to run.
+            arguments (str): The arguments for the program.
+            vm_resource (bool): Whether the program is itself a VM resource.
+
+        Returns:
+            FakeScheduleEntry: The new schedule entry.
+        """
+        return self._schedule(time, program, arguments, vm_resource)
+
+    def add_vm_resource(self, time, filename, dynamic_arg=None, static_arg=None):
+        """
+        Schedule a VM resource to run.
+
+        Arguments:
+            time (int): The time at which to run the VM resource.
+            filename (str): The VM resource to run.
+            dynamic_arg (str): Content passed to the VM resource.
+            static_arg (str): Another VM resource passed to the VM resource.
+
+        Returns:
+            FakeScheduleEntry: The new schedule entry.
+        """
+        entry = self._schedule(time, filename, dynamic_arg)
+        if static_arg:
+            entry.add_file(static_arg, static_arg)
+        return entry
+
+    def drop_file(self, time, location, filename, executable=False):  # noqa: ARG002
+        """
+        Schedule a VM resource to be placed on the VM.
+
+        Arguments:
+            time (int): The time at which to place the file.
+            location (str): Where the file is placed on the VM.
+            filename (str): The name of the VM resource.
+            executable (bool): Whether the file should be executable.
+
+        Returns:
+            FakeScheduleEntry: The new schedule entry.
+        """
+        entry = self._schedule(time, None, vm_resource=False)
+        entry.add_file(location, filename)
+        return entry
+
+    def drop_content(self, time, location, content, executable=False):  # noqa: ARG002
+        """
+        Schedule content to be written to a file on the VM.
+
+        Arguments:
+            time (int): The time at which to write the file.
+            location (str): Where the content is placed on the VM.
+            content (str): The content of the file.
+            executable (bool): Whether the file should be executable.
+
+        Returns:
+            FakeScheduleEntry: The new schedule entry.
+        """
+        entry = self._schedule(time, None, vm_resource=False)
+        entry.add_content(location, content)
+        return entry
+
+    def install_debs(self, time, debs):
+        """
+        Schedule a tarball of Debian packages to be installed.
+
+        Arguments:
+            time (int): The time at which to install the packages.
+            debs (str): The VM resource containing the packages.
+
+        Returns:
+            FakeScheduleEntry: The new schedule entry.
+        """
+        return self.add_vm_resource(time, "install_debs.py", None, debs)
+
+
+class LinuxHost:
+    """Stand-in for ``linux.base_objects.LinuxHost``."""
+
+    def unpack_tar(
+        self, time, tarfile, options="-xf", directory=None, vm_resource=True
+    ):
+        """
+        Schedule a tarball to be extracted.
+
+        Arguments:
+            time (int): The time at which to extract the tarball.
+            tarfile (str): The tarball to extract.
+            options (str): The options passed to ``tar``.
+            directory (str): The directory into which the tarball is extracted.
+            vm_resource (bool): Whether the tarball is a VM resource.
+
+        Returns:
+            FakeScheduleEntry: The new schedule entry.
+        """
+        entry = self.run_executable(
+            time, "tar", f"{options} {tarfile} -C {directory}", vm_resource=False
+        )
+        if vm_resource:
+            entry.add_file(tarfile, tarfile)
+        return entry
+
+
+class UbuntuHost:
+    """Stand-in for ``linux.ubuntu.UbuntuHost``."""
+
+
+class Ubuntu2204Server:
+    """Stand-in for an Ubuntu 22.04 image decorator."""
+
+
+require_class(VMEndpoint)(LinuxHost)
+require_class(LinuxHost)(UbuntuHost)
+require_class(UbuntuHost)(Ubuntu2204Server)
+
+
+class VmResourceStore:
+    """Stand-in for the FIREWHEEL VM resource store."""
+
+    def add_file(self, path):
+        """
+        Ignore files added to the store.
+
+        Arguments:
+            path (str): The path of the file to add.
+        """
+
+
+def _install_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        if parent not in sys.modules:
+            _install_module(parent)
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def load_model_components():
+    """
+    Install the FIREWHEEL stubs and import every model component object.
+
+    Returns:
+        dict: A mapping of model component name to its imported module.
+    """
+    _install_module("base_objects", VMEndpoint=VMEndpoint)
+    _install_module("linux.base_objects", LinuxHost=LinuxHost)
+    _install_module("linux.ubuntu", UbuntuHost=UbuntuHost)
+    _install_module("firewheel.control.experiment_graph", require_class=require_class)
+    _install_module(
+        "firewheel.vm_resource_manager.vm_resource_store",
+        VmResourceStore=VmResourceStore,
+    )
+
+    modules = {}
+    for name, directory in MODEL_COMPONENTS.items():
+        if name in sys.modules and hasattr(sys.modules[name], "__file__"):
+            modules[name] = sys.modules[name]
+            continue
+        spec = importlib.util.spec_from_file_location(
+            name, REPO_PATH / directory / "model_component_objects.py"
+        )
+        module = importlib.util.module_from_spec(spec)
+        parent, _, child = name.rpartition(".")
+        if parent and parent not in sys.modules:
+            _install_module(parent)
+        sys.modules[name] = module
+        if parent:
+            setattr(sys.modules[parent], child, module)
+        spec.loader.exec_module(module)
+        modules[name] = module
+    return modules
@@ -0,0 +1,184 @@
+"""
+Benchmark the overhead of ``analytics.syscall_profile.py`` on a busy process.
+
+The synthetic workload of ``strace_overhead.py`` (cheap file, socket, and ``getpid``
+system calls) is run alone, then while the profiler runs with each ``--method``:
+
+* ``bpftrace`` -- The calls are aggregated in kernel maps. This requires root and
+  bpftrace; it is skipped if bpftrace is not installed.
+* ``procfs`` -- ``/proc/<pid>/io`` is read for every process each interval.
+
+The benchmark reports the workload's time and its slowdown relative to the run
+without the profiler, and the CPU time used by the profiler (including bpftrace)
+while the workload ran::
+
+    python benchmarks/syscall_profile.py --iterations 20000 --output before.json
+    # ... make changes ...
+    python benchmarks/syscall_profile.py --iterations 20000 --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from collectors import VM_RESOURCES
+from graph_build import compare, git_commit
+
+PROFILER = VM_RESOURCES / "analytics.syscall_profile.py"
+WORKLOAD = Path(__file__).resolve().parent / "strace_overhead.py"
+
+
+def start_profiler(method, workdir):
+    """
+    Start the profiler with ``method``.
+
+    Arguments:
+        method (str): Either ``bpftrace`` or ``procfs``.
+        workdir (pathlib.Path): A directory for the options and records.
+
+    Returns:
+        subprocess.Popen: The profiler's process.
+    """
+    options = workdir / "options"
+    options.write_bytes(
+        pickle.dumps(
+            {
+                "method": method,
+                "interval": 1,
+                "lean": True,
+                "path": str(workdir / "syscall_profile.log"),
+            },
+            protocol=0,
+        )
+    )
+    # Run the profiler in its own process group so that bpftrace is stopped with it
+    process = subprocess.Popen(  # noqa: S603
+        [sys.executable, str(PROFILER), str(options)],
+        stdout=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    # Give bpftrace time to attach its probes
+    time.sleep(5 if method == "bpftrace" else 1)
+    return process
+
+
+def run_workload(iterations):
+    """
+    Run the workload of ``strace_overhead.py``.
+
+    Arguments:
+        iterations (int): The number of iterations of the workload.
+
+    Returns:
+        float: The workload's time in seconds.
+    """
+    output = subprocess.run(  # noqa: S603
+        [sys.executable, str(WORKLOAD), "--workload", str(iterations)],
+        capture_output=True,
+        check=True,
+    )
+    return float(output.stdout.split()[-1])
+
+
+def group_cpu(pgid):
+    """
+    Sum the CPU time of the processes in a process group.
+
+    Arguments:
+        pgid (int): The process group ID.
+
+    Returns:
+        float: The CPU time in seconds.
+    """
+    ticks = 0
+    for pid in os.listdir("/proc"):
+        try:
+            stat = Path(f"/proc/{pid}/stat").read_bytes()
+        except OSError:
+            continue
+        fields = stat[stat.rindex(b")") + 2 :].split()
+        if pid.isdigit() and int(fields[2]) == pgid:
+            ticks += int(fields[11]) + int(fields[12])
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def measure(method, iterations, repeat):
+    """
+    Run the workload, while the profiler runs unless ``method`` is ``None``.
+
+    Arguments:
+        method (str): Either ``bpftrace``, ``procfs``, or ``None``.
+        iterations (int): The number of iterations of the workload.
+        repeat (int): The number of runs of the workload, of which the fastest is kept.
+
+    Returns:
+        tuple: The workload's time in seconds and the profiler's CPU time in seconds.
+    """
+    if method is None:
+        return min(run_workload(iterations) for _ in range(repeat)), 0.0
+    with tempfile.TemporaryDirectory() as workdir:
+        profiler = start_profiler(method, Path(workdir))
+        start_cpu = group_cpu(profiler.pid)
+        seconds = min(run_workload(iterations) for _ in range(repeat))
+        cpu = group_cpu(profiler.pid) - start_cpu
+        os.killpg(profiler.pid, signal.SIGTERM)
+        profiler.wait()
+    return seconds, cpu
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", "-n", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3, help="Keep the fastest run.")
+    parser.add_argument(
+        "--method", action="append", choices=["bpftrace", "procfs"], dest="methods"
+    )
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    methods = args.methods or ["bpftrace", "procfs"]
+    if "bpftrace" in methods and shutil.which("bpftrace") is None:
+        print("bpftrace is not installed, skipping it", file=sys.stderr)
+        methods.remove("bpftrace")
+    measurements = {
+        method: measure(method, args.iterations, args.repeat)
+        for method in [None, *methods]
+    }
+    unprofiled = measurements[None][0]
+    results = {
+        "commit": git_commit(),
+        "size": args.iterations,
+        "python": sys.version.split()[0],
+        "results": {
+            method or "unprofiled": {
+                "us_per_iteration": round(seconds * 1e6 / args.iterations, 2),
+                "slowdown": round(seconds / unprofiled, 2),
+                "profiler_cpu_ms": round(cpu * 1000),
+            }
+            for method, (seconds, cpu) in measurements.items()
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Benchmark ``analytics_transport`` against a local receiver.
+
+The transport which pushes the lean analytics records from a VM to the host is run
+against a receiver on a local Unix or UDP socket (in place of the real host
+endpoint), which decodes every frame. Two scenarios are measured:
+
+* ``throughput`` -- ``--records`` records are written as fast as possible while the
+  receiver is running. The benchmark reports the time to write (buffer) one record,
+  the records delivered per second, and the compression ratio on the wire.
+* ``outage`` -- The records are written while the receiver is down and the buffer
+  only holds half of them, then the receiver is started. The benchmark checks that
+  delivery resumes and that every record is either delivered or counted as dropped.
+
+Results are printed as JSON (tagged with the current git commit)::
+
+    python benchmarks/transport.py --records 100000 --output before.json
+    # ... make changes ...
+    python benchmarks/transport.py --records 100000 --compare before.json
+"""
+
+import io
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+from collectors import load_vm_resource
+from graph_build import compare, git_commit
+
+transport = load_vm_resource("analytics_transport.py")
+records = load_vm_resource("analytics_records.py")
+
+
+class Receiver:
+    """Receive and decode the frames sent by a transport on a local socket."""
+
+    def __init__(self, scheme, address):
+        """Bind the socket and start receiving in a background thread.
+
+        Args:
+            scheme (str): Either ``unix`` or ``udp``.
+            address (str | tuple): The path or ``(host, port)`` to bind.
+        """
+        self.scheme = scheme
+        self.records = 0
+        self.frames = 0
+        self.dropped = 0
+        self.sequences = []
+        if scheme == "udp":
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(address)
+        self.address = self.socket.getsockname()
+        if scheme == "unix":
+            self.socket.listen()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _receive(self, frame):
+        _, sequence, dropped, payload = transport.decode_frame(frame)
+        self.frames += 1
+        self.records += payload.count(b"\n")
+        self.dropped = dropped
+        self.sequences.append(sequence)
+
+    def _run(self):
+        if self.scheme == "udp":
+            while True:
+                try:
+                    self._receive(self.socket.recv(65536))
+                except OSError:
+                    return
+
+        try:
+            connection, _ = self.socket.accept()
+        except OSError:
+            return
+        with connection, connection.makefile("rb") as stream:
+            while True:
+                header = stream.read(transport.HEADER.size)
+                if len(header) < transport.HEADER.size:
+                    return
+                length = transport.HEADER.unpack(header)[-1]
+                self._receive(header + stream.read(length))
+
+    def wait_for(self, count, timeout=30):
+        """Wait until ``count`` records have been received or dropped.
+
+        Args:
+            count (int): The number of records.
+            timeout (float): The longest time to wait, in seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while self.records + self.dropped < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        """Stop receiving."""
+        self.socket.close()
+
+
+def make_records(count):
+    """Create lean records like those of the system memory collector.
+
+    Arguments:
+        count (int): The number of records.
+
+    Returns:
+        list: The records, each a line of JSON.
+    """
+    stream = io.BytesIO()
+    emitter = records.RecordEmitter([stream])
+    for sample in range(count):
+        used = 2147483648 + (sample * 4096) % 268435456
+        emitter.emit(
+            {
+                "analytics.system_memory_tracking.total": 8343789568,
+                "analytics.system_memory_tracking.available": 8343789568 - used,
+                "analytics.system_memory_tracking.percent": round(
+                    used / 8343789568 * 100, 1
+                ),
+                "analytics.system_memory_tracking.used": used,
+            }
+        )
+    return stream.getvalue().splitlines(keepends=True)
+
+
+def throughput(scheme, workdir, lines):
+    """
+    Measure the transport while the receiver is running.
+
+    Arguments:
+        scheme (str): Either ``unix`` or ``udp``.
+        workdir (pathlib.Path): A directory for the Unix socket.
+        lines (list): The records to send.
+
+    Returns:
+        dict: The measurements.
+    """
+    if scheme == "udp":
+        receiver = Receiver(scheme, ("127.0.0.1", 0))
+        url = "udp://{}:{}".format(*receiver.address)
+    else:
+        receiver = Receiver(scheme, str(workdir / "throughput.sock"))
+        url = f"unix://{receiver.address}"
+
+    sender = transport.Transport(url, max_records=len(lines), batch_interval_sec=0.05)
+    start = time.perf_counter()
+    for line in lines:
+        sender.write(line)
+    written = time.perf_counter() - start
+    receiver.wait_for(len(lines))
+    delivered = time.perf_counter() - start
+    stats = sender.stats()
+    sender.close()
+    receiver.close()
+
+    raw_bytes = sum(len(line) for line in lines)
+    return {
+        "us_per_write": round(written * 1e6 / len(lines), 3),
+        "records_per_sec": round(receiver.records / delivered),
+        "records_received": receiver.records,
+        "dropped": stats["dropped"],
+        "frames": receiver.frames,
+        "compression_ratio": round(raw_bytes / max(stats["sent_bytes"], 1), 2),
+    }
+
+
+def outage(workdir, lines):
+    """
+    Measure the transport when the receiver starts after the records are written.
+
+    Arguments:
+        workdir (pathlib.Path): A directory for the Unix socket.
+        lines (list): The records to send.
+
+    Returns:
+        dict: The measurements.
+    """
+    path = workdir / "outage.sock"
+    sender = transport.Transport(
+        f"unix://{path}",
+        max_records=len(lines) // 2,
+        batch_interval_sec=0.05,
+        max_backoff_sec=0.2,
+    )
+    for line in lines:
+        sender.write(line)
+    time.sleep(0.3)
+
+    receiver = Receiver("unix", str(path))
+    start = time.perf_counter()
+    receiver.wait_for(len(lines))
+    resumed = time.perf_counter() - start
+    stats = sender.stats()
+    sender.close()
+    receiver.close()
+    return {
+        "resume_ms": round(resumed * 1000, 1),
+        "records_received": receiver.records,
+        "dropped": receiver.dropped,
+        "all_accounted_for": receiver.records + receiver.dropped == len(lines),
+        "in_order": receiver.sequences == sorted(receiver.sequences),
+        "connections": stats["connections"],
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", "-n", type=int, default=100000)
+    parser.add_argument("--scheme", choices=["unix", "udp"], default="unix")
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument("--compare", type=Path, help="A saved baseline to compare to.")
+    args = parser.parse_args(argv)
+
+    lines = make_records(args.records)
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        results = {
+            "commit": git_commit(),
+            "size": args.records,
+            "scheme": args.scheme,
+            "python": sys.version.split()[0],
+            "results": {
+                "throughput": throughput(args.scheme, workdir, lines),
+                "outage": outage(workdir, lines),
+            },
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
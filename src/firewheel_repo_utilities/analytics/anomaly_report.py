@@ -0,0 +1,600 @@
+"""
+Compare the metrics of every VM in a ``telemetry_receiver.py`` store and rank the outliers.
+
+Point the report at the ``--store`` of the receiver after (or during) an experiment::
+
+    python anomaly_report.py /scratch/analytics --metric "iowait.*" --top 20
+
+The segments of each metric (``<store>/<host>/<metric>.<n>.seg`` or ``.gor``) are
+loaded into a :py:mod:`numpy` array with a row per VM and a column per
+``--resolution`` seconds (by default, the interval of the collector, from the
+timestamps which the collector recorded). Samples are placed by those timestamps,
+so the VMs are aligned even though their collectors started at different times.
+The cumulative counters of the disk and network IO collectors are converted to rates
+first.
+
+The VMs are loaded in chunks which fit in ``--memory-mb``, and for each VM the
+``mean``, ``p95``, ``max``, and standard deviation of each metric are computed,
+along with its most likely change point: the time at which splitting the series into
+two means explains the most of it (from the cumulative sum of its deviations). Only
+these summaries are kept, so even 10,000 VMs sampled every second for a day are
+analyzed within the memory budget (in 26 chunks with the default 1024 MiB).
+
+Each VM is then compared to its peers: the VMs of the same role (from ``--roles``, a
+JSON file mapping each host to its role, or else the hostname without a trailing
+number, e.g. ``web`` for ``web-12``). Each summary gets a robust z-score (the
+modified z-score, from the median and median absolute deviation of the peers), so a
+single VM whose ``iowait`` is ten times that of its peers stands out without
+skewing what counts as normal. Roles with fewer than ``--min-peers`` VMs are compared
+to every VM. The report ranks the summaries whose z-score exceeds ``--threshold``
+and the change points which shift the mean by more than ``--shift`` times the
+standard deviation which remains, and ``--output`` saves it, with the summaries of each role, as JSON.
+"""
+
+import re
+import sys
+import json
+import struct
+import fnmatch
+import argparse
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+# The segments are defined by the receiver
+_spec = importlib.util.spec_from_file_location(
+    "telemetry_receiver", Path(__file__).resolve().parent / "telemetry_receiver.py"
+)
+telemetry_receiver = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(telemetry_receiver)
+CODECS = telemetry_receiver.CODECS
+read_segment = telemetry_receiver.read_segment
+
+# The memory for each cell of a chunk (one VM at one time): the ``float32`` cell,
+# the temporary arrays of ``summarize()`` (about 20 bytes), and the samples read
+BYTES_PER_CELL = 32
+
+# A ``(timestamp, value)`` sample of a raw segment
+SAMPLE = struct.Struct("<dd")
+
+# The metrics which are cumulative counters, and so are compared as rates
+COUNTER_PREFIXES = ("analytics.disk_io_tracking.", "analytics.network_io_tracking.")
+
+# The summaries which are compared across VMs
+STATISTICS = ["mean", "p95", "max"]
+
+# The trailing number which is removed from a hostname to get its role
+ROLE_SUFFIX = re.compile(r"[-_.]?\d+$")
+
+# Scales the median absolute deviation to the standard deviation of a normal
+# distribution, as in the modified z-score of Iglewicz and Hoaglin
+MAD_SCALE = 0.6745
+
+# Scales the mean absolute deviation instead, when more than half of the peers have
+# the same value
+MEAN_AD_SCALE = 0.7979
+
+
+def find_series(store, patterns=None):
+    """
+    Find the segments of each metric of each VM in a store.
+
+    Arguments:
+        store (pathlib.Path): The ``--store`` directory of the receiver.
+        patterns (list): :py:mod:`fnmatch` patterns of the metrics to find.
+            Defaults to every metric.
+
+    Returns:
+        dict: The segments, in order, keyed by metric and then by host.
+    """
+    suffixes = {f".{suffix}" for suffix in CODECS.values()}
+    series = {}
+    for directory in sorted(path for path in Path(store).iterdir() if path.is_dir()):
+        for segment in directory.iterdir():
+            if segment.suffix not in suffixes:
+                continue
+            metric, index, _suffix = segment.name.rsplit(".", 2)
+            if patterns and not any(
+                fnmatch.fnmatchcase(metric, pattern) for pattern in patterns
+            ):
+                continue
+            series.setdefault(metric, {}).setdefault(directory.name, []).append(
+                (int(index), segment)
+            )
+    return {
+        metric: {
+            host: [path for _index, path in sorted(paths)]
+            for host, paths in hosts.items()
+        }
+        for metric, hosts in sorted(series.items())
+    }
+
+
+def load_samples(paths, counter=False):
+    """
+    Read the samples of one metric of one VM.
+
+    Arguments:
+        paths (list): The segments of the metric, in order.
+        counter (bool): Whether the metric is a cumulative counter, which is
+            converted to its rate per second (a counter which decreases was reset, so
+            that rate is left out).
+
+    Returns:
+        tuple: The timestamps and the values, as ``float64`` arrays.
+    """
+    blocks = []
+    for path in paths:
+        if path.suffix == f".{CODECS['gorilla']}":
+            blocks.append(np.array(read_segment(path), dtype=np.float64).reshape(-1, 2))
+        else:
+            blocks.append(np.fromfile(path, dtype="<f8").reshape(-1, 2))
+    samples = np.concatenate(blocks) if blocks else np.empty((0, 2))
+    timestamps, values = samples[:, 0], samples[:, 1]
+    if counter:
+        elapsed = np.diff(timestamps)
+        rates = np.diff(values)
+        valid = (elapsed > 0) & (rates >= 0)
+        timestamps = timestamps[1:][valid]
+        values = rates[valid] / elapsed[valid]
+    return timestamps, values
+
+
+def time_range(paths):
+    """
+    Find the first and last timestamps of one metric of one VM.
+
+    Only the first and last samples of a raw segment are read, but a ``gorilla``
+    segment is read in full.
+
+    Arguments:
+        paths (list): The segments of the metric, in order.
+
+    Returns:
+        tuple: The first and last timestamps, or ``None`` if there are no samples.
+    """
+    first = last = None
+    for path in (paths[0], paths[-1]):
+        if path.suffix == f".{CODECS['gorilla']}":
+            samples = read_segment(path)
+            if samples:
+                first = samples[0][0] if first is None else first
+                last = samples[-1][0]
+            continue
+        size = path.stat().st_size
+        if size < SAMPLE.size:
+            continue
+        with path.open("rb") as segment:
+            if first is None:
+                first = SAMPLE.unpack(segment.read(SAMPLE.size))[0]
+            segment.seek(size - size % SAMPLE.size - SAMPLE.size)
+            last = SAMPLE.unpack(segment.read(SAMPLE.size))[0]
+    return None if first is None else (first, last)
+
+
+def align(series, start, resolution, bins):
+    """
+    Place the samples of several VMs on a common grid.
+
+    Arguments:
+        series (list): The ``(timestamps, values)`` of each VM.
+        start (float): The time of the first column, in seconds since the epoch.
+        resolution (float): The seconds covered by each column.
+        bins (int): The number of columns.
+
+    Returns:
+        numpy.ndarray: A ``float32`` array with a row per VM, whose columns without
+        a sample are ``NaN`` (and of several samples, the last is kept).
+    """
+    matrix = np.full((len(series), bins), np.nan, dtype=np.float32)
+    for row, (timestamps, values) in enumerate(series):
+        columns = ((timestamps - start) / resolution).astype(np.int64)
+        valid = (columns >= 0) & (columns < bins)
+        matrix[row, columns[valid]] = values[valid]
+    return matrix
+
+
+def summarize(matrix):
+    """
+    Summarize each row of an aligned chunk.
+
+    The change point is the column before which the row's mean differs most from
+    the mean after it, as found by the maximum of the cumulative sum of the row's
+    deviations from its mean (the missing columns are treated as the mean). Its
+    ``change_score`` is that difference divided by the standard deviation which
+    remains once the change is removed.
+
+    Arguments:
+        matrix (numpy.ndarray): The aligned chunk, whose rows each have a sample.
+
+    Returns:
+        dict: The ``count``, ``mean``, ``std``, ``p95``, ``max``, ``change_index``
+        (the first column after the change), ``before``, ``after``, and
+        ``change_score`` of each row, as arrays.
+    """
+    rows, bins = matrix.shape
+    summary = {
+        "p95": np.nanpercentile(matrix, 95, axis=1),
+        "max": np.nanmax(matrix, axis=1).astype(np.float64),
+    }
+    valid = ~np.isnan(matrix)
+    count = np.count_nonzero(valid, axis=1)
+    mean = np.nansum(matrix, axis=1, dtype=np.float64) / count
+    centered = np.subtract(matrix, mean[:, None], dtype=np.float32)
+    centered[~valid] = 0
+    del valid
+    squares = np.square(centered).sum(axis=1, dtype=np.float64)
+    variance = squares / count
+
+    # S_k is the sum of the first k deviations, and the means before and after k
+    # differ by -S_k * n / (k * (n - k))
+    deviations = np.cumsum(centered, axis=1, dtype=np.float64)[:, :-1]
+    del centered
+    highest = deviations.argmax(axis=1)
+    lowest = deviations.argmin(axis=1)
+    rows_index = np.arange(rows)
+    index = np.where(
+        np.abs(deviations[rows_index, highest])
+        >= np.abs(deviations[rows_index, lowest]),
+        highest,
+        lowest,
+    )
+    cusum = deviations[rows_index, index]
+    del deviations
+    before_count = index + 1
+    after_count = bins - before_count
+    shift = -cusum * bins / (before_count * after_count)
+    # Of the variance of the n columns, the change explains shift^2 * k * (n - k) / n^2
+    explained = shift**2 * before_count * after_count / bins**2
+    residual = np.maximum(squares / bins - explained, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(shift == 0, 0.0, np.abs(shift) / np.sqrt(residual))
+    summary.update(
+        {
+            "count": count,
+            "mean": mean,
+            "std": np.sqrt(variance),
+            "change_index": before_count,
+            "before": mean + cusum / before_count,
+            "after": mean - cusum / after_count,
+            "change_score": score,
+        }
+    )
+    return summary
+
+
+def analyze_metric(
+    metric, hosts, start=None, end=None, resolution=None, memory_mb=1024
+):
+    """
+    Summarize one metric of every VM, loading as many VMs at a time as fit in memory.
+
+    Arguments:
+        metric (str): The name of the metric.
+        hosts (dict): The segments of the metric of each host, from
+            :py:func:`find_series`.
+        start (float): The start of the analysis, in seconds since the epoch.
+            Defaults to the first sample of the VMs which overlap most of the
+            others (so that a VM with a wrong clock does not stretch the analysis).
+        end (float): The end of the analysis. Defaults to the last sample of those
+            VMs.
+        resolution (float): The seconds covered by each column. Defaults to the
+            median interval between the samples of the first VM.
+        memory_mb (int): The memory for each chunk of VMs, in MiB.
+
+    Returns:
+        dict: The ``hosts`` which have samples in the analysis, the ``start``,
+        ``resolution``, and number of ``bins``, and the ``summary`` of each host
+        from :py:func:`summarize`. ``None`` if no VM has a sample.
+
+    Raises:
+        ValueError: If not even one VM's columns fit in ``memory_mb``.
+    """
+    counter = metric.startswith(COUNTER_PREFIXES)
+    ranges = [time_range(paths) for paths in hosts.values()]
+    ranges = [span for span in ranges if span is not None]
+    if not ranges:
+        return None
+    median_first, median_last = np.median(ranges, axis=0)
+    if start is None:
+        start = min(first for first, last in ranges if last >= median_first)
+    if end is None:
+        end = max(last for first, last in ranges if first <= median_last)
+    if resolution is None:
+        for paths in hosts.values():
+            timestamps, _values = load_samples(paths, counter)
+            if len(timestamps) > 1:
+                resolution = float(np.median(np.diff(timestamps)))
+                break
+        # Round to milliseconds (the precision of the gorilla timestamps)
+        resolution = max(round(resolution or 1.0, 3), 0.001)
+    bins = max(int((end - start) / resolution) + 1, 2)
+    chunk_size = (memory_mb << 20) // (bins * BYTES_PER_CELL)
+    if not chunk_size:
+        raise ValueError(
+            f"The {bins} columns of {metric} do not fit in {memory_mb} MiB, use a "
+            "shorter range or a coarser resolution"
+        )
+
+    names = list(hosts)
+    kept = []
+    chunks = []
+    for offset in range(0, len(names), chunk_size):
+        chunk = names[offset : offset + chunk_size]
+        matrix = align(
+            [load_samples(hosts[host], counter) for host in chunk],
+            start,
+            resolution,
+            bins,
+        )
+        has_samples = ~np.isnan(matrix).all(axis=1)
+        if not has_samples.all():
+            matrix = matrix[has_samples]
+        if not len(matrix):
+            continue
+        kept += [host for host, keep in zip(chunk, has_samples) if keep]
+        chunks.append(summarize(matrix))
+        del matrix
+    if not chunks:
+        return None
+    return {
+        "hosts": kept,
+        "start": start,
+        "resolution": resolution,
+        "bins": bins,
+        "summary": {
+            name: np.concatenate([chunk[name] for chunk in chunks])
+            for name in chunks[0]
+        },
+    }
+
+
+def peer_scores(values, roles, min_peers=5):
+    """
+    Compare each VM's value to those of its peers.
+
+    Arguments:
+        values (numpy.ndarray): The value of each VM.
+        roles (numpy.ndarray): The role of each VM.
+        min_peers (int): The fewest VMs in a role for them to be compared to each
+            other rather than to every VM.
+
+    Returns:
+        tuple: The median of each VM's peers, the ratio of its value to that
+        median (``NaN`` if the median is ``0``), and its modified z-score.
+    """
+    medians = np.empty_like(values)
+    scales = np.empty_like(values)
+    _roles, role_index, role_sizes = np.unique(
+        roles, return_inverse=True, return_counts=True
+    )
+    # (The VMs, their peers) of each role, and the small roles are compared to all
+    groups = [
+        (role_index == role, values[role_index == role])
+        for role in np.flatnonzero(role_sizes >= min_peers)
+    ]
+    small = role_sizes[role_index] < min_peers
+    if small.any():
+        groups.append((small, values))
+    for group, peers in groups:
+        median = np.median(peers)
+        deviation = np.abs(peers - median)
+        mad = np.median(deviation)
+        scale = mad / MAD_SCALE if mad else deviation.mean() / MEAN_AD_SCALE
+        medians[group] = median
+        scales[group] = scale
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where(medians != 0, values / medians, np.nan)
+        scores = np.where(scales > 0, (values - medians) / scales, 0.0)
+    return medians, ratios, scores
+
+
+def default_role(host):
+    """
+    Get the role of a host from its name.
+
+    Arguments:
+        host (str): The hostname.
+
+    Returns:
+        str: The hostname without a trailing number, e.g. ``web`` for ``web-12``.
+    """
+    return ROLE_SUFFIX.sub("", host) or host
+
+
+def _number(value):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else round(value, 6)
+
+
+def build_report(
+    store,
+    patterns=None,
+    roles=None,
+    start=None,
+    end=None,
+    resolution=None,
+    memory_mb=1024,
+    threshold=3.5,
+    shift=3.0,
+    min_peers=5,
+    per_vm=False,
+):
+    """
+    Analyze every metric in a store and rank the outliers and change points.
+
+    Arguments:
+        store (pathlib.Path): The ``--store`` directory of the receiver.
+        patterns (list): :py:mod:`fnmatch` patterns of the metrics to analyze.
+            Defaults to every metric.
+        roles (dict): The role of each host. Defaults to :py:func:`default_role`.
+        start (float): The start of the analysis, in seconds since the epoch.
+        end (float): The end of the analysis, in seconds since the epoch.
+        resolution (float): The seconds covered by each column. Defaults to the
+            interval of each metric.
+        memory_mb (int): The memory for each chunk of VMs, in MiB.
+        threshold (float): The smallest modified z-score which is an outlier.
+        shift (float): The smallest ``change_score`` which is a change point.
+        min_peers (int): The fewest VMs in a role for them to be compared to each
+            other.
+        per_vm (bool): Include the summaries of every VM in the report.
+
+    Returns:
+        dict: The report, with the analyzed ``metrics``, the summaries of each of
+        the ``roles``, and the ``outliers`` and ``change_points`` ranked from the
+        highest score.
+    """
+    roles = roles or {}
+    report = {"store": str(store), "metrics": {}, "roles": {}, "outliers": []}
+    report["change_points"] = []
+    if per_vm:
+        report["vms"] = {}
+    for metric, hosts in find_series(store, patterns).items():
+        analysis = analyze_metric(metric, hosts, start, end, resolution, memory_mb)
+        if analysis is None:
+            continue
+        names = analysis["hosts"]
+        summary = analysis["summary"]
+        host_roles = np.array([roles.get(host) or default_role(host) for host in names])
+        report["metrics"][metric] = {
+            "vms": len(names),
+            "start": analysis["start"],
+            "resolution": analysis["resolution"],
+            "bins": analysis["bins"],
+        }
+
+        for role in np.unique(host_roles):
+            members = host_roles == role
+            report["roles"].setdefault(str(role), {})[metric] = {
+                "vms": int(members.sum()),
+                "mean": _number(np.median(summary["mean"][members])),
+                "p95": _number(np.median(summary["p95"][members])),
+                "max": _number(summary["max"][members].max()),
+            }
+
+        for statistic in STATISTICS:
+            values = summary[statistic]
+            medians, ratios, scores = peer_scores(values, host_roles, min_peers)
+            for row in np.flatnonzero(np.abs(scores) >= threshold):
+                report["outliers"].append(
+                    {
+                        "host": names[row],
+                        "role": str(host_roles[row]),
+                        "metric": metric,
+                        "statistic": statistic,
+                        "value": _number(values[row]),
+                        "peer_median": _number(medians[row]),
+                        "ratio": _number(ratios[row]),
+                        "z": _number(scores[row]),
+                    }
+                )
+
+        for row in np.flatnonzero(summary["change_score"] >= shift):
+            report["change_points"].append(
+                {
+                    "host": names[row],
+                    "role": str(host_roles[row]),
+                    "metric": metric,
+                    "time": _number(
+                        analysis["start"]
+                        + summary["change_index"][row] * analysis["resolution"]
+                    ),
+                    "before": _number(summary["before"][row]),
+                    "after": _number(summary["after"][row]),
+                    "score": _number(summary["change_score"][row]),
+                }
+            )
+
+        if per_vm:
+            for row, host in enumerate(names):
+                report["vms"].setdefault(host, {})[metric] = {
+                    name: _number(summary[name][row])
+                    for name in ("count", "mean", "std", "p95", "max")
+                }
+
+    report["outliers"].sort(key=lambda outlier: -abs(outlier["z"] or 0))
+    report["change_points"].sort(key=lambda change: -(change["score"] or float("inf")))
+    return report
+
+
+def print_report(report, top=30, stream=sys.stdout):
+    """
+    Print the highest ranked outliers and change points of a report.
+
+    Arguments:
+        report (dict): The report from :py:func:`build_report`.
+        top (int): The number of outliers and of change points to print.
+        stream (file): Where to write the report.
+    """
+    vms = max((metric["vms"] for metric in report["metrics"].values()), default=0)
+    stream.write(
+        f"{len(report['metrics'])} metric(s) of up to {vms} VM(s) in "
+        f"{len(report['roles'])} role(s)\n\n"
+    )
+    stream.write(f"Outliers ({len(report['outliers'])}):\n")
+    for outlier in report["outliers"][:top]:
+        ratio = outlier["ratio"]
+        stream.write(
+            f"  z={outlier['z']:>9.1f}  {outlier['host']} ({outlier['role']})  "
+            f"{outlier['metric']} {outlier['statistic']}={outlier['value']:.4g} "
+            f"vs {outlier['peer_median']:.4g}"
+            + (f" ({ratio:.1f}x)" if ratio is not None else "")
+            + "\n"
+        )
+    stream.write(f"\nChange points ({len(report['change_points'])}):\n")
+    for change in report["change_points"][:top]:
+        score = change["score"]
+        stream.write(
+            f"  score={score if score is not None else float('inf'):>7.1f}  "
+            f"{change['host']} ({change['role']})  {change['metric']} "
+            f"{change['before']:.4g} -> {change['after']:.4g} at {change['time']:.0f}\n"
+        )
+
+
+def main(argv=None):
+    """
+    Build a report from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("store", type=Path, help="The receiver's --store directory.")
+    parser.add_argument(
+        "--metric", action="append", dest="patterns", help="Metrics to analyze."
+    )
+    parser.add_argument("--roles", type=Path, help="A JSON file of host -> role.")
+    parser.add_argument("--start", type=float, help="Seconds since the epoch.")
+    parser.add_argument("--end", type=float, help="Seconds since the epoch.")
+    parser.add_argument("--resolution", type=float, help="Seconds per column.")
+    parser.add_argument("--memory-mb", type=int, default=1024)
+    parser.add_argument("--threshold", type=float, default=3.5)
+    parser.add_argument("--shift", type=float, default=3.0)
+    parser.add_argument("--min-peers", type=int, default=5)
+    parser.add_argument("--top", type=int, default=30)
+    parser.add_argument("--per-vm", action="store_true", help="Save every summary.")
+    parser.add_argument("--output", type=Path, help="Save the report as JSON.")
+    args = parser.parse_args(argv)
+
+    roles = json.loads(args.roles.read_text(encoding="utf-8")) if args.roles else None
+    report = build_report(
+        args.store,
+        args.patterns,
+        roles,
+        args.start,
+        args.end,
+        args.resolution,
+        args.memory_mb,
+        args.threshold,
+        args.shift,
+        args.min_peers,
+        args.per_vm,
+    )
+    print_report(report, args.top)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Merge the profiles written by the ``analytics.profile.py`` VM resource into one report.
+
+Copy ``/opt/analytics/profiles`` off of each VM (e.g. into one directory per VM) and
+run::
+
+    python merge_profiles.py <directory or file> [...] [--sort cumulative] [--top 30]
+
+The ``cProfile`` profiles (``<name>.<pid>.pstats``) and allocation sites
+(``<name>.<pid>.tracemalloc.json``) of each analytics VM resource ``<name>`` are
+combined across all VMs and processes, so the report shows where a collector spends
+its time and memory over the whole experiment.
+"""
+
+import sys
+import json
+import pstats
+import argparse
+from pathlib import Path
+from collections import defaultdict
+
+
+def find_profiles(paths):
+    """
+    Group the profile files found in ``paths`` by VM resource.
+
+    Arguments:
+        paths (list): Profile files and/or directories to search recursively.
+
+    Returns:
+        tuple: Two dictionaries (``cProfile`` files and ``tracemalloc`` files) which
+        map the name of each VM resource to a list of profile paths.
+    """
+    cpu_profiles = defaultdict(list)
+    memory_profiles = defaultdict(list)
+    for path in map(Path, paths):
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for profile in files:
+            if profile.name.endswith(".pstats"):
+                cpu_profiles[profile.name.rsplit(".", 2)[0]].append(profile)
+            elif profile.name.endswith(".tracemalloc.json"):
+                memory_profiles[profile.name.rsplit(".", 3)[0]].append(profile)
+    return cpu_profiles, memory_profiles
+
+
+def merge_allocations(profiles):
+    """
+    Sum the allocation sites from several ``tracemalloc`` reports.
+
+    Arguments:
+        profiles (list): Paths to ``.tracemalloc.json`` files.
+
+    Returns:
+        dict: The total ``traced_current`` and ``traced_peak`` and the merged ``sites``
+        sorted by size.
+    """
+    sites = defaultdict(lambda: {"size": 0, "count": 0})
+    merged = {"traced_current": 0, "traced_peak": 0}
+    for profile in profiles:
+        report = json.loads(profile.read_text(encoding="utf-8"))
+        merged["traced_current"] += report["traced_current"]
+        merged["traced_peak"] += report["traced_peak"]
+        for site in report["sites"]:
+            totals = sites[site["file"], site["line"]]
+            totals["size"] += site["size"]
+            totals["count"] += site["count"]
+    merged["sites"] = sorted(
+        (
+            {"file": file, "line": line, **totals}
+            for (file, line), totals in sites.items()
+        ),
+        key=lambda site: site["size"],
+        reverse=True,
+    )
+    return merged
+
+
+def report(paths, sort="cumulative", top=30, stream=sys.stdout):
+    """
+    Print a merged report for every VM resource found in ``paths``.
+
+    Arguments:
+        paths (list): Profile files and/or directories to search recursively.
+        sort (str): The :py:class:`pstats.Stats` sort key for the ``cProfile`` report.
+        top (int): The number of functions and allocation sites to print.
+        stream (file): Where to write the report.
+    """
+    cpu_profiles, memory_profiles = find_profiles(paths)
+    for name in sorted(set(cpu_profiles) | set(memory_profiles)):
+        stream.write(f"{'=' * 79}\n{name}\n{'=' * 79}\n")
+        if name in cpu_profiles:
+            stream.write(f"cProfile: {len(cpu_profiles[name])} profile(s)\n")
+            stats = pstats.Stats(*map(str, cpu_profiles[name]), stream=stream)
+            stats.strip_dirs().sort_stats(sort).print_stats(top)
+        if name in memory_profiles:
+            merged = merge_allocations(memory_profiles[name])
+            stream.write(
+                f"tracemalloc: {len(memory_profiles[name])} profile(s), "
+                f"{merged['traced_current'] / 1024:.1f} KiB traced, "
+                f"{merged['traced_peak'] / 1024:.1f} KiB peak\n"
+            )
+            for site in merged["sites"][:top]:
+                stream.write(
+                    f"  {site['size'] / 1024:>10.1f} KiB {site['count']:>8} blocks  "
+                    f"{site['file']}:{site['line']}\n"
+                )
+        stream.write("\n")
+
+
+def main(argv=None):
+    """
+    Merge profiles from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+", help="Profile files or directories.")
+    parser.add_argument("--sort", default="cumulative")
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args(argv)
+    report(args.paths, args.sort, args.top)
+
+
+if __name__ == "__main__":
+    main()
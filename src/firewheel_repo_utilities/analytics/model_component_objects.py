@@ -1,10 +1,131 @@
+import re
 import pickle
+import hashlib
+import zipfile
+import tempfile
+from pathlib import Path
 
 from base_objects import VMEndpoint
 from utilities.tools import Utilities
 from utilities.python import PythonVM
 
 from firewheel.control.experiment_graph import require_class
+from firewheel.vm_resource_manager.vm_resource_store import VmResourceStore
+
+VM_RESOURCES_DIR = Path(__file__).resolve().parent / "vm_resources"
+
+# The VM resources which are packaged into ``analytics.pyz``
+BUNDLED_VM_RESOURCES = [
+    "analytics.port_tracking.py",
+    "analytics.pressure_tracking.py",
+    "analytics.process_lifecycle.py",
+    "analytics.strace.py",
+    "analytics.syscall_profile.py",
+    "kill_analytics.py",
+    "psutil.cpu_tracking.py",
+    "psutil.disk_io_tracking.py",
+    "psutil.disk_usage_tracking.py",
+    "psutil.network_io_tracking.py",
+    "psutil.system_memory_tracking.py",
+]
+
+# The libraries with which the ``psutil`` collectors can read the statistics
+COLLECTOR_BACKENDS = ["psutil", "procfs"]
+
+# The URL schemes to which ``analytics_transport`` can send the collectors' records
+TRANSPORT_SCHEMES = ["udp", "unix", "virtio"]
+
+# The strace syscall classes (``-e trace=%<class>``) which ``Analytics.strace`` accepts
+STRACE_SYSCALL_CLASSES = [
+    "file",
+    "process",
+    "network",
+    "signal",
+    "ipc",
+    "desc",
+    "memory",
+    "creds",
+]
+
+# How ``analytics.process_lifecycle.py`` receives the process events
+LIFECYCLE_METHODS = ["auto", "netlink", "proc"]
+
+# How ``analytics.syscall_profile.py`` counts the system calls of each process
+SYSCALL_PROFILE_METHODS = ["auto", "bpftrace", "procfs"]
+
+# The resources whose pressure stall information ``analytics.pressure_tracking.py`` reads
+PSI_RESOURCES = ["cpu", "memory", "io"]
+
+# A PSI trigger, ``<some|full> <stall threshold us> <window us>``
+PSI_TRIGGER = re.compile(r"^(some|full) (\d+) (\d+)$")
+
+ANALYTICS_BUNDLE = "/opt/analytics/analytics.pyz"
+
+# The directory which ``analytics.strace.py --shared`` reads the strace requests from
+STRACE_REQUESTS_DIR = "/opt/analytics/strace_requests"
+
+# The cgroup v2 slice in which the analytics processes run with a ``resource_budget``
+ANALYTICS_CGROUP = "/sys/fs/cgroup/analytics.slice"
+
+# The limits of a ``resource_budget``, passed to ``analytics_cgroup.py create``
+RESOURCE_BUDGET_LIMITS = ["cpu", "memory", "io_weight"]
+
+# The period of the slice's ``cpu.max`` (``analytics_cgroup.CPU_PERIOD_USEC``), and
+# the smallest quota within it which the kernel accepts, in microseconds
+CPU_PERIOD_USEC = 100000
+MIN_CPU_QUOTA_USEC = 1000
+
+
+def build_analytics_bundle(cache_dir=None):
+    """
+    Package the analytics VM resources into a single ``analytics.pyz`` zipapp.
+
+    The bundle contains ``analytics_main.py`` (as ``__main__.py``), the
+    ``analytics_jsonlog`` formatter, the ``analytics_records`` emitter, the
+    ``analytics_procfs`` backend, the ``analytics_transport`` sender, the
+    ``analytics_cgroup`` helper, and each of
+    :py:data:`BUNDLED_VM_RESOURCES` renamed to an importable module. It is only rebuilt when one of these files changes.
+
+    Arguments:
+        cache_dir (str): Where to store the bundle. Defaults to a directory in the
+            system's temporary directory.
+
+    Returns:
+        pathlib.Path: The path to the bundle, named ``analytics-<hash>.pyz``.
+    """
+    members = {
+        "__main__.py": "analytics_main.py",
+        "analytics_jsonlog.py": None,
+        "analytics_records.py": None,
+        "analytics_procfs.py": None,
+        "analytics_transport.py": None,
+        "analytics_cgroup.py": None,
+    }
+    members.update(
+        {fn[: -len(".py")].replace(".", "_") + ".py": fn for fn in BUNDLED_VM_RESOURCES}
+    )
+    sources = {
+        member: (VM_RESOURCES_DIR / (fn or member)).read_bytes()
+        for member, fn in members.items()
+    }
+
+    digest = hashlib.sha256()
+    for member, source in sources.items():
+        digest.update(member.encode() + b"\0" + source + b"\0")
+    if cache_dir is None:
+        cache_dir = Path(tempfile.gettempdir()) / "firewheel_analytics"
+    bundle = Path(cache_dir) / f"analytics-{digest.hexdigest()[:16]}.pyz"
+    if bundle.exists():
+        return bundle
+
+    bundle.parent.mkdir(parents=True, exist_ok=True)
+    partial = bundle.with_suffix(".tmp")
+    with zipfile.ZipFile(partial, "w", zipfile.ZIP_DEFLATED) as archive:
+        for member, source in sources.items():
+            # A fixed timestamp keeps the bundle identical across builds
+            archive.writestr(zipfile.ZipInfo(member, (1980, 1, 1, 0, 0, 0)), source)
+    partial.replace(bundle)
+    return bundle
 
 
 # pylint: disable=protected-access
@@ -131,14 +252,118 @@ class Analytics:
     All other analytic functions must be called individually.
     """
 
-    def __init__(self, python_version="python3.10"):
+    _profile_modes = {"cpu", "memory"}
+
+    # The name of ``analytics.pyz`` in the VM resource store, built once per process
+    _bundle_name = None
+
+    def __init__(
+        self,
+        python_version="python3.10",
+        profile=None,
+        profile_interval_sec=300,
+        bundle=False,
+        lean_records=False,
+        collector_backend="psutil",
+        transport=None,
+        shared_strace=False,
+        resource_budget=None,
+    ):
         """
         Install/configure a few VMRs which are required by all analytic methods.
 
         Arguments:
             python_version (str): The version of python that will be used for analytics
+            profile (str): Run each analytics VM resource under ``analytics.profile.py``.
+                Either ``"cpu"`` (`cProfile <https://docs.python.org/3/library/profile.html>`_),
+                ``"memory"`` (`tracemalloc <https://docs.python.org/3/library/tracemalloc.html>`_),
+                or ``"cpu,memory"``. Profiles are written to ``/opt/analytics/profiles`` on
+                the VM. Defaults to ``None`` (no profiling).
+            profile_interval_sec (int): How often the profiles are rewritten while the
+                VM resources run. Defaults to ``300``.
+            bundle (bool): Run the analytics VM resources from a single
+                ``/opt/analytics/analytics.pyz`` (see :py:func:`build_analytics_bundle`),
+                which is compiled once for ``python_version`` before the experiment
+                starts, instead of dropping and compiling each script separately.
+                Defaults to ``False``.
+            lean_records (bool): Have the ``psutil`` collectors write each sample
+                with ``analytics_records.py``, as JSON containing only the host, a
+                timestamp, and the sample, instead of through :py:mod:`logging`.
+                Defaults to ``False``.
+            collector_backend (str): How the ``psutil`` collectors read the system
+                statistics. Either ``"psutil"``, which installs
+                `psutil <https://pypi.org/project/psutil/>`__ for ``python_version``
+                (only python3.7 and python3.10 are supported), or ``"procfs"``, which
+                drops ``analytics_procfs.py`` and reads ``/proc`` directly with any
+                Python 3 interpreter. Defaults to ``"psutil"``.
+            transport (str): Also push the records of the ``psutil`` collectors to
+                a receiver on the host with ``analytics_transport.py``, in batches
+                compressed with ``zlib``, instead of writing them to stdout. Either
+                ``"udp://<host>:<port>"``, ``"unix://<path>"``, or
+                ``"virtio://<path>"`` (a virtio-serial port on the VM, e.g.
+                ``/dev/virtio-ports/analytics``). This implies ``lean_records``.
+                Defaults to ``None``.
+            shared_strace (bool): Have a single ``analytics.strace.py`` find the
+                processes for every call to :py:meth:`analytics.Analytics.strace` on
+                the VM, with one scan of ``/proc`` each second using a matcher
+                compiled from all of their regexes, instead of running a separate
+                ``pgrep`` loop for each call. Defaults to ``False``.
+            resource_budget (dict): Run every analytics process (and the processes
+                it starts, such as ``strace``) in the cgroup v2 slice
+                :py:data:`ANALYTICS_CGROUP`, created before the experiment starts
+                with these limits: ``"cpu"``, the CPUs it may use (e.g. ``0.25``);
+                ``"memory"``, its most memory (e.g. ``"256M"``); and ``"io_weight"``,
+                its I/O weight from ``1`` to ``10000`` (the default is ``100``). The
+                ``psutil`` collectors add the slice's CPU throttling and memory limit
+                events since their previous sample to each sample. Defaults to
+                ``None`` (no limits).
+
+        Raises:
+            ValueError: If ``profile`` contains an unknown mode, or
+                ``collector_backend``, the scheme of ``transport``, or a limit of
+                ``resource_budget`` is unknown, or if the ``"cpu"`` of
+                ``resource_budget`` is below ``0.01`` (a ``cpu.max`` quota of 1 ms
+                in each 100 ms period, the smallest the kernel accepts).
         """
         self.python_version = python_version
+        self.profile = profile.split(",") if profile else []
+        unknown_modes = set(self.profile) - self._profile_modes
+        if unknown_modes:
+            raise ValueError(
+                f"Unknown profile mode(s) {sorted(unknown_modes)}, "
+                f"expected one of {sorted(self._profile_modes)}"
+            )
+        self.profile_interval_sec = profile_interval_sec
+        self.bundle = bundle
+        if transport and transport.partition("://")[0] not in TRANSPORT_SCHEMES:
+            raise ValueError(
+                f"Unknown transport {transport!r}, expected a URL with one of the "
+                f"schemes {TRANSPORT_SCHEMES}"
+            )
+        self.transport = transport
+        self.lean_records = lean_records or bool(transport)
+        if collector_backend not in COLLECTOR_BACKENDS:
+            raise ValueError(
+                f"Unknown collector backend {collector_backend!r}, "
+                f"expected one of {COLLECTOR_BACKENDS}"
+            )
+        self.collector_backend = collector_backend
+        self.shared_strace = shared_strace
+        # The number of requests for the shared strace discovery
+        self._strace_requests = 0
+        unknown_limits = set(resource_budget or {}) - set(RESOURCE_BUDGET_LIMITS)
+        if unknown_limits:
+            raise ValueError(
+                f"Unknown resource budget limit(s) {sorted(unknown_limits)}, "
+                f"expected one of {RESOURCE_BUDGET_LIMITS}"
+            )
+        cpu = (resource_budget or {}).get("cpu")
+        if cpu is not None and cpu * CPU_PERIOD_USEC < MIN_CPU_QUOTA_USEC:
+            raise ValueError(
+                f"The resource budget's cpu {cpu!r} is below the smallest quota "
+                f"the kernel accepts, {MIN_CPU_QUOTA_USEC / CPU_PERIOD_USEC} CPUs"
+            )
+        self.resource_budget = resource_budget or {}
 
         self.install_pip_package_list(
             -100,
@@ -152,6 +377,199 @@ class Analytics:
             "kill_analytics.py",
             executable=True,
         )
+        if self.profile:
+            self.drop_file(
+                -100, "/opt/analytics/analytics.profile.py", "analytics.profile.py"
+            )
+        if self.lean_records:
+            self._add_records_module()
+        if self.transport and not self.bundle:
+            self.drop_file(
+                -100, "/opt/analytics/analytics_transport.py", "analytics_transport.py"
+            )
+        if self.collector_backend == "procfs":
+            self._add_procfs_backend()
+        if self.resource_budget and not self.bundle:
+            self.drop_file(
+                -100, "/opt/analytics/analytics_cgroup.py", "analytics_cgroup.py"
+            )
+        if self.bundle:
+            self.drop_file(-100, ANALYTICS_BUNDLE, self._add_bundle())
+        # Compiling the bundle and creating the slice only need the files dropped
+        # above, so they run as a single schedule entry
+        with self.batched_steps(-99, "analytics_setup", window=1) as batch:
+            if self.bundle:
+                batch.add(self.python_version, f"{ANALYTICS_BUNDLE} --compile")
+            if self.resource_budget:
+                limits = " ".join(
+                    f"--{limit.replace('_', '-')} {value}"
+                    for limit, value in self.resource_budget.items()
+                )
+                batch.add(
+                    self.python_version,
+                    f"{self._cgroup_helper()} create {ANALYTICS_CGROUP} {limits}",
+                    time=-98,
+                )
+
+    @classmethod
+    def _add_bundle(cls):
+        """
+        Build ``analytics.pyz`` and add it to the VM resource store.
+
+        Returns:
+            str: The name of the bundle in the VM resource store.
+        """
+        if cls._bundle_name is None:
+            bundle = build_analytics_bundle()
+            VmResourceStore().add_file(str(bundle))
+            cls._bundle_name = bundle.name
+        return cls._bundle_name
+
+    def _cgroup_helper(self):
+        """
+        Get the command which runs ``analytics_cgroup.py`` on the VM.
+
+        Returns:
+            str: The path to the helper, from ``analytics.pyz`` when bundling.
+        """
+        if self.bundle:
+            return f"{ANALYTICS_BUNDLE} analytics_cgroup.py"
+        return "/opt/analytics/analytics_cgroup.py"
+
+    def _run_in_budget(self, time, command):
+        """
+        Run a command in the :py:data:`ANALYTICS_CGROUP` slice of the
+        ``resource_budget``.
+
+        Arguments:
+            time (int): The time to run the command.
+            command (str): The command and its arguments.
+        """
+        self.run_executable(
+            time,
+            self.python_version,
+            f"{self._cgroup_helper()} exec {ANALYTICS_CGROUP} {command}",
+            vm_resource=False,
+        )
+
+    def _run_analytics_script(self, time, fn, arguments):
+        """
+        Run an analytics VM resource, either from ``analytics.pyz`` or after dropping
+        it into ``/opt/analytics``, and under ``analytics.profile.py`` if profiling
+        was requested. With a ``resource_budget``, it runs in the
+        :py:data:`ANALYTICS_CGROUP` slice.
+
+        Arguments:
+            time (int): The time to run the VM resource.
+            fn (str): The filename of the VM resource.
+            arguments (str): The arguments for the VM resource.
+        """
+        if self.bundle:
+            script = f"{ANALYTICS_BUNDLE} {fn}"
+        else:
+            script = f"/opt/analytics/{fn}"
+            self.drop_file(-50, script, fn)
+        if self.profile:
+            profile_flags = " ".join(f"--{mode}" for mode in self.profile)
+            arguments = (
+                f"/opt/analytics/analytics.profile.py {profile_flags} "
+                f"--interval {self.profile_interval_sec} --name {fn[: -len('.py')]} "
+                f"{script} {arguments}"
+            )
+        else:
+            arguments = f"{script} {arguments}"
+        if self.resource_budget:
+            self._run_in_budget(time, f"{self.python_version} {arguments}")
+            return
+        self.run_executable(time, self.python_version, arguments, vm_resource=False)
+
+    @run_once
+    def _add_procfs_backend(self):
+        """
+        Drop ``analytics_procfs.py`` into ``/opt/analytics``, unless it is bundled.
+
+        Note:
+            This method is decorated with the :py:func:`analytics.run_once` decorator
+            which ensures that, even if the method is called multiple times, the code will
+            only be executed once.
+        """
+        if not self.bundle:
+            self.drop_file(
+                -100, "/opt/analytics/analytics_procfs.py", "analytics_procfs.py"
+            )
+
+    @run_once
+    def _add_records_module(self):
+        """
+        Drop ``analytics_records.py`` into ``/opt/analytics``, unless it is bundled.
+
+        Note:
+            This method is decorated with the :py:func:`analytics.run_once` decorator
+            which ensures that, even if the method is called multiple times, the code will
+            only be executed once.
+        """
+        if not self.bundle:
+            self.drop_file(
+                -100, "/opt/analytics/analytics_records.py", "analytics_records.py"
+            )
+
+    def _add_collector(self, fn, refresh_interval_sec, extended=False):
+        """
+        Schedule one of the ``psutil`` collectors at time ``1``, installing
+        `psutil <https://pypi.org/project/psutil/>`__ unless the collectors use the
+        ``procfs`` backend.
+
+        Arguments:
+            fn (str): The filename of the collector.
+            refresh_interval_sec (int): Interval to track the statistics.
+            extended (bool): Run the collector with ``--extended``, which reads its
+                statistics with ``analytics_procfs.py`` and does not need psutil.
+                Defaults to ``False``.
+        """
+        # The collectors parse their options with analytics_records
+        self._add_records_module()
+        arguments = str(refresh_interval_sec)
+        if self.lean_records:
+            arguments += " --lean"
+        if self.transport:
+            arguments += f" --transport={self.transport}"
+        if self.resource_budget:
+            arguments += f" --cgroup={ANALYTICS_CGROUP}"
+        if extended:
+            arguments += " --extended"
+            self._add_procfs_backend()
+        elif self.collector_backend == "procfs":
+            arguments += " --procfs"
+        else:
+            self.install_psutil()
+        self._run_analytics_script(1, fn, arguments)
+
+    def _add_analytics_vm_resource(self, time, fn, pickled_args, imports_helpers=False):
+        """
+        Schedule an analytics VM resource which reads its options from a pickle file.
+
+        When profiling, bundling, or running in a ``resource_budget`` (or when the VM
+        resource imports helper modules such as ``analytics_procfs`` or
+        ``analytics_records``), the pickled options are dropped into
+        ``/opt/analytics`` so that the VM resource can be started by
+        :py:meth:`analytics.Analytics._run_analytics_script`.
+
+        Arguments:
+            time (int): The time to run the VM resource.
+            fn (str): The filename of the VM resource.
+            pickled_args (str): The pickled options for the VM resource.
+            imports_helpers (bool): Whether the VM resource imports helper modules
+                (e.g. ``analytics_procfs``, or ``analytics_records`` in lean mode)
+                which are only dropped into ``/opt/analytics``, and so must run
+                from there. Defaults to ``False``.
+        """
+        if not (self.profile or self.bundle or self.resource_budget or imports_helpers):
+            self.add_vm_resource(time, fn, pickled_args, None)
+            return
+
+        options_path = f"/opt/analytics/{fn}.{time}.options"
+        self.drop_content(-50, options_path, pickled_args)
+        self._run_analytics_script(time, fn, options_path)
 
     def strace(
         self,
@@ -160,25 +578,71 @@ class Analytics:
         options=None,
         first_match_only=True,
         tailf_traces=True,
+        syscall_classes=None,
+        string_limit=None,
+        summary_only=False,
+        command=None,
     ):
         """
         Adds a VM resource to call `pgrep <https://linux.die.net/man/1/pgrep>`_
         for the passed in regular expression until a match, then use
         `strace <https://strace.io/>`_ on the matched PIDs.
 
+        By default, ``strace`` stops the traced processes on every system call and
+        captures up to 1 KiB of each string argument, which can slow a busy service
+        several times over. Passing ``syscall_classes`` only traces those classes
+        of system calls, with ``--seccomp-bpf`` and 64 byte strings, and
+        ``summary_only`` only counts the system calls (``-c``). The seccomp-bpf
+        filter is installed by the traced process itself, so it only takes effect
+        (and the other system calls only stop being interrupted) when ``strace``
+        starts the process with ``command``; attached processes still stop on every
+        system call, but the others are neither decoded nor written. These options
+        require strace 5.3 or later.
+
         Arguments:
             time (int): The time to run the ``strace`` VM resource
             process_regex (str): The regex to match on to find the PIDs to ``strace``
             options (str): Optional arguments with which to override the call to ``strace``.
-                Default options are ``-ff -tt -s 1024``
+                Default options are ``-ff -tt -s 1024``, and the following arguments
+                are ignored when they are given.
             first_match_only (bool): Whether ``pgrep`` should keep finding matches or
                 stop after the first match. Defaults to ``True``.
             tailf_traces (bool): Whether each outputted trace file should use
                 :py:meth:`analytics.Analytics.tailf_dir` which causes it to be
                 added to logs. Defaults to ``True``.
+            syscall_classes (list): Only trace these classes of system calls from
+                :py:data:`STRACE_SYSCALL_CLASSES` (e.g. ``["network", "process"]``),
+                using ``--seccomp-bpf``. Defaults to ``None`` (every system call).
+            string_limit (int): The longest string argument to capture (``-s``).
+                Defaults to ``64`` with ``syscall_classes`` and ``1024`` otherwise.
+            summary_only (bool): Only write a count, time, and error summary of the
+                system calls of each traced process (``-c``) when ``strace`` exits,
+                rather than every call. The summary is not followed with
+                :py:meth:`analytics.Analytics.tailf_dir`. Defaults to ``False``.
+            command (str): Start this command under ``strace`` at ``time`` instead of
+                attaching to the processes which match ``process_regex``. Defaults to
+                ``None``.
+
+        Raises:
+            ValueError: If ``syscall_classes`` contains an unknown class.
         """
         if options is None:
-            options = "-ff -tt -s 1024"
+            unknown_classes = set(syscall_classes or []) - set(STRACE_SYSCALL_CLASSES)
+            if unknown_classes:
+                raise ValueError(
+                    f"Unknown syscall class(es) {sorted(unknown_classes)}, "
+                    f"expected one of {STRACE_SYSCALL_CLASSES}"
+                )
+            if summary_only:
+                options = "-f -c"
+            else:
+                if string_limit is None:
+                    string_limit = 64 if syscall_classes else 1024
+                options = f"-ff -tt -s {string_limit}"
+            if syscall_classes:
+                options += " --seccomp-bpf -e trace=" + ",".join(
+                    f"%{syscall_class}" for syscall_class in syscall_classes
+                )
 
         if tailf_traces:
             output_dir = f"/opt/analytics/traces/tailf_dirs/{time}"
@@ -191,15 +655,57 @@ class Analytics:
                 "options": options,
                 "first_match_only": first_match_only,
                 "output_dir": output_dir,
+                "command": command,
             },
             protocol=0,
         ).decode()
 
-        self.add_vm_resource(time, "analytics.strace.py", strace_args, None)
+        if self.shared_strace and command is None:
+            self._add_strace_request(time, strace_args)
+        else:
+            self._add_analytics_vm_resource(time, "analytics.strace.py", strace_args)
 
-        if tailf_traces:
+        if tailf_traces and not summary_only:
             self.tailf_dir(max(1, time - 1), output_dir, "trace\\\\.[0-9]+")
 
+    def _add_strace_request(self, time, strace_args):
+        """
+        Register a request with the shared strace discovery, which starts serving it
+        when it is moved into :py:data:`STRACE_REQUESTS_DIR` at ``time``.
+
+        Arguments:
+            time (int): The time to start finding the processes to ``strace``.
+            strace_args (str): The pickled options of the request.
+        """
+        self._start_strace_discovery()
+        self._strace_requests += 1
+        name = f"strace.{time}.{self._strace_requests}.request"
+        self.drop_content(-50, f"/opt/analytics/{name}", strace_args)
+        self.run_executable(
+            time,
+            "mv",
+            f"/opt/analytics/{name} {STRACE_REQUESTS_DIR}/{name}",
+            vm_resource=False,
+        )
+
+    @run_once
+    def _start_strace_discovery(self):
+        """
+        Schedule the shared strace discovery at time ``1``, which serves the
+        requests added by :py:meth:`analytics.Analytics._add_strace_request`.
+
+        Note:
+            This method is decorated with the :py:func:`analytics.run_once` decorator
+            which ensures that, even if the method is called multiple times, the code will
+            only be executed once.
+        """
+        self.run_executable(
+            -99, "mkdir", f"-p {STRACE_REQUESTS_DIR}", vm_resource=False
+        )
+        self._run_analytics_script(
+            1, "analytics.strace.py", f"--shared {STRACE_REQUESTS_DIR}"
+        )
+
     @run_once_with_unique([2], [])  # Only add tailf_dir to any directory once
     def tailf_dir(self, time, directory, matching_regex):
         r"""
@@ -221,6 +727,11 @@ class Analytics:
         """
         assert time >= 1
         self.install_inotify()
+        if self.resource_budget:
+            script = "/opt/analytics/analytics.tailf_dir.sh"
+            self.drop_file(-50, script, "analytics.tailf_dir.sh", executable=True)
+            self._run_in_budget(time, f"{script} {directory} {matching_regex}")
+            return
         self.run_executable(
             time,
             "analytics.tailf_dir.sh",
@@ -268,8 +779,16 @@ class Analytics:
         if options is None:
             options = "-U -w /opt/analytics/pcaps/tmp.pcap -Z root"
 
-        self.run_executable(-1, "mkdir", "/opt/analytics/pcaps", vm_resource=False)
-        self.run_executable(1, "tcpdump", options, vm_resource=False)
+        if self.resource_budget:
+            self.run_executable(
+                -50, "mkdir", "-p /opt/analytics/pcaps", vm_resource=False
+            )
+            self._run_in_budget(1, f"tcpdump {options}")
+            return
+
+        with self.batched_steps(1, "tcpdump") as batch:
+            batch.add("mkdir", "-p /opt/analytics/pcaps")
+            batch.add("tcpdump", options)
 
     @run_once
     def add_port_tracking(self, refresh_interval_sec=1):
@@ -288,7 +807,112 @@ class Analytics:
         netstat_args = pickle.dumps(
             {"interval": refresh_interval_sec}, protocol=0
         ).decode()
-        self.add_vm_resource(1, "analytics.port_tracking.py", netstat_args, None)
+        self._add_analytics_vm_resource(1, "analytics.port_tracking.py", netstat_args)
+
+    @run_once
+    def add_process_lifecycle_tracking(self, method="auto", refresh_interval_sec=1):
+        """
+        Adds a VM resource which records each process that calls ``exec`` or exits,
+        with its command line, parent, user, and exit code, without tracing it.
+        Writes to ``/opt/analytics/process_lifecycle.log`` on the VM.
+
+        The events are received from the kernel's netlink proc connector, which keeps
+        up with fork storms and reports any events lost when its buffer overflows.
+        Otherwise, ``/proc`` is listed every ``refresh_interval_sec`` seconds and only
+        the new PIDs are read, which misses exit codes and the processes that start and
+        exit between two listings (these are counted instead).
+
+        Note:
+            This method is decorated with the :py:func:`analytics.run_once` decorator
+            which ensures that, even if the method is called multiple times, the code will
+            only be executed once.
+
+        Arguments:
+            method (str): Either ``"netlink"``, ``"proc"``, or ``"auto"``, which uses
+                ``"netlink"`` if it is available. Defaults to ``"auto"``.
+            refresh_interval_sec (int): Interval between listing ``/proc`` with the
+                ``"proc"`` method. Defaults to ``1``.
+
+        Raises:
+            ValueError: If ``method`` is unknown.
+        """
+        if method not in LIFECYCLE_METHODS:
+            raise ValueError(
+                f"Unknown method {method!r}, expected one of {LIFECYCLE_METHODS}"
+            )
+        lifecycle_args = pickle.dumps(
+            {
+                "method": method,
+                "interval": refresh_interval_sec,
+                "lean": self.lean_records,
+                "transport": self.transport,
+            },
+            protocol=0,
+        ).decode()
+        # In lean mode (and so with a transport), it imports analytics_records
+        self._add_analytics_vm_resource(
+            1,
+            "analytics.process_lifecycle.py",
+            lifecycle_args,
+            imports_helpers=self.lean_records,
+        )
+
+    @run_once
+    def add_syscall_profile(
+        self, refresh_interval_sec=10, method="auto", bpftrace_binary=None
+    ):
+        """
+        Adds a VM resource which profiles the system calls of every process on the VM
+        without tracing them, writing the calls, total time, and latency histogram of
+        each system call of each process every ``refresh_interval_sec`` seconds to
+        ``/opt/analytics/syscall_profile.log`` on the VM.
+
+        The system calls are aggregated in the kernel by
+        `bpftrace <https://github.com/bpftrace/bpftrace>`_, so its overhead is far
+        lower than :py:meth:`strace <analytics.Analytics.strace>`. If bpftrace is not
+        installed or cannot attach (e.g. the kernel lacks BPF support), only the
+        ``read`` and ``write`` calls of each process are counted from ``/proc``.
+
+        Note:
+            This method is decorated with the :py:func:`analytics.run_once` decorator
+            which ensures that, even if the method is called multiple times, the code will
+            only be executed once.
+
+        Arguments:
+            refresh_interval_sec (int): Interval between the records. Defaults to ``10``.
+            method (str): Either ``"bpftrace"``, ``"procfs"``, or ``"auto"``, which
+                uses ``"bpftrace"`` if it is available. Defaults to ``"auto"``.
+            bpftrace_binary (str): The name of a static ``bpftrace`` executable in the
+                VM resources (e.g. from a bpftrace release) to drop into
+                ``/opt/analytics/bpftrace``. Defaults to the ``bpftrace`` installed on
+                the VM.
+
+        Raises:
+            ValueError: If ``method`` is unknown.
+        """
+        if method not in SYSCALL_PROFILE_METHODS:
+            raise ValueError(
+                f"Unknown method {method!r}, expected one of {SYSCALL_PROFILE_METHODS}"
+            )
+        options = {
+            "method": method,
+            "interval": refresh_interval_sec,
+            "lean": self.lean_records,
+            "transport": self.transport,
+        }
+        if bpftrace_binary:
+            options["bpftrace"] = "/opt/analytics/bpftrace"
+            self.drop_file(
+                -50, "/opt/analytics/bpftrace", bpftrace_binary, executable=True
+            )
+        profile_args = pickle.dumps(options, protocol=0).decode()
+        # In lean mode (and so with a transport), it imports analytics_records
+        self._add_analytics_vm_resource(
+            1,
+            "analytics.syscall_profile.py",
+            profile_args,
+            imports_helpers=self.lean_records,
+        )
 
     @run_once
     def add_system_memory_tracking(self, refresh_interval_sec=5):
@@ -305,15 +929,70 @@ class Analytics:
         Arguments:
             refresh_interval_sec (int): Interval to track the statistics. Defaults to ``5``.
         """
-        self.install_psutil()
-        fn = "psutil.system_memory_tracking.py"
-        full_path = f"/opt/analytics/{fn}"
-        self.drop_file(-50, full_path, fn)
-        self.run_executable(
-            1,
-            self.python_version,
-            f"{full_path} {refresh_interval_sec}",
-            vm_resource=False,
+        self._add_collector("psutil.system_memory_tracking.py", refresh_interval_sec)
+
+    @run_once
+    def add_pressure_tracking(self, refresh_interval_sec=5, triggers=None):
+        """
+        Adds a VM resource which tracks whether the VM is stalling on CPU, memory, or
+        I/O every ``refresh_interval_sec`` seconds, from the pressure stall information
+        (PSI) in ``/proc/pressure`` and the page fault, swap, and reclaim counters in
+        ``/proc/vmstat``. Writes to ``/opt/analytics/pressure_tracking.log`` on the VM.
+
+        Unlike :py:meth:`add_system_memory_tracking <analytics.Analytics.add_system_memory_tracking>`,
+        which only shows how much memory is used, this shows the time that tasks
+        spent waiting for each resource. The stall times and counters are recorded as
+        the change since the previous record.
+
+        Each of the ``triggers`` is registered with the kernel, which wakes the
+        collector as soon as the stall time exceeds the trigger's threshold within its
+        window, so that the stall is recorded right away rather than at the next
+        sample. For example, ``[("memory", "some 150000 1000000")]`` records whenever
+        some tasks stall on memory for 150 ms within one second.
+
+        Note:
+            This method is decorated with the :py:func:`analytics.run_once` decorator
+            which ensures that, even if the method is called multiple times, the code will
+            only be executed once.
+
+        Arguments:
+            refresh_interval_sec (int): Interval between the records. Defaults to ``5``.
+            triggers (list): ``(resource, trigger)`` tuples, where the resource is
+                ``"cpu"``, ``"memory"``, or ``"io"`` and the trigger is
+                ``"<some|full> <stall threshold us> <window us>"``. The window must be
+                from 0.5 to 10 seconds. Defaults to no triggers.
+
+        Raises:
+            ValueError: If a trigger's resource is unknown or the trigger is invalid.
+        """
+        triggers = list(triggers or [])
+        for resource, trigger in triggers:
+            if resource not in PSI_RESOURCES:
+                raise ValueError(
+                    f"Unknown resource {resource!r}, expected one of {PSI_RESOURCES}"
+                )
+            match = PSI_TRIGGER.match(trigger)
+            if not match or not (
+                0 < int(match.group(2)) <= int(match.group(3))
+                and 500000 <= int(match.group(3)) <= 10000000
+            ):
+                raise ValueError(
+                    f"Invalid trigger {trigger!r}, expected "
+                    "'<some|full> <stall threshold us> <window us>' with a window "
+                    "from 500000 to 10000000 us"
+                )
+        self._add_procfs_backend()
+        pressure_args = pickle.dumps(
+            {
+                "interval": refresh_interval_sec,
+                "triggers": triggers,
+                "lean": self.lean_records,
+                "transport": self.transport,
+            },
+            protocol=0,
+        ).decode()
+        self._add_analytics_vm_resource(
+            1, "analytics.pressure_tracking.py", pressure_args, imports_helpers=True
         )
 
     @run_once
@@ -331,16 +1010,7 @@ class Analytics:
         Arguments:
             refresh_interval_sec (int): Interval to track the statistics. Defaults to ``5``.
         """
-        self.install_psutil()
-        fn = "psutil.disk_usage_tracking.py"
-        full_path = f"/opt/analytics/{fn}"
-        self.drop_file(-50, full_path, fn)
-        self.run_executable(
-            1,
-            self.python_version,
-            f"{full_path} {refresh_interval_sec}",
-            vm_resource=False,
-        )
+        self._add_collector("psutil.disk_usage_tracking.py", refresh_interval_sec)
 
     @run_once
     def add_disk_io_tracking(self, refresh_interval_sec=5):
@@ -357,16 +1027,7 @@ class Analytics:
         Arguments:
             refresh_interval_sec (int): Interval to track the statistics. Defaults to ``5``.
         """
-        self.install_psutil()
-        fn = "psutil.disk_io_tracking.py"
-        full_path = f"/opt/analytics/{fn}"
-        self.drop_file(-50, full_path, fn)
-        self.run_executable(
-            1,
-            self.python_version,
-            f"{full_path} {refresh_interval_sec}",
-            vm_resource=False,
-        )
+        self._add_collector("psutil.disk_io_tracking.py", refresh_interval_sec)
 
     @run_once
     def add_network_io_tracking(self, refresh_interval_sec=1):
@@ -383,24 +1044,23 @@ class Analytics:
         Arguments:
             refresh_interval_sec (int): Interval to track the statistics. Defaults to ``1``.
         """
-        self.install_psutil()
-        fn = "psutil.network_io_tracking.py"
-        full_path = f"/opt/analytics/{fn}"
-        self.drop_file(-50, full_path, fn)
-        self.run_executable(
-            1,
-            self.python_version,
-            f"{full_path} {refresh_interval_sec}",
-            vm_resource=False,
-        )
+        self._add_collector("psutil.network_io_tracking.py", refresh_interval_sec)
 
     @run_once
-    def add_cpu_tracking(self, refresh_interval_sec=1):
+    def add_cpu_tracking(self, refresh_interval_sec=1, extended=False):
         """
         Uses `psutil <https://pypi.org/project/psutil/>`__ to track the systems CPU
         frequencies on each CPU every ``<interval>`` seconds. Writes the output to
         ``/opt/analytics/cpu_tracking.log`` on the VM.
 
+        With ``extended``, each sample instead records the ``user``, ``system``,
+        ``iowait``, ``irq``, ``softirq``, and ``steal`` percentages of each CPU (as a
+        list per field, indexed by CPU), the context switches (``ctxt``) and
+        interrupts (``intr``) since the previous sample, ``procs_running``,
+        ``procs_blocked``, and ``loadavg``. These are parsed from a single read of
+        ``/proc/stat`` per sample without psutil, at a cost per CPU which stays flat
+        on VMs with many CPUs.
+
         Note:
             This method is decorated with the :py:func:`analytics.run_once` decorator
             which ensures that, even if the method is called multiple times, the code will
@@ -408,16 +1068,10 @@ class Analytics:
 
         Arguments:
             refresh_interval_sec (int): Interval to track the statistics. Defaults to ``1``.
+            extended (bool): Record the extended CPU statistics. Defaults to ``False``.
         """
-        self.install_psutil()
-        fn = "psutil.cpu_tracking.py"
-        full_path = f"/opt/analytics/{fn}"
-        self.drop_file(-50, full_path, fn)
-        self.run_executable(
-            1,
-            self.python_version,
-            f"{full_path} {refresh_interval_sec}",
-            vm_resource=False,
+        self._add_collector(
+            "psutil.cpu_tracking.py", refresh_interval_sec, extended=extended
         )
 
     @run_once
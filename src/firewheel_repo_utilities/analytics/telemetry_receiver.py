@@ -0,0 +1,580 @@
+"""
+Receive the records pushed by ``analytics_transport`` from many VMs on the host.
+
+Run the receiver on the host (or any machine reachable from the VMs) and decorate
+the VMs with ``Analytics`` using ``init_kwargs={"transport": ...}`` pointing at it::
+
+    python telemetry_receiver.py --udp 0.0.0.0:5140 --store /scratch/analytics
+
+The receiver is built on :py:mod:`asyncio`, so a single process accepts the
+concurrent streams of thousands of VMs. Each frame is decompressed and parsed with a
+single :py:func:`json.loads` call for the whole batch, and every numeric field of
+every record is:
+
+* Appended to an append-only segment for its VM and metric
+  (``<store>/<host>/<metric>.<n>.seg``), which holds little-endian ``float64``
+  ``(timestamp, value)`` pairs and is rotated at ``--segment-mb``. The samples of
+  each metric are buffered and appended 2048 at a time, or every ``--flush``
+  seconds. With ``--codec gorilla``, each batch is instead appended as a block
+  compressed by ``analytics_gorilla`` (``<metric>.<n>.gor``, with timestamps
+  rounded to milliseconds), which is a fifth of the size or less.
+  :py:func:`read_segment` reads either kind.
+* Added to a rolling aggregate (count, mean, minimum, maximum, and last value over
+  the past ``--window`` seconds) which is kept in memory.
+
+The aggregates can be queried by sending ``<host> <metric prefix>`` (either may be
+``*``) followed by a newline to the ``--query`` address, which answers with one line
+of JSON (e.g. with ``--query 127.0.0.1:5141``). The sequence numbers and drop
+counters in the frame headers are tracked per sender, so lost records are reported.
+"""
+
+import re
+import sys
+import json
+import time
+import array
+import asyncio
+import logging
+import argparse
+import importlib.util
+from pathlib import Path
+from collections import deque
+
+
+def _load_vm_resource(name):
+    spec = importlib.util.spec_from_file_location(
+        name, Path(__file__).resolve().parent / "vm_resources" / f"{name}.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# The frames and the compression are defined by the VM resources
+analytics_transport = _load_vm_resource("analytics_transport")
+analytics_gorilla = _load_vm_resource("analytics_gorilla")
+
+log = logging.getLogger("telemetry_receiver")
+
+# The types of the fields which are stored (:py:class:`bool` is deliberately excluded)
+NUMBERS = frozenset([int, float])
+
+# The hosts whose records are accepted, which also name their directory in the store
+# (so they cannot be ``.``, ``..``, or contain a ``/``)
+HOST_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,252}")
+
+# Codec -> the suffix of its segments
+CODECS = {"raw": "seg", "gorilla": "gor"}
+
+# The largest payload accepted in a frame on a stream. Senders compress batches of
+# at most 256 KiB, so anything larger is a corrupt or foreign stream.
+MAX_FRAME_BYTES = 16 << 20
+
+
+class Segment:
+    """The append-only ``(timestamp, value)`` files of one metric of one VM."""
+
+    def __init__(self, directory, metric, max_bytes, codec="raw"):
+        """
+        Start buffering the samples, which are written on the first flush.
+
+        Arguments:
+            directory (pathlib.Path): The directory of the VM.
+            metric (str): The name of the metric.
+            max_bytes (int): The size at which a new segment is started.
+            codec (str): How the samples are written, one of :py:data:`CODECS`.
+        """
+        self.directory = directory
+        self.metric = metric
+        self.max_bytes = max_bytes
+        self.codec = codec
+        self.pending = array.array("d")
+        self.index = 0
+
+    @property
+    def path(self):
+        """pathlib.Path: The segment which is currently appended to."""
+        return self.directory / f"{self.metric}.{self.index}.{CODECS[self.codec]}"
+
+    def flush(self):
+        """Append the pending samples to the segment, starting a new one if full."""
+        pending = self.pending
+        if not pending:
+            return
+        path = self.path
+        # Skip the full segments, including those written before a restart
+        while path.exists() and path.stat().st_size >= self.max_bytes:
+            self.index += 1
+            path = self.path
+        with path.open("ab") as segment:
+            if self.codec == "gorilla":
+                block = analytics_gorilla.encode_block(
+                    list(zip(pending[0::2], pending[1::2]))
+                )
+                segment.write(analytics_gorilla.BLOCK_LENGTH.pack(len(block)) + block)
+            else:
+                if sys.byteorder != "little":
+                    pending.byteswap()
+                pending.tofile(segment)
+        del pending[:]
+
+
+def read_segment(path):
+    """
+    Read the samples of a segment written by :py:class:`Segment`.
+
+    Arguments:
+        path (str): The segment, whose suffix is that of its codec.
+
+    Returns:
+        list: The ``(timestamp, value)`` samples.
+    """
+    path = Path(path)
+    with path.open("rb") as segment:
+        if path.suffix == f".{CODECS['gorilla']}":
+            return list(analytics_gorilla.Decoder(segment))
+        samples = array.array("d", segment.read())
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return list(zip(samples[0::2], samples[1::2]))
+
+
+class RollingAggregate:
+    """The count, mean, minimum, maximum, and last value of a metric over a window."""
+
+    __slots__ = ("maximums", "minimums", "samples", "total", "window")
+
+    def __init__(self, window):
+        """
+        Start with an empty window.
+
+        Arguments:
+            window (float): The length of the window, in seconds.
+        """
+        self.window = window
+        self.samples = deque()
+        self.total = 0.0
+        # Monotonic queues, whose first entry is the minimum (or maximum)
+        self.minimums = deque()
+        self.maximums = deque()
+
+    def add(self, timestamp, value):
+        """
+        Add a sample and forget the samples which are now outside the window.
+
+        Arguments:
+            timestamp (float): The time of the sample, in seconds since the epoch.
+            value (float): The value of the sample.
+        """
+        self.samples.append((timestamp, value))
+        self.total += value
+        minimums, maximums = self.minimums, self.maximums
+        while minimums and minimums[-1][1] >= value:
+            minimums.pop()
+        minimums.append((timestamp, value))
+        while maximums and maximums[-1][1] <= value:
+            maximums.pop()
+        maximums.append((timestamp, value))
+
+        cutoff = timestamp - self.window
+        samples = self.samples
+        while samples[0][0] < cutoff:
+            self.total -= samples.popleft()[1]
+        while minimums[0][0] < cutoff:
+            minimums.popleft()
+        while maximums[0][0] < cutoff:
+            maximums.popleft()
+
+    def summary(self):
+        """
+        Summarize the samples in the window.
+
+        Returns:
+            dict: The ``count``, ``mean``, ``min``, ``max``, ``last`` value, and the
+            timestamp (``ts``) of the last value.
+        """
+        timestamp, last = self.samples[-1]
+        return {
+            "count": len(self.samples),
+            "mean": self.total / len(self.samples),
+            "min": self.minimums[0][1],
+            "max": self.maximums[0][1],
+            "last": last,
+            "ts": timestamp,
+        }
+
+
+def flatten(prefix, value, metrics):
+    """
+    Collect the numeric fields of a record, joining the keys of nested objects and
+    the indices of arrays (e.g. the ``iowait`` of each CPU is ``iowait.0``, ...).
+
+    Arguments:
+        prefix (str): The name of ``value``.
+        value (object): A field of a record.
+        metrics (list): The ``(metric, value)`` pairs, which are appended to.
+    """
+    if isinstance(value, dict):
+        for key, nested in value.items():
+            flatten(f"{prefix}.{key}", nested, metrics)
+    elif isinstance(value, list):
+        for index, nested in enumerate(value):
+            flatten(f"{prefix}.{index}", nested, metrics)
+    elif type(value) in NUMBERS:
+        metrics.append((prefix, value))
+
+
+class TelemetryReceiver:
+    """Decode, store, and aggregate the frames sent by ``analytics_transport``."""
+
+    def __init__(
+        self,
+        store=None,
+        window=60.0,
+        segment_bytes=64 << 20,
+        flush_samples=2048,
+        codec="raw",
+    ):
+        """
+        Set up an empty receiver.
+
+        Arguments:
+            store (str): The directory in which to write the segments. If ``None``,
+                the records are only aggregated in memory.
+            window (float): The length of the rolling aggregates, in seconds.
+            segment_bytes (int): The size at which a new segment is started.
+            flush_samples (int): The number of samples of a metric which are
+                buffered before they are appended to its segment.
+            codec (str): How the segments are written, one of :py:data:`CODECS`.
+
+        Raises:
+            ValueError: If the codec is not known.
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {list(CODECS)}")
+        self.codec = codec
+        self.store = Path(store) if store else None
+        self.window = window
+        self.segment_bytes = segment_bytes
+        self.flush_values = flush_samples * 2
+        self.segments = {}
+        self.aggregates = {}
+        # The last sequence number and drop counter of each sender
+        self.senders = {}
+        self.frames = 0
+        self.records = 0
+        self.invalid_frames = 0
+        self.invalid_records = 0
+        self.lost_frames = 0
+        # The delay between the last record of each frame being written and ingested
+        self.latencies = deque(maxlen=100000)
+
+    def ingest(self, frame):
+        """
+        Decode a frame and add its records to the segments and aggregates.
+
+        Arguments:
+            frame (bytes): The frame.
+        """
+        try:
+            sender, sequence, dropped, payload = analytics_transport.decode_frame(frame)
+            records = json.loads(b"[" + payload[:-1].replace(b"\n", b",") + b"]")
+        except (ValueError, RecursionError):
+            self.invalid_frames += 1
+            return
+
+        last = self.senders.get(sender)
+        if last is not None and sequence > last[0] + 1:
+            self.lost_frames += sequence - last[0] - 1
+        self.senders[sender] = (sequence, dropped)
+        self.frames += 1
+
+        aggregates = self.aggregates
+        segments = self.segments
+        metrics = []
+        timestamp = None
+        for record in records:
+            # The records come from the network, so skip (and count) any record
+            # which could not have been written by analytics_records
+            if type(record) is not dict:
+                self.invalid_records += 1
+                continue
+            host = record.pop("host", "unknown")
+            record_timestamp = record.pop("ts", 0.0)
+            if (
+                type(host) is not str
+                or not HOST_PATTERN.fullmatch(host)
+                or type(record_timestamp) not in NUMBERS
+            ):
+                self.invalid_records += 1
+                continue
+            del metrics[:]
+            try:
+                for key, value in record.items():
+                    if type(value) in NUMBERS:
+                        metrics.append((key, value))
+                    else:
+                        flatten(key, value, metrics)
+            except RecursionError:
+                self.invalid_records += 1
+                continue
+            timestamp = record_timestamp
+            self.records += 1
+            for metric, value in metrics:
+                key = (host, metric)
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregate = aggregates[key] = RollingAggregate(self.window)
+                aggregate.add(timestamp, value)
+                if self.store is not None:
+                    segment = segments.get(key)
+                    if segment is None:
+                        segment = segments[key] = self._open_segment(host, metric)
+                    pending = segment.pending
+                    pending.append(timestamp)
+                    pending.append(value)
+                    if len(pending) >= self.flush_values:
+                        segment.flush()
+        if timestamp is not None:
+            self.latencies.append(time.time() - timestamp)
+
+    def _open_segment(self, host, metric):
+        directory = self.store / host
+        directory.mkdir(parents=True, exist_ok=True)
+        return Segment(
+            directory, metric.replace("/", "_"), self.segment_bytes, self.codec
+        )
+
+    def flush(self):
+        """Append the pending samples of every metric to its segment."""
+        for segment in self.segments.values():
+            segment.flush()
+
+    def query(self, host="*", prefix="*"):
+        """
+        Summarize the rolling aggregates of matching metrics.
+
+        Arguments:
+            host (str): The host, or ``*`` for every host.
+            prefix (str): The prefix of the metric names, or ``*`` for every metric.
+
+        Returns:
+            dict: The summaries, keyed by host and then metric.
+        """
+        results = {}
+        for (metric_host, metric), aggregate in self.aggregates.items():
+            if host not in {"*", metric_host}:
+                continue
+            if prefix != "*" and not metric.startswith(prefix):
+                continue
+            results.setdefault(metric_host, {})[metric] = aggregate.summary()
+        return results
+
+    def stats(self):
+        """
+        Get the counters of the receiver.
+
+        Returns:
+            dict: The frames and records received, the senders, the frames lost or
+            invalid, the invalid records which were skipped, the records dropped by
+            the senders, and the number of metrics.
+        """
+        return {
+            "frames": self.frames,
+            "records": self.records,
+            "senders": len(self.senders),
+            "lost_frames": self.lost_frames,
+            "invalid_frames": self.invalid_frames,
+            "invalid_records": self.invalid_records,
+            "dropped_records": sum(dropped for _, dropped in self.senders.values()),
+            "metrics": len(self.aggregates),
+        }
+
+    async def handle_stream(self, reader, writer):
+        """
+        Ingest the frames sent back to back on a stream until it is closed.
+
+        The stream is closed (and the peer logged) as soon as a frame header does
+        not start with :py:data:`analytics_transport.MAGIC` or announces a payload
+        larger than :py:data:`MAX_FRAME_BYTES`, as the frames which follow cannot
+        be found.
+
+        Arguments:
+            reader (asyncio.StreamReader): The stream to read.
+            writer (asyncio.StreamWriter): The other end of the stream.
+        """
+        header_size = analytics_transport.HEADER.size
+        try:
+            while True:
+                header = await reader.readexactly(header_size)
+                fields = analytics_transport.HEADER.unpack(header)
+                magic, length = fields[0], fields[-1]
+                if magic != analytics_transport.MAGIC or length > MAX_FRAME_BYTES:
+                    # The stream cannot be resynchronized, so drop the connection
+                    self.invalid_frames += 1
+                    log.warning(
+                        "Closing the stream from %s after an invalid frame header "
+                        "(magic %r, length %d)",
+                        writer.get_extra_info("peername") or "an unknown peer",
+                        magic,
+                        length,
+                    )
+                    return
+                self.ingest(header + await reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_query(self, reader, writer):
+        """
+        Answer each ``<host> <metric prefix>`` line with the matching aggregates.
+
+        Arguments:
+            reader (asyncio.StreamReader): The stream to read.
+            writer (asyncio.StreamWriter): The stream to answer on.
+        """
+        try:
+            async for line in reader:
+                host, _, prefix = line.decode().strip().partition(" ")
+                answer = self.query(host or "*", prefix.strip() or "*")
+                writer.write(json.dumps(answer).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def flush_periodically(self, interval):
+        """
+        Flush the segments every ``interval`` seconds.
+
+        The segments are flushed a few at a time, so that the frames which arrive
+        in the meantime are not delayed.
+
+        Arguments:
+            interval (float): The time between flushes, in seconds.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for count, segment in enumerate(list(self.segments.values())):
+                segment.flush()
+                if count % 64 == 63:
+                    await asyncio.sleep(0)
+
+
+class FrameProtocol(asyncio.DatagramProtocol):
+    """Ingest each UDP datagram as a frame."""
+
+    def __init__(self, receiver):
+        """
+        Send the datagrams to a receiver.
+
+        Arguments:
+            receiver (TelemetryReceiver): The receiver.
+        """
+        self.receiver = receiver
+
+    def datagram_received(self, data, _addr):
+        """
+        Ingest a datagram.
+
+        Arguments:
+            data (bytes): The frame.
+            _addr (tuple): The address of the sender, which is not used.
+        """
+        self.receiver.ingest(data)
+
+
+def _split_address(address):
+    """
+    Split a ``<host>:<port>`` address.
+
+    Arguments:
+        address (str): The address.
+
+    Returns:
+        tuple: The host and the port.
+    """
+    host, _, port = address.rpartition(":")
+    return host.strip("[]") or "0.0.0.0", int(port)  # noqa: S104
+
+
+async def serve(receiver, udp=None, unix=None, tcp=None, query=None, flush=30.0):
+    """
+    Run the receiver's servers until cancelled.
+
+    Arguments:
+        receiver (TelemetryReceiver): The receiver.
+        udp (str): The ``<host>:<port>`` on which to receive UDP frames.
+        unix (str): The path of a Unix socket on which to receive frames.
+        tcp (str): The ``<host>:<port>`` on which to receive frames over TCP (e.g.
+            from a QEMU virtio-serial ``socket`` chardev).
+        query (str): The ``<host>:<port>`` on which to answer queries.
+        flush (float): The longest time that a sample is buffered before it is
+            appended to its segment, in seconds.
+    """
+    loop = asyncio.get_running_loop()
+    servers = []
+    transports = []
+    if udp:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: FrameProtocol(receiver), local_addr=_split_address(udp)
+        )
+        transports.append(transport)
+    if unix:
+        servers.append(await asyncio.start_unix_server(receiver.handle_stream, unix))
+    if tcp:
+        servers.append(
+            await asyncio.start_server(receiver.handle_stream, *_split_address(tcp))
+        )
+    if query:
+        servers.append(
+            await asyncio.start_server(receiver.handle_query, *_split_address(query))
+        )
+    log.info("Receiving on %s", ", ".join(filter(None, [udp, unix, tcp])))
+    try:
+        await receiver.flush_periodically(flush)
+    finally:
+        for server in servers:
+            server.close()
+        for transport in transports:
+            transport.close()
+        receiver.flush()
+
+
+def main(argv=None):
+    """
+    Run the receiver from the command line.
+
+    Arguments:
+        argv (list): The command line arguments (defaults to :py:data:`sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--udp", help="Receive UDP frames on <host>:<port>.")
+    parser.add_argument("--unix", help="Receive frames on a Unix socket.")
+    parser.add_argument("--tcp", help="Receive frames over TCP on <host>:<port>.")
+    parser.add_argument("--query", help="Answer queries on <host>:<port>.")
+    parser.add_argument("--store", help="The directory for the segments.")
+    parser.add_argument("--window", type=float, default=60.0)
+    parser.add_argument("--segment-mb", type=int, default=64)
+    parser.add_argument("--flush", type=float, default=30.0)
+    parser.add_argument("--codec", choices=list(CODECS), default="raw")
+    args = parser.parse_args(argv)
+    if not (args.udp or args.unix or args.tcp):
+        parser.error("at least one of --udp, --unix, or --tcp is required")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    receiver = TelemetryReceiver(
+        args.store, args.window, args.segment_mb << 20, codec=args.codec
+    )
+    try:
+        asyncio.run(
+            serve(receiver, args.udp, args.unix, args.tcp, args.query, args.flush)
+        )
+    except KeyboardInterrupt:
+        log.info("Stopped: %s", receiver.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
+import os
 import sys
-import pickle
 import logging
-import platform
 from time import sleep
 from subprocess import check_output
 
-from pythonjsonlogger.json import JsonFormatter
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
 
 
 # pylint: disable=consider-using-f-string
@@ -35,11 +38,12 @@ class PortTracking:
             options_filename (str): A path to a file which contains the expected parameters.
         """
         self.options_filename = options_filename
+        self.full_command = ["netstat"]
         self._log = logging.getLogger("port_tracking")
         self._log.setLevel(logging.DEBUG)
         formatter = JsonFormatter(
             "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
-            static_fields={"hostname": platform.node()},
+            static_fields={"hostname": os.uname().nodename},
         )
 
         # Add logging to a file
@@ -54,6 +58,8 @@ class PortTracking:
 
         options = None
         if self.options_filename is not None:
+            import pickle  # noqa: PLC0415
+
             # There exists an options file. Either load it or fail
             try:
                 with open(self.options_filename, "rb") as fhand:
@@ -86,17 +92,29 @@ class PortTracking:
         old_ports = set(process_output_lines[2:])
 
         # Now run every <interval> seconds to get changes
+        self.full_command = full_command
         while True:
             sleep(interval)
-            process_output = check_output(full_command).decode().strip().split("\n")
-            new_ports = set(process_output[2:])
+            old_ports = self.sample(old_ports)
+
+    def sample(self, old_ports):
+        """Run netstat once and log any ports which were added or deleted.
+
+        Args:
+            old_ports (set): The netstat lines from the previous sample.
+
+        Returns:
+            set: The netstat lines from this sample.
+        """
+        process_output = check_output(self.full_command).decode().strip().split("\n")
+        new_ports = set(process_output[2:])
 
-            for port in old_ports - new_ports:
-                self._log.debug("DELETED: %s\n", port)
-            for port in new_ports - old_ports:
-                self._log.debug("ADDED:   %s\n", port)
+        for port in old_ports - new_ports:
+            self._log.debug("DELETED: %s\n", port)
+        for port in new_ports - old_ports:
+            self._log.debug("ADDED:   %s\n", port)
 
-            old_ports = new_ports
+        return new_ports
 
 
 if __name__ == "__main__":
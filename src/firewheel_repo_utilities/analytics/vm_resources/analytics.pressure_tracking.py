@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Track whether the VM is stalling on CPU, memory, or I/O, and why.
+
+Every ``interval`` seconds, the pressure stall information (PSI) in
+``/proc/pressure/{cpu,memory,io}`` and the paging and reclaim counters in
+``/proc/vmstat`` are written as a record to ``/opt/analytics/pressure_tracking.log``::
+
+    {"cpu_some_avg10": 0.04, "cpu_some_us": 1520, "cpu_full_avg10": 0.0,
+     "cpu_full_us": 0, "memory_some_avg10": 1.2, "memory_some_us": 60214, ...,
+     "pgfault": 10221, "pgmajfault": 12, "pswpin": 0, "pswpout": 0, "pgscan": 5120,
+     "pgsteal": 4980}
+
+The ``avg10`` fields are the percentage of the last ten seconds in which some (or,
+for ``full``, all) of the runnable tasks were stalled on the resource. Every other
+field is delta-encoded: the ``_us`` fields are the microseconds of stall time, and
+the ``vmstat`` fields the events (``pgscan`` and ``pgsteal`` summed over
+``kswapd``, direct reclaim, and ``khugepaged``), since the previous record. The
+first record has no previous record, so its deltas are ``0``.
+
+PSI triggers (e.g. ``("memory", "some 150000 1000000")``, a stall of 150 ms within
+any one second) can also be registered. The kernel wakes the collector with
+:py:func:`select.poll` as soon as a trigger fires, and a record is written right
+away rather than at the next sample::
+
+    {"event": "stall", "resource": "memory", "trigger": "some 150000 1000000"}
+
+A resource whose PSI is not available (e.g. a kernel booted with ``psi=0``) is left
+out of the records.
+"""
+
+import os
+import sys
+import select
+import logging
+from time import sleep, monotonic
+
+import analytics_procfs
+
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
+
+PSI_RESOURCES = ["cpu", "memory", "io"]
+
+# The vmstat counters which are recorded, with the counters summed into each
+VMSTAT_COUNTERS = {
+    "pgfault": (b"pgfault",),
+    "pgmajfault": (b"pgmajfault",),
+    "pswpin": (b"pswpin",),
+    "pswpout": (b"pswpout",),
+    "pgscan": (b"pgscan_kswapd", b"pgscan_direct", b"pgscan_khugepaged"),
+    "pgsteal": (b"pgsteal_kswapd", b"pgsteal_direct", b"pgsteal_khugepaged"),
+}
+
+
+def parse_pressure(data):
+    """Parse the contents of a ``/proc/pressure`` file.
+
+    Args:
+        data (bytes): The contents of the file.
+
+    Returns:
+        list: The ``avg10`` percentage and ``total`` microseconds of the ``some``
+        line, followed by those of the ``full`` line if there is one.
+    """
+    fields = data.split()
+    values = []
+    # some avg10=<n> avg60=<n> avg300=<n> total=<n> [full avg10=<n> ... total=<n>]
+    for start in range(0, len(fields), 5):
+        values.append(float(fields[start + 1][len(b"avg10=") :]))
+        values.append(int(fields[start + 4][len(b"total=") :]))
+    return values
+
+
+class PressureTracking:
+    """
+    This VMR writes the pressure stall information and reclaim counters every
+    ``interval`` seconds, and whenever a PSI trigger fires.
+    It reads its options from a file containing a pickled dictionary.
+
+    The dictionary that is expected is as follows::
+
+        {
+            'interval': <optional number of seconds between the records.
+                Default 5 seconds.>,
+            'triggers': <optional list of (resource, trigger) tuples, where the
+                resource is 'cpu', 'memory', or 'io', and the trigger is
+                '<some|full> <stall us> <window us>'. Default [].>,
+            'lean': <optional bool to write the records with analytics_records.
+                Default False.>,
+            'transport': <optional URL to also send the lean records to.>,
+            'path': <optional log file. Default /opt/analytics/pressure_tracking.log>
+        }
+    """
+
+    def __init__(self, options_filename):
+        """Load the options, open the statistics, and set up the records.
+
+        Args:
+            options_filename (str): A path to a file which contains the expected
+                parameters, or ``None`` for the defaults.
+        """
+        options = {}
+        if options_filename is not None:
+            import pickle  # noqa: PLC0415
+
+            with open(options_filename, "rb") as fhand:
+                options = pickle.load(fhand)
+        self.interval = options.get("interval", 5)
+        path = options.get("path", "/opt/analytics/pressure_tracking.log")
+
+        self._log = logging.getLogger("pressure_tracking")
+        self._log.setLevel(logging.DEBUG)
+        if options.get("lean"):
+            import analytics_records  # noqa: PLC0415
+
+            self._emit = analytics_records.RecordEmitter(
+                analytics_records.open_streams(
+                    path, stdout=False, transport=options.get("transport")
+                )
+            ).emit
+        else:
+            formatter = JsonFormatter(
+                "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
+                static_fields={"hostname": os.uname().nodename},
+            )
+            file_handler = logging.FileHandler(path)
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(formatter)
+            self._log.addHandler(file_handler)
+            self._emit = self._log.debug
+
+        # Resource -> (/proc/pressure file, the keys of its fields in the record)
+        self.pressure = {}
+        for resource in PSI_RESOURCES:
+            try:
+                proc_file = analytics_procfs.ProcFile(
+                    os.path.join(analytics_procfs.PROC, "pressure", resource)
+                )
+                lines = len(parse_pressure(proc_file.read())) // 2
+            except OSError:
+                self._log.exception("The %s pressure is not available", resource)
+                continue
+            keys = []
+            for line in ("some", "full")[:lines]:
+                keys += ["{}_{}_avg10".format(resource, line)]
+                keys += ["{}_{}_us".format(resource, line)]
+            self.pressure[resource] = (proc_file, keys)
+        self.vmstat = analytics_procfs.ProcFile(
+            os.path.join(analytics_procfs.PROC, "vmstat")
+        )
+
+        self.record = {}
+        for _proc_file, keys in self.pressure.values():
+            self.record.update(dict.fromkeys(keys, 0))
+        self.record.update(dict.fromkeys(VMSTAT_COUNTERS, 0))
+        # The keys of the delta-encoded fields, in the order of the totals
+        self._delta_keys = [
+            key for _proc_file, keys in self.pressure.values() for key in keys[1::2]
+        ]
+        self._delta_keys += VMSTAT_COUNTERS
+        self._totals = None
+
+        # File descriptor -> (resource, trigger)
+        self.triggers = {}
+        for resource, trigger in options.get("triggers", []):
+            self.add_trigger(resource, trigger)
+
+    def add_trigger(self, resource, trigger):
+        """Register a PSI trigger.
+
+        Args:
+            resource (str): Either ``cpu``, ``memory``, or ``io``.
+            trigger (str): The trigger, ``<some|full> <stall us> <window us>``.
+        """
+        path = os.path.join(analytics_procfs.PROC, "pressure", resource)
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            self._log.exception("Cannot open %s for the trigger %r", path, trigger)
+            return
+        try:
+            os.write(fd, trigger.encode() + b"\0")
+        except OSError:
+            self._log.exception("Cannot add the %s trigger %r", resource, trigger)
+            os.close(fd)
+            return
+        self.triggers[fd] = (resource, trigger)
+
+    def sample(self):
+        """Read the pressure and the vmstat counters since the previous sample.
+
+        Returns:
+            dict: The record, which is updated in place by the next sample.
+        """
+        totals = []
+        record = self.record
+        for proc_file, keys in self.pressure.values():
+            values = parse_pressure(proc_file.read())
+            for key, value in zip(keys[::2], values[::2]):
+                record[key] = value
+            totals += values[1::2]
+
+        counters = self.vmstat.read().split()
+        counters = dict(zip(counters[::2], counters[1::2]))
+        for names in VMSTAT_COUNTERS.values():
+            totals.append(sum(int(counters.get(name, 0)) for name in names))
+
+        previous = self._totals or totals
+        self._totals = totals
+        for key, total, old_total in zip(self._delta_keys, totals, previous):
+            record[key] = total - old_total
+        return record
+
+    def run(self):
+        """Write a record every ``interval`` seconds and whenever a trigger fires."""
+        self._log.debug("Starting pressure_tracking")
+        poller = select.poll()
+        for fd in self.triggers:
+            poller.register(fd, select.POLLPRI)
+
+        deadline = monotonic()
+        while True:
+            now = monotonic()
+            if now >= deadline:
+                self._emit(self.sample())
+                # Skip the samples which were missed rather than catching up
+                deadline = max(deadline + self.interval, now)
+                continue
+            if not self.triggers:
+                sleep(deadline - now)
+                continue
+            for fd, events in poller.poll((deadline - now) * 1000):
+                resource, trigger = self.triggers[fd]
+                if events & (select.POLLERR | select.POLLNVAL):
+                    self._log.error("The %s trigger %r was removed", resource, trigger)
+                    poller.unregister(fd)
+                    del self.triggers[fd]
+                    os.close(fd)
+                elif events & select.POLLPRI:
+                    self._emit(
+                        {"event": "stall", "resource": resource, "trigger": trigger}
+                    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] != "None":
+        tracking = PressureTracking(sys.argv[1])
+    else:
+        tracking = PressureTracking(None)
+    tracking.run()
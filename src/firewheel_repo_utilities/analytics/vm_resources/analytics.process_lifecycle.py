@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Track the processes which start and stop on the VM, without tracing them.
+
+Each ``exec`` and exit is written as a record to
+``/opt/analytics/process_lifecycle.log``::
+
+    {"event": "exec", "pid": 1234, "ppid": 1, "uid": 0, "cmdline": "sleep 10"}
+    {"event": "exit", "pid": 1234, "ppid": 1, "cmdline": "sleep 10", "exit_code": 0, "signal": 0}
+
+The events are received from the kernel's netlink proc connector, which reports
+every fork, ``exec``, and exit as it happens (this requires ``CAP_NET_ADMIN``). The
+receive buffer is enlarged to absorb fork storms, and if it still overflows, a
+``{"event": "lost", "overflows": <n>}`` record is written, so events are never
+dropped silently.
+
+If the proc connector is not available, ``/proc`` is listed every ``interval``
+seconds instead, and only the PIDs which were not seen before are read. This
+cannot see the exit code or an ``exec`` which does not start a new PID, and misses
+the processes which start and exit between two listings, so the forks (including
+new threads) counted by ``/proc/stat`` which did not appear as a new PID are
+written as ``{"event": "unseen", "forks": <n>}``.
+"""
+
+import os
+import sys
+import errno
+import socket
+import struct
+import logging
+from time import sleep
+
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
+
+PROC = "/proc"
+
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN = 1
+NLMSG_DONE = 3
+
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+
+# length, type, flags, sequence, port
+NLMSG_HEADER = struct.Struct("=IHHII")
+# index, value, sequence, acknowledgement, length, flags
+CN_MSG = struct.Struct("=IIIIHH")
+# The event type, followed by the CPU and timestamp, then the event's data
+EVENT_TYPE = struct.Struct("=I")
+EVENT_DATA = struct.Struct("=IIII")
+_EVENT_OFFSET = NLMSG_HEADER.size + CN_MSG.size
+_DATA_OFFSET = _EVENT_OFFSET + 16
+
+# The receive buffer of the netlink socket, which holds about 100,000 events
+RECEIVE_BUFFER = 16 << 20
+
+# The methods of receiving the events, in the order that ``auto`` tries them
+METHODS = ["netlink", "proc"]
+
+
+def read_cmdline(pid):
+    """Read the command line of a process.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        str: The arguments joined by spaces, or ``None`` if the process has already
+        exited or is a kernel thread.
+    """
+    try:
+        with open("{}/{}/cmdline".format(PROC, pid), "rb") as cmdline:
+            arguments = cmdline.read()
+    except OSError:
+        return None
+    return arguments.rstrip(b"\0").replace(b"\0", b" ").decode(errors="replace") or None
+
+
+def read_stat(pid):
+    """Read the name and parent of a process from ``/proc/<pid>/stat``.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        tuple: The name and the parent PID, or ``None`` if the process is gone.
+    """
+    try:
+        with open("{}/{}/stat".format(PROC, pid), "rb") as stat:
+            fields = stat.read()
+    except OSError:
+        return None
+    # The name is in parentheses and can itself contain spaces and parentheses
+    end = fields.rfind(b")")
+    return (
+        fields[fields.find(b"(") + 1 : end].decode(errors="replace"),
+        int(fields[end + 2 :].split(None, 2)[1]),
+    )
+
+
+def read_uid(pid):
+    """Read the effective user ID of a process.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        int: The user ID, or ``None`` if the process is gone.
+    """
+    try:
+        return os.stat("{}/{}".format(PROC, pid)).st_uid
+    except OSError:
+        return None
+
+
+def read_forks():
+    """Read the number of forks since boot from ``/proc/stat``.
+
+    Returns:
+        int: The number of processes and threads created.
+    """
+    with open(PROC + "/stat", "rb") as stat:
+        for line in stat:
+            if line.startswith(b"processes "):
+                return int(line.split()[1])
+    return 0
+
+
+def list_pids():
+    """List the processes which are running.
+
+    Returns:
+        set: The process IDs.
+    """
+    return {int(name) for name in os.listdir(PROC) if name.isdigit()}
+
+
+def subscribe():
+    """Subscribe to the events of the netlink proc connector.
+
+    Returns:
+        socket.socket: The socket on which the events are received.
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+    try:
+        # Exceed rmem_max, which requires CAP_NET_ADMIN like the connector itself
+        sock.setsockopt(socket.SOL_SOCKET, 33, RECEIVE_BUFFER)  # SO_RCVBUFFORCE
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    sock.bind((os.getpid(), CN_IDX_PROC))
+    listen = struct.pack("=I", PROC_CN_MCAST_LISTEN)
+    message = CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(listen), 0) + listen
+    sock.send(
+        NLMSG_HEADER.pack(
+            NLMSG_HEADER.size + len(message), NLMSG_DONE, 0, 0, os.getpid()
+        )
+        + message
+    )
+    return sock
+
+
+class ProcessLifecycleTracking:
+    """
+    This VMR writes a record whenever a process calls ``exec`` or exits.
+    It reads its options from a file containing a pickled dictionary.
+
+    The dictionary that is expected is as follows::
+
+        {
+            'method': <optional string, either 'netlink', 'proc', or 'auto' to try
+                'netlink' then 'proc'. Default 'auto'.>,
+            'interval': <optional number of seconds between listing /proc with the
+                'proc' method. Default 1 second.>,
+            'lean': <optional bool to write the records with analytics_records.
+                Default False.>,
+            'transport': <optional URL to also send the lean records to.>,
+            'path': <optional log file. Default /opt/analytics/process_lifecycle.log>
+        }
+    """
+
+    def __init__(self, options_filename):
+        """Load the options and set up the records.
+
+        Args:
+            options_filename (str): A path to a file which contains the expected
+                parameters, or ``None`` for the defaults.
+        """
+        options = {}
+        if options_filename is not None:
+            import pickle  # noqa: PLC0415
+
+            with open(options_filename, "rb") as fhand:
+                options = pickle.load(fhand)
+        self.method = options.get("method", "auto")
+        self.interval = options.get("interval", 1)
+        path = options.get("path", "/opt/analytics/process_lifecycle.log")
+        # PID -> [parent PID, command line] of the processes seen so far
+        self.processes = {}
+        self.overflows = 0
+
+        self._log = logging.getLogger("process_lifecycle")
+        self._log.setLevel(logging.DEBUG)
+        if options.get("lean"):
+            import analytics_records  # noqa: PLC0415
+
+            self._emit = analytics_records.RecordEmitter(
+                analytics_records.open_streams(
+                    path, stdout=False, transport=options.get("transport")
+                )
+            ).emit
+            return
+
+        formatter = JsonFormatter(
+            "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
+            static_fields={"hostname": os.uname().nodename},
+        )
+        file_handler = logging.FileHandler(path)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+        self._log.addHandler(file_handler)
+        self._emit = self._log.debug
+
+    def run(self):
+        """Write the events with the proc connector if possible, else from /proc.
+
+        Raises:
+            OSError: If the ``netlink`` method was requested but is not available.
+        """
+        if self.method in {"auto", "netlink"}:
+            try:
+                sock = subscribe()
+            except OSError:
+                if self.method == "netlink":
+                    raise
+                self._log.exception("The proc connector is not available")
+            else:
+                self._emit({"event": "start", "method": "netlink"})
+                self.receive(sock)
+                return
+        self._emit({"event": "start", "method": "proc"})
+        self.poll()
+
+    def receive(self, sock):
+        """Write the events received from the proc connector.
+
+        Args:
+            sock (socket.socket): The subscribed socket.
+
+        Raises:
+            OSError: If the socket fails for a reason other than an overflow.
+        """
+        buffer = bytearray(4096)
+        event_type = EVENT_TYPE.unpack_from
+        while True:
+            try:
+                size = sock.recv_into(buffer)
+            except OSError as error:
+                if error.errno != errno.ENOBUFS:
+                    raise
+                self.overflows += 1
+                self._emit({"event": "lost", "overflows": self.overflows})
+                continue
+            if size >= _DATA_OFFSET + EVENT_DATA.size:
+                self.handle(event_type(buffer, _EVENT_OFFSET)[0], buffer)
+
+    def handle(self, what, buffer):
+        """Update the processes and write the record of a proc connector event.
+
+        Args:
+            what (int): The type of the event.
+            buffer (bytearray): The netlink message containing the event.
+        """
+        if what == PROC_EVENT_FORK:
+            _, parent, child_pid, child = EVENT_DATA.unpack_from(buffer, _DATA_OFFSET)
+            # Ignore new threads
+            if child_pid == child:
+                inherited = self.processes.get(parent)
+                self.processes[child] = [parent, inherited and inherited[1]]
+        elif what == PROC_EVENT_EXEC:
+            pid = EVENT_DATA.unpack_from(buffer, _DATA_OFFSET)[1]
+            self.exec(pid)
+        elif what == PROC_EVENT_EXIT:
+            thread, pid, status, _ = EVENT_DATA.unpack_from(buffer, _DATA_OFFSET)
+            if thread == pid:
+                self.exit(pid, status)
+
+    def exec(self, pid, ppid=None):
+        """Record a process which called ``exec``.
+
+        Args:
+            pid (int): The process ID.
+            ppid (int): The parent process ID, if already known.
+        """
+        process = self.processes.get(pid)
+        if process is not None:
+            ppid = process[0]
+        elif ppid is None:
+            stat = read_stat(pid)
+            ppid = stat and stat[1]
+        cmdline = read_cmdline(pid)
+        self.processes[pid] = [ppid, cmdline]
+        self._emit(
+            {
+                "event": "exec",
+                "pid": pid,
+                "ppid": ppid,
+                "uid": read_uid(pid),
+                "cmdline": cmdline,
+            }
+        )
+
+    def exit(self, pid, status=None):
+        """Record a process which exited.
+
+        Args:
+            pid (int): The process ID.
+            status (int): The wait status of the process, if known.
+        """
+        process = self.processes.pop(pid, None)
+        if process is None:
+            # The process started before tracking, but is a zombie until reaped
+            stat = read_stat(pid)
+            process = [stat[1], stat[0]] if stat else [None, None]
+        self._emit(
+            {
+                "event": "exit",
+                "pid": pid,
+                "ppid": process[0],
+                "cmdline": process[1],
+                "exit_code": None if status is None else (status >> 8) & 0xFF,
+                "signal": None if status is None else status & 0x7F,
+            }
+        )
+
+    def poll(self):
+        """Write the processes which appear and disappear from /proc."""
+        processes = self.processes
+        for pid in list_pids():
+            stat = read_stat(pid)
+            if stat is not None:
+                processes[pid] = [stat[1], read_cmdline(pid) or stat[0]]
+        forks = read_forks()
+
+        while True:
+            sleep(self.interval)
+            pids = list_pids()
+            for pid in processes.keys() - pids:
+                self.exit(pid)
+            new = pids.difference(processes)
+            for pid in new:
+                stat = read_stat(pid)
+                if stat is not None:
+                    self.exec(pid, stat[1])
+            total = read_forks()
+            unseen = total - forks - len(new)
+            forks = total
+            if unseen > 0:
+                self._emit({"event": "unseen", "forks": unseen})
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] != "None":
+        tracking = ProcessLifecycleTracking(sys.argv[1])
+    else:
+        tracking = ProcessLifecycleTracking(None)
+    tracking.run()
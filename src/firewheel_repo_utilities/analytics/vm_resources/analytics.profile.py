@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import runpy
+import signal
+import argparse
+
+# pylint: disable=consider-using-f-string
+
+PROFILE_DIR = os.environ.get("ANALYTICS_PROFILE_DIR", "/opt/analytics/profiles")
+
+
+class Profiler:
+    """
+    This VMR runs another analytics VM resource under
+    `cProfile <https://docs.python.org/3/library/profile.html>`_ and/or
+    `tracemalloc <https://docs.python.org/3/library/tracemalloc.html>`_.
+
+    The profiles are written to ``/opt/analytics/profiles/<name>.<pid>.pstats`` and
+    the top allocation sites to ``/opt/analytics/profiles/<name>.<pid>.tracemalloc.json``.
+    They are rewritten every ``interval`` seconds, whenever the process receives
+    ``SIGUSR1``, and when the script exits (including on ``SIGTERM``). The directory
+    can be changed with the ``ANALYTICS_PROFILE_DIR`` environment variable.
+
+    Usage::
+
+        analytics.profile.py [--cpu] [--memory] [--interval <sec>] [--top <n>]
+            [--name <name>] <script> [<script arguments> ...]
+
+    If neither ``--cpu`` nor ``--memory`` is given, the ``ANALYTICS_PROFILE``
+    environment variable is used instead (e.g. ``ANALYTICS_PROFILE=cpu,memory``). If
+    that is also unset, the script is run without any profiling.
+
+    Note:
+        ``cProfile`` only profiles the main thread of the script, while
+        ``tracemalloc`` tracks the allocations of every thread.
+    """
+
+    def __init__(self, name, cpu, memory, top):
+        """Set up the requested profilers.
+
+        Args:
+            name (str): The name used for the profile files.
+            cpu (bool): Whether to profile with ``cProfile``.
+            memory (bool): Whether to trace allocations with ``tracemalloc``.
+            top (int): The number of allocation sites to record.
+        """
+        self.prefix = os.path.join(PROFILE_DIR, "{}.{}".format(name, os.getpid()))
+        self.top = top
+        self.cpu_profiler = None
+        self.tracemalloc = None
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if cpu:
+            import cProfile  # noqa: PLC0415
+
+            self.cpu_profiler = cProfile.Profile()
+        if memory:
+            import tracemalloc  # noqa: PLC0415
+
+            self.tracemalloc = tracemalloc
+
+    def start(self):
+        """Start profiling the current thread."""
+        if self.tracemalloc is not None:
+            self.tracemalloc.start(10)
+        if self.cpu_profiler is not None:
+            self.cpu_profiler.enable()
+
+    def dump(self, *_args):
+        """Write the profiles collected so far.
+
+        Args:
+            *_args (list): Ignored, this allows this method to be used as a signal handler.
+        """
+        # Pause cProfile so that the dump itself isn't profiled
+        if self.cpu_profiler is not None:
+            self.cpu_profiler.disable()
+            self._write(".pstats", self.cpu_profiler.dump_stats)
+
+        if self.tracemalloc is not None and self.tracemalloc.is_tracing():
+            # Ignore allocations made by the profilers themselves
+            ignored = [self.tracemalloc.__file__, __file__]
+            if self.cpu_profiler is not None:
+                ignored.append(sys.modules["cProfile"].__file__)
+            snapshot = self.tracemalloc.take_snapshot().filter_traces(
+                [self.tracemalloc.Filter(False, filename) for filename in ignored]
+            )
+            current, peak = self.tracemalloc.get_traced_memory()
+            report = {
+                "traced_current": current,
+                "traced_peak": peak,
+                "sites": [
+                    {
+                        "file": stat.traceback[0].filename,
+                        "line": stat.traceback[0].lineno,
+                        "size": stat.size,
+                        "count": stat.count,
+                    }
+                    for stat in snapshot.statistics("lineno")[: self.top]
+                ],
+            }
+
+            def write_report(path):
+                with open(path, "w", encoding="utf-8") as fhand:
+                    json.dump(report, fhand, indent=1)
+
+            self._write(".tracemalloc.json", write_report)
+
+        if self.cpu_profiler is not None:
+            self.cpu_profiler.enable()
+
+    def _write(self, suffix, writer):
+        """Atomically write one of the profile files.
+
+        Args:
+            suffix (str): The suffix of the profile file.
+            writer (function): Called with a temporary path to write to.
+        """
+        path = self.prefix + suffix
+        writer(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+
+def main():
+    """Parse the arguments and run the script under the requested profilers."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--interval", type=int, default=300)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--name")
+    parser.add_argument("script")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if not (args.cpu or args.memory):
+        modes = os.environ.get("ANALYTICS_PROFILE", "").split(",")
+        args.cpu = "cpu" in modes
+        args.memory = "memory" in modes
+
+    name = args.name or os.path.basename(args.script).rsplit(".py", 1)[0]
+    sys.argv = [args.script, *args.arguments]
+
+    if not (args.cpu or args.memory):
+        runpy.run_path(args.script, run_name="__main__")
+        return
+
+    profiler = Profiler(name, args.cpu, args.memory, args.top)
+
+    # Dump from the main thread (which is the thread being profiled) via signals,
+    # interrupted sleeps and system calls are automatically resumed (PEP 475).
+    signal.signal(signal.SIGUSR1, profiler.dump)
+    signal.signal(signal.SIGALRM, profiler.dump)
+    signal.signal(signal.SIGTERM, lambda signum, _frame: sys.exit(128 + signum))
+    if args.interval > 0:
+        signal.setitimer(signal.ITIMER_REAL, args.interval, args.interval)
+
+    profiler.start()
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        profiler.dump()
+
+
+if __name__ == "__main__":
+    main()
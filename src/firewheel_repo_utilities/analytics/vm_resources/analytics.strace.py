@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 import os
+import re
 import sys
-import pickle
 import logging
-import platform
 import threading
 from time import sleep
 from queue import Queue
 from subprocess import PIPE, Popen, CalledProcessError, check_output
 
-from pythonjsonlogger.json import JsonFormatter
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
+
+# Matched processes whose command contains any of these are not traced
+EXCLUDE_FILTERS = ["strace", "tail"]
+
+# The flags of a (str) regex without inline global flags (e.g. ``(?i)``), which
+# would apply to every regex combined with it
+DEFAULT_REGEX_FLAGS = re.UNICODE
+
+# A (possibly) numbered or named backreference, which would refer to the wrong group
+# once the regex is combined with others
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
 
 
 class Strace:
@@ -28,10 +42,14 @@ class Strace:
         'options': <optional string or list of options to overwrite the default ones
             (except for ``-p`` and ``-o``). i.e. ``'-f -e trace=network,process,file'``
             or   ``['-f', '-e', 'trace=network,process,file']``>,
+        'command': <optional command to start under strace instead of attaching to
+            the processes matched by pgrep, which lets ``--seccomp-bpf`` take effect>,
     }
     default execution is:
         ``strace -ff -tt -s 1024 -o <output_dir>/<matched process's command>.trace
             -p <pid of matched process>``
+    or, with a ``command``:
+        ``strace <options> -o <output_dir>/<command>.trace -- <command>``
 
     """
 
@@ -46,14 +64,15 @@ class Strace:
         self._log.setLevel(logging.DEBUG)
         formatter = JsonFormatter(
             "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
-            static_fields={"hostname": platform.node()},
+            static_fields={"hostname": os.uname().nodename},
         )
 
-        # Add logging to stdout
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(logging.DEBUG)
-        console_handler.setFormatter(formatter)
-        self._log.addHandler(console_handler)
+        # Add logging to stdout, once for all of the requests of StraceDiscovery
+        if not self._log.handlers:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setLevel(logging.DEBUG)
+            console_handler.setFormatter(formatter)
+            self._log.addHandler(console_handler)
 
         self.running_straces = (
             Queue()
@@ -65,6 +84,7 @@ class Strace:
         self.process_regex = None
         self.output_dir = None
         self.options = None
+        self.command = None
         self.stop_pgrep = False
 
     def _assign_parameters(self):
@@ -73,6 +93,8 @@ class Strace:
         Returns:
             bool: True if all required options were provided, False otherwise.
         """
+        import pickle  # noqa: PLC0415
+
         strace_args = None
         try:
             with open(self.options_filename, "rb") as fhand:
@@ -100,6 +122,7 @@ class Strace:
         self.process_regex = strace_args["process_regex"]
         self.first_match_only = strace_args["first_match_only"]
         self.output_dir = strace_args["output_dir"]
+        self.command = strace_args.get("command")
 
         # Use user supplied options if they exist, otherwise use the default options
         if "options" in strace_args:
@@ -119,8 +142,13 @@ class Strace:
 
         self.strace_command += self.options
 
-        pgrep_thread = threading.Thread(target=self._check_pgrep)
-        pgrep_thread.start()
+        if self.command:
+            # Start the command under strace rather than searching for it
+            self.first_match_only = True
+            self._execute_strace(None, self.command)
+        else:
+            pgrep_thread = threading.Thread(target=self._check_pgrep)
+            pgrep_thread.start()
 
         # Block until the pgrep thread has found a match and created a process
         while self.running_straces.empty():
@@ -129,113 +157,133 @@ class Strace:
         # Only exit when the queue has been emptied and we only were wanting the first match.
         # Otherwise keep running
         while not (self.running_straces.empty() and self.first_match_only):
-            # Check each process to see if it's still running
-            still_running_straces = []
-            while not self.running_straces.empty():
-                running_strace = self.running_straces.get()
-
-                if running_strace.poll() is not None:
-                    # It's actually a terminated_strace. Get and log the output
-                    stdout_data, stderr_data = running_strace.communicate()
-                    if stdout_data:
-                        self._log.debug(
-                            "Executed strace output",
-                            {
-                                "fd": "stdout",
-                                "pid": running_strace.pid,
-                                "msg": stdout_data,
-                            },
-                        )
-                    if stderr_data:
-                        self._log.debug(
-                            "Executed strace output",
-                            {
-                                "fd": "stderr",
-                                "pid": running_strace.pid,
-                                "msg": stderr_data,
-                            },
-                        )
-                else:
-                    still_running_straces.append(running_strace)
+            self._reap_straces()
+            sleep(30)
 
-            # Put them all back into the queue
-            for still_running in still_running_straces:
-                self.running_straces.put(still_running)
+    def _reap_straces(self):
+        """Log the output of each ``strace`` which has terminated."""
+        # Check each process to see if it's still running
+        still_running_straces = []
+        while not self.running_straces.empty():
+            running_strace = self.running_straces.get()
+
+            if running_strace.poll() is not None:
+                # It's actually a terminated_strace. Get and log the output
+                stdout_data, stderr_data = running_strace.communicate()
+                if stdout_data:
+                    self._log.debug(
+                        "Executed strace output",
+                        {
+                            "fd": "stdout",
+                            "pid": running_strace.pid,
+                            "msg": stdout_data,
+                        },
+                    )
+                if stderr_data:
+                    self._log.debug(
+                        "Executed strace output",
+                        {
+                            "fd": "stderr",
+                            "pid": running_strace.pid,
+                            "msg": stderr_data,
+                        },
+                    )
+            else:
+                still_running_straces.append(running_strace)
 
-            sleep(30)
+        # Put them all back into the queue
+        for still_running in still_running_straces:
+            self.running_straces.put(still_running)
 
     def _check_pgrep(self):
         """Identify a process using ``pgrep``."""
         # pgrep for a process until a match
         already_matched = {}  # {pid: ['<process>', ...], ...}
-        exclude_filters = ["strace", "tail"]
         previous_pgrep = None
         self.stop_pgrep = False
         while not self.stop_pgrep:
-            try:
-                raw_output = check_output(
-                    ["pgrep", "-l", "-f", "{}".format(self.process_regex)]
-                ).decode()
-                self._log.debug("raw_output: '%s'", raw_output)
-            except CalledProcessError:
-                self._log.debug(
-                    "pgrep found no matching processes for regex '%s'",
-                    self.process_regex,
+            previous_pgrep = self._scan_pgrep(previous_pgrep, already_matched)
+            sleep(1)
+
+    def _scan_pgrep(self, previous_pgrep, already_matched):
+        """Run ``pgrep`` once and start ``strace`` on any newly matched processes.
+
+        Args:
+            previous_pgrep (str): The ``pgrep`` output from the previous scan.
+            already_matched (dict): The commands already traced, keyed by PID.
+                This is updated in place.
+
+        Returns:
+            str: The ``pgrep`` output to compare against on the next scan.
+        """
+        try:
+            raw_output = check_output(
+                ["pgrep", "-l", "-f", "{}".format(self.process_regex)]
+            ).decode()
+            self._log.debug("raw_output: '%s'", raw_output)
+        except CalledProcessError:
+            self._log.debug(
+                "pgrep found no matching processes for regex '%s'",
+                self.process_regex,
+            )
+            return previous_pgrep
+
+        if raw_output == previous_pgrep:
+            return previous_pgrep
+
+        # pgrep returned something new, process it.
+        matches = {}
+        for output_line in raw_output.strip().split("\n"):
+            # Check if this returned processes should be filtered out
+            for exclude_filter in EXCLUDE_FILTERS:
+                if exclude_filter in output_line:
+                    break
+            else:
+                split_output_line = output_line.split()
+                pid, matched_full_command = (
+                    split_output_line[0],
+                    " ".join(split_output_line[1:]),
                 )
-                sleep(1)
-                continue
+                matches[pid] = matched_full_command
 
-            if raw_output != previous_pgrep:
-                # pgrep returned something new, process it.
-                previous_pgrep = raw_output
-
-                matches = {}
-                for output_line in raw_output.strip().split("\n"):
-                    # Check if this returned processes should be filtered out
-                    for exclude_filter in exclude_filters:
-                        if exclude_filter in output_line:
-                            break
-                    else:
-                        split_output_line = output_line.split()
-                        pid, matched_full_command = (
-                            split_output_line[0],
-                            " ".join(split_output_line[1:]),
-                        )
-                        matches[pid] = matched_full_command
+        self._start_matches(matches, already_matched)
+        return raw_output
 
-                if matches:
-                    self._log.debug(matches)
+    def _start_matches(self, matches, already_matched):
+        """Start ``strace`` on each matched process which is not already traced.
 
-                    # Execute the matches
-                    for pid, matched_full_command in matches.items():
-                        if (
-                            pid in already_matched
-                            and matched_full_command in already_matched[pid]
-                        ):
-                            continue
+        Args:
+            matches (dict): The command of each matched process, keyed by PID.
+            already_matched (dict): The commands already traced, keyed by PID.
+                This is updated in place.
+        """
+        if matches:
+            self._log.debug(matches)
 
-                        already_matched[pid] = already_matched.get(pid, []).append(
-                            matched_full_command
-                        )
-                        self._execute_strace(pid, matched_full_command)
+            # Execute the matches
+            for pid, matched_full_command in matches.items():
+                if matched_full_command in already_matched.get(pid, []):
+                    continue
 
-                        with open(
-                            os.path.join(self.output_dir, "command_info.log"),
-                            "a",
-                            encoding="utf-8",
-                        ) as info_log:
-                            info_log.write("{},{}\n".format(pid, matched_full_command))
+                already_matched.setdefault(pid, []).append(matched_full_command)
+                self._execute_strace(pid, matched_full_command)
 
-                    if self.first_match_only:
-                        self.stop_pgrep = True
+                with open(
+                    os.path.join(self.output_dir, "command_info.log"),
+                    "a",
+                    encoding="utf-8",
+                ) as info_log:
+                    info_log.write("{},{}\n".format(pid, matched_full_command))
 
-            sleep(1)
+            if self.first_match_only:
+                self.stop_pgrep = True
 
     def _execute_strace(self, pid, matched_full_command):
         """Run the ``strace`` command on the given PID.
 
         Args:
-            pid (int): The process ID to trace
+            pid (int): The process ID to trace, or ``None`` to start
+                ``matched_full_command`` under ``strace``.
             matched_full_command (str): The command of the to-be-traced process.
         """
         env = os.environ.copy()
@@ -251,7 +299,12 @@ class Strace:
 
         current_strace_command = list(self.strace_command)
         current_strace_command += ["-o", os.path.join(self.output_dir, output_filename)]
-        current_strace_command += ["-p", str(pid)]
+        if pid is None:
+            import shlex  # noqa: PLC0415
+
+            current_strace_command += ["--", *shlex.split(matched_full_command)]
+        else:
+            current_strace_command += ["-p", str(pid)]
 
         self._log.debug("Strace to execute: '%s'", " ".join(current_strace_command))
         # pylint: disable=consider-using-with
@@ -261,6 +314,155 @@ class Strace:
         self.running_straces.put(running_process)
 
 
+class StraceDiscovery:
+    """
+    This agent finds the processes for every ``strace`` request on the VM with a
+    single scan of ``/proc`` each second, instead of one ``pgrep`` loop per request.
+
+    Each request is a pickled options file (as read by :py:class:`Strace`) which is
+    moved into ``requests_dir`` when the request should start. The regexes of all of
+    the requests are compiled into one matcher, which filters out the (many)
+    processes that match none of them (a regex with inline global flags or
+    backreferences is searched on its own), and each matching process is then traced
+    with the options and output directory of every request whose own regex it
+    matches. The regexes are matched with :py:mod:`re` against the process's command
+    line, like ``pgrep -f`` does with extended regular expressions.
+    """
+
+    def __init__(self, requests_dir):
+        """Start with no requests.
+
+        Args:
+            requests_dir (str): The directory to which the requests are moved.
+        """
+        self.requests_dir = requests_dir
+        # Filename -> Strace of each loaded request
+        self.requests = {}
+        self.matcher = None
+        self._log = logging.getLogger("strace")
+
+    def load_requests(self):
+        """Load the requests which were added since the last scan."""
+        try:
+            filenames = os.listdir(self.requests_dir)
+        except OSError:
+            return
+        for filename in filenames:
+            if filename in self.requests:
+                continue
+            request = Strace(os.path.join(self.requests_dir, filename))
+            if not request._assign_parameters():
+                # Do not try to load the request again
+                self.requests[filename] = None
+                continue
+            try:
+                request.regex = re.compile(request.process_regex)
+            except re.error:
+                self._log.exception("Invalid process regex in %s", filename)
+                self.requests[filename] = None
+                continue
+            request.strace_command += request.options
+            request.already_matched = {}
+            self.requests[filename] = request
+            self.matcher = None
+
+    def _build_matcher(self, pending):
+        """Combine the regexes of the pending requests into as few as possible.
+
+        A regex with inline global flags or backreferences would change the meaning
+        of the others (or fail to compile, e.g. ``(?i)`` on Python 3.11+) when
+        joined into one alternation, so it is searched on its own instead.
+
+        Args:
+            pending (list): The requests which are still looking for processes.
+
+        Returns:
+            callable: A function which returns whether a command line matches the
+            regex of any of the requests.
+        """
+        combinable = []
+        searches = []
+        for request in pending:
+            if request.regex.flags == DEFAULT_REGEX_FLAGS and not BACKREFERENCE.search(
+                request.process_regex
+            ):
+                combinable.append(request)
+            else:
+                searches.append(request.regex.search)
+        if combinable:
+            try:
+                searches.append(
+                    re.compile(
+                        "|".join(
+                            "(?:{})".format(request.process_regex)
+                            for request in combinable
+                        )
+                    ).search
+                )
+            except re.error:
+                self._log.exception(
+                    "Cannot combine the process regexes, searching each of them"
+                )
+                searches += [request.regex.search for request in combinable]
+        if len(searches) == 1:
+            return searches[0]
+        return lambda command: any(search(command) for search in searches)
+
+    def scan(self):
+        """Read each process's command line and start the requested straces."""
+        pending = [
+            request
+            for request in self.requests.values()
+            if request is not None and not request.stop_pgrep
+        ]
+        if not pending:
+            return
+        if self.matcher is None:
+            self.matcher = self._build_matcher(pending)
+        search = self.matcher
+
+        own_pid = str(os.getpid())
+        matches = {}
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit() or pid == own_pid:
+                continue
+            try:
+                with open("/proc/{}/cmdline".format(pid), "rb") as cmdline_file:
+                    cmdline = cmdline_file.read()
+            except OSError:
+                continue
+            command = (
+                cmdline.rstrip(b"\0").replace(b"\0", b" ").decode(errors="replace")
+            )
+            if not (command and search(command)):
+                continue
+            if any(exclude_filter in command for exclude_filter in EXCLUDE_FILTERS):
+                continue
+            for request in pending:
+                if request.regex.search(command):
+                    matches.setdefault(request, {})[pid] = command
+
+        for request, request_matches in matches.items():
+            request._start_matches(request_matches, request.already_matched)
+            if request.stop_pgrep:
+                # The matcher no longer needs this request's regex
+                self.matcher = None
+
+    def run(self):
+        """Scan for the processes of every request until killed."""
+        while True:
+            self.load_requests()
+            self.scan()
+            for request in self.requests.values():
+                if request is not None:
+                    request._reap_straces()
+            sleep(1)
+
+
 if __name__ == "__main__":
-    strace = Strace(sys.argv[1])
-    strace.run()
+    if sys.argv[1] == "--shared":
+        discovery = StraceDiscovery(sys.argv[2])
+        discovery.run()
+    else:
+        strace = Strace(sys.argv[1])
+        strace.run()
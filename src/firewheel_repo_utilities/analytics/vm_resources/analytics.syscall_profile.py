@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Profile the system calls of every process on the VM, without tracing them.
+
+With `bpftrace <https://github.com/bpftrace/bpftrace>`_, the calls and latency of
+each system call of each process are aggregated in kernel maps (a count, the total
+time, and a log2 histogram of the latency in microseconds), which are printed and
+cleared every ``interval`` seconds. Nothing is copied to user space per call, so the
+overhead is small enough to profile the whole experiment. Each process with calls in
+an interval is written as a record to ``/opt/analytics/syscall_profile.log``::
+
+    {"pid": 1234, "comm": "nginx", "method": "bpftrace", "syscalls": {"read":
+        {"calls": 120, "total_us": 310, "hist_us": {"1": 80, "2": 30, "4": 10}}, ...}}
+
+where ``hist_us`` maps the lower bound of each latency bucket to its calls. The
+system calls are aggregated by number from the single ``raw_syscalls:sys_exit``
+tracepoint, and named with the kernel headers (``asm/unistd_64.h``) or
+``ausyscall`` on the VM; without either, a system call is keyed by its number
+(e.g. ``"0"`` rather than ``"read"``).
+
+If bpftrace is not installed or cannot attach (e.g. the kernel lacks BPF support),
+the ``read`` and ``write`` calls of each process are instead counted from the
+``syscr`` and ``syscw`` fields of ``/proc/<pid>/io`` every ``interval`` seconds,
+with ``"method": "procfs"`` and no latency.
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import shutil
+import logging
+import threading
+from time import sleep
+from subprocess import PIPE, Popen, CalledProcessError, check_output
+from collections import deque
+
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
+
+PROC = "/proc"
+
+# The headers which define the system call numbers (``__NR_<name>``) of the VM
+SYSCALL_HEADERS = [
+    "/usr/include/asm/unistd_64.h",
+    "/usr/include/*-linux-gnu/asm/unistd_64.h",
+    "/usr/include/asm-generic/unistd.h",
+]
+
+# The number of lines at the end of bpftrace's stderr which are logged when it exits
+STDERR_TAIL_LINES = 20
+
+# Record the entry time of every system call, and aggregate each exit by process
+# and system call number. A single raw tracepoint is attached, rather than one
+# ``syscalls:sys_exit_<name>`` tracepoint for each of the (300+) system calls.
+BPFTRACE_PROGRAM = """
+tracepoint:raw_syscalls:sys_enter { @start[tid] = nsecs; }
+tracepoint:raw_syscalls:sys_exit /@start[tid]/ {
+    $us = (nsecs - @start[tid]) / 1000;
+    delete(@start[tid]);
+    @calls[pid, args->id] = count();
+    @us[pid, args->id] = sum($us);
+    @hist[pid, args->id] = hist($us);
+    @comm[pid] = comm;
+}
+tracepoint:sched:sched_process_exit { delete(@start[tid]); }
+interval:s:%d {
+    print(@calls); print(@us); print(@hist); print(@comm);
+    clear(@calls); clear(@us); clear(@hist); clear(@comm);
+    printf("end\\n");
+}
+END { clear(@start); clear(@calls); clear(@us); clear(@hist); clear(@comm); }
+"""
+
+
+def syscall_names():
+    """Map the system call numbers of the VM to their names.
+
+    The numbers are read from the first of :py:data:`SYSCALL_HEADERS` which exists,
+    or else from ``ausyscall --dump``. They are those of the native (e.g. 64-bit)
+    system call table.
+
+    Returns:
+        dict: The name of each system call number, which is empty if neither the
+        headers nor ``ausyscall`` are available.
+    """
+    for pattern in SYSCALL_HEADERS:
+        for path in glob.glob(pattern):
+            with open(path, encoding="utf-8", errors="replace") as header:
+                names = {
+                    int(number): name
+                    for name, number in re.findall(
+                        r"^#define __NR_(\w+)\s+(\d+)\s*$", header.read(), re.M
+                    )
+                }
+            if names:
+                return names
+    try:
+        output = check_output(["ausyscall", "--dump"], stderr=PIPE)
+    except (OSError, CalledProcessError):
+        return {}
+    # The first line names the architecture, then each line is "<number>\t<name>"
+    return {
+        int(fields[0]): fields[1]
+        for fields in (line.split() for line in output.decode().splitlines()[1:])
+        if len(fields) == 2 and fields[0].isdigit()
+    }
+
+
+def _split_key(key, names):
+    """Split a ``pid,id`` map key from bpftrace.
+
+    Args:
+        key (str): The key.
+        names (dict): The name of each system call number.
+
+    Returns:
+        tuple: The process ID and the name (or else the number) of the system call.
+    """
+    pid, number = key.split(",", 1)
+    number = number.strip()
+    return int(pid), names.get(int(number), number)
+
+
+def read_io(pid):
+    """Read the comm and the read and write system calls of a process.
+
+    Args:
+        pid (str): The process ID.
+
+    Returns:
+        tuple: The name, ``syscr``, and ``syscw`` of the process, or ``None`` if it
+        is gone.
+    """
+    try:
+        with open("{}/{}/io".format(PROC, pid), "rb") as io_file:
+            fields = dict(line.split(b": ") for line in io_file.read().splitlines())
+        with open("{}/{}/comm".format(PROC, pid), "rb") as comm:
+            name = comm.read().strip().decode(errors="replace")
+    except (OSError, ValueError):
+        return None
+    return name, int(fields[b"syscr"]), int(fields[b"syscw"])
+
+
+class SyscallProfile:
+    """
+    This VMR writes the system calls of each process every ``interval`` seconds.
+    It reads its options from a file containing a pickled dictionary.
+
+    The dictionary that is expected is as follows::
+
+        {
+            'method': <optional string, either 'bpftrace', 'procfs', or 'auto' to
+                try 'bpftrace' then 'procfs'. Default 'auto'.>,
+            'interval': <optional number of seconds between the records.
+                Default 10 seconds.>,
+            'bpftrace': <optional path to the bpftrace executable. Default
+                'bpftrace' on the PATH.>,
+            'lean': <optional bool to write the records with analytics_records.
+                Default False.>,
+            'transport': <optional URL to also send the lean records to.>,
+            'path': <optional log file. Default /opt/analytics/syscall_profile.log>
+        }
+    """
+
+    def __init__(self, options_filename):
+        """Load the options and set up the records.
+
+        Args:
+            options_filename (str): A path to a file which contains the expected
+                parameters, or ``None`` for the defaults.
+        """
+        options = {}
+        if options_filename is not None:
+            import pickle  # noqa: PLC0415
+
+            with open(options_filename, "rb") as fhand:
+                options = pickle.load(fhand)
+        self.method = options.get("method", "auto")
+        self.interval = options.get("interval", 10)
+        self.bpftrace = options.get("bpftrace") or "bpftrace"
+        self.names = {}
+        path = options.get("path", "/opt/analytics/syscall_profile.log")
+
+        self._log = logging.getLogger("syscall_profile")
+        self._log.setLevel(logging.DEBUG)
+        if options.get("lean"):
+            import analytics_records  # noqa: PLC0415
+
+            self._emit = analytics_records.RecordEmitter(
+                analytics_records.open_streams(
+                    path, stdout=False, transport=options.get("transport")
+                )
+            ).emit
+            return
+
+        formatter = JsonFormatter(
+            "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
+            static_fields={"hostname": os.uname().nodename},
+        )
+        file_handler = logging.FileHandler(path)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+        self._log.addHandler(file_handler)
+        self._emit = self._log.debug
+
+    def run(self):
+        """Profile with bpftrace if possible, else from /proc.
+
+        Raises:
+            RuntimeError: If the ``bpftrace`` method was requested but failed.
+        """
+        if self.method in {"auto", "bpftrace"}:
+            error = self.run_bpftrace()
+            if self.method == "bpftrace":
+                raise RuntimeError("bpftrace failed: {}".format(error))
+            self._log.error("bpftrace failed, using /proc: %s", error)
+        self.run_procfs()
+
+    def run_bpftrace(self):
+        """Write the records printed by bpftrace until it exits.
+
+        The stderr of bpftrace is drained by a thread, so that its warnings can never
+        fill the pipe and block it, and the last :py:data:`STDERR_TAIL_LINES` lines
+        are logged when it exits.
+
+        Returns:
+            str: Why bpftrace exited.
+        """
+        executable = shutil.which(self.bpftrace)
+        if executable is None:
+            return "{} is not installed".format(self.bpftrace)
+        self.names = syscall_names()
+        # pylint: disable=consider-using-with
+        process = Popen(
+            [executable, "-f", "json", "-e", BPFTRACE_PROGRAM % self.interval],
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        drain = threading.Thread(
+            target=stderr_tail.extend, args=(process.stderr,), daemon=True
+        )
+        drain.start()
+        maps = {}
+        for line in process.stdout:
+            try:
+                output = json.loads(line)
+            except ValueError:
+                continue
+            if output.get("type") in {"map", "hist"}:
+                maps.update(output["data"])
+            elif output.get("type") == "printf" and output["data"] == "end\n":
+                self.emit_maps(maps)
+                maps = {}
+        process.wait()
+        drain.join()
+        stderr = b"".join(stderr_tail).decode(errors="replace").strip()
+        self._log.warning(
+            "bpftrace exited with %s: %s", process.returncode, stderr or "no output"
+        )
+        return stderr or "exited with {}".format(process.returncode)
+
+    def emit_maps(self, maps):
+        """Write a record for each process in the maps of one interval.
+
+        Args:
+            maps (dict): The ``@calls``, ``@us``, ``@hist``, and ``@comm`` maps.
+        """
+        processes = {}
+        for key, calls in maps.get("@calls", {}).items():
+            pid, name = _split_key(key, self.names)
+            processes.setdefault(pid, {})[name] = {"calls": calls}
+        for key, total in maps.get("@us", {}).items():
+            pid, name = _split_key(key, self.names)
+            processes.setdefault(pid, {}).setdefault(name, {})["total_us"] = total
+        for key, buckets in maps.get("@hist", {}).items():
+            pid, name = _split_key(key, self.names)
+            processes.setdefault(pid, {}).setdefault(name, {})["hist_us"] = {
+                str(bucket.get("min", 0)): bucket["count"]
+                for bucket in buckets
+                if bucket.get("count")
+            }
+        names = maps.get("@comm", {})
+        for pid, syscalls in processes.items():
+            self._emit(
+                {
+                    "pid": pid,
+                    "comm": names.get(str(pid)),
+                    "method": "bpftrace",
+                    "syscalls": syscalls,
+                }
+            )
+
+    def run_procfs(self):
+        """Write the read and write system calls of each process from /proc."""
+        previous = {}
+        while True:
+            current = {}
+            for pid in os.listdir(PROC):
+                if not pid.isdigit():
+                    continue
+                io_counts = read_io(pid)
+                if io_counts is None:
+                    continue
+                current[pid] = io_counts
+                before = previous.get(pid)
+                if before is None or before[0] != io_counts[0]:
+                    # A new process, or one which called exec, has no delta yet
+                    continue
+                reads = io_counts[1] - before[1]
+                writes = io_counts[2] - before[2]
+                if reads or writes:
+                    self._emit(
+                        {
+                            "pid": int(pid),
+                            "comm": io_counts[0],
+                            "method": "procfs",
+                            "syscalls": {
+                                "read": {"calls": reads},
+                                "write": {"calls": writes},
+                            },
+                        }
+                    )
+            previous = current
+            sleep(self.interval)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] != "None":
+        profile = SyscallProfile(sys.argv[1])
+    else:
+        profile = SyscallProfile(None)
+    profile.run()
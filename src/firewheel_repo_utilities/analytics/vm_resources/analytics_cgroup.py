@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Run the analytics processes in a cgroup v2 slice with a resource budget.
+
+The slice is created (once, before the experiment starts) with a CPU quota and,
+optionally, ``--memory`` (a limit) and ``--io-weight``::
+
+    python3 analytics_cgroup.py create /sys/fs/cgroup/analytics.slice --cpu 0.25
+
+Each analytics process is then started in it, and its children (e.g. the
+``strace`` started by ``analytics.strace.py``) inherit it::
+
+    python3 analytics_cgroup.py exec /sys/fs/cgroup/analytics.slice tcpdump -U ...
+
+If the slice cannot be created or joined (e.g. the VM does not use cgroup v2), the
+error is printed but ``create`` still succeeds, and the command is started anyway,
+outside of the slice.
+
+The collectors read the slice's throttling statistics back with
+:py:class:`ThrottleStats`, so that the samples which the budget delayed can be told
+apart from the workload.
+"""
+
+import os
+import sys
+
+# The length of the period of ``cpu.max``, in microseconds
+CPU_PERIOD_USEC = 100000
+
+
+def _write(path, name, value):
+    with open(os.path.join(path, name), "w", encoding="utf-8") as control:
+        control.write(value)
+
+
+def _read_keyed(path, name):
+    """Read a flat keyed cgroup file (e.g. ``cpu.stat``).
+
+    Args:
+        path (str): The path to the cgroup.
+        name (str): The name of the file.
+
+    Returns:
+        dict: The integer value of each key.
+    """
+    with open(os.path.join(path, name), "rb") as keyed:
+        return {
+            key.decode(): int(value)
+            for key, value in (line.split() for line in keyed.read().splitlines())
+        }
+
+
+def create(path, cpu=None, memory=None, io_weight=None):
+    """Create a cgroup with a resource budget.
+
+    The controllers for the given limits are enabled in the parent cgroup. A limit
+    which cannot be set (e.g. ``io.weight`` without a scheduler which supports it)
+    is reported but does not stop the others from being set.
+
+    Args:
+        path (str): The path of the cgroup to create, in a cgroup v2 hierarchy.
+        cpu (float): The CPUs which the cgroup may use, e.g. ``0.25`` for a quarter
+            of one CPU. Defaults to no limit.
+        memory (str): The most memory which the cgroup may use, in bytes or with a
+            ``K``, ``M``, or ``G`` suffix. Defaults to no limit.
+        io_weight (int): The cgroup's weight for I/O, from ``1`` to ``10000``
+            (the default weight is ``100``). Defaults to the default weight.
+
+    Returns:
+        list: The errors of the limits which could not be set.
+    """
+    limits = {}
+    if cpu is not None:
+        limits["cpu.max"] = "{} {}".format(int(cpu * CPU_PERIOD_USEC), CPU_PERIOD_USEC)
+    if memory is not None:
+        limits["memory.max"] = str(memory)
+    if io_weight is not None:
+        limits["io.weight"] = "default {}".format(io_weight)
+
+    parent = os.path.dirname(path.rstrip("/"))
+    with open(os.path.join(parent, "cgroup.controllers"), encoding="utf-8") as fhand:
+        available = set(fhand.read().split())
+    controllers = {name.split(".")[0] for name in limits} & available
+    if controllers:
+        _write(
+            parent,
+            "cgroup.subtree_control",
+            " ".join("+{}".format(name) for name in sorted(controllers)),
+        )
+    os.makedirs(path, exist_ok=True)
+
+    errors = []
+    for name, value in limits.items():
+        try:
+            _write(path, name, value)
+        except OSError as error:
+            errors.append("{} = {!r}: {}".format(name, value, error))
+    return errors
+
+
+def join(path, pid=0):
+    """Move a process into a cgroup.
+
+    Args:
+        path (str): The path to the cgroup.
+        pid (int): The process to move. Defaults to the calling process.
+
+    Returns:
+        bool: Whether the process was moved.
+    """
+    try:
+        _write(path, "cgroup.procs", str(pid or os.getpid()))
+    except OSError:
+        return False
+    return True
+
+
+class ThrottleStats:
+    """Read how much a cgroup's budget has limited it since the last sample."""
+
+    def __init__(self, path):
+        """Take the first reading of the cgroup's statistics.
+
+        Args:
+            path (str): The path to the cgroup.
+        """
+        self.path = path
+        self._previous = self.read()
+
+    def read(self):
+        """Read the cumulative throttling statistics of the cgroup.
+
+        Returns:
+            dict: ``nr_periods``, ``nr_throttled``, and ``throttled_usec`` from
+            ``cpu.stat``, and ``memory_high``, ``memory_max``, and ``oom_kill``
+            from ``memory.events``, for those controllers which are enabled.
+        """
+        stats = {}
+        try:
+            cpu = _read_keyed(self.path, "cpu.stat")
+        except OSError:
+            cpu = {}
+        for key in ("nr_periods", "nr_throttled", "throttled_usec"):
+            if key in cpu:
+                stats[key] = cpu[key]
+        try:
+            events = _read_keyed(self.path, "memory.events")
+        except OSError:
+            events = {}
+        for key in ("high", "max", "oom_kill"):
+            if key in events:
+                stats[key if key == "oom_kill" else "memory_" + key] = events[key]
+        return stats
+
+    def sample(self):
+        """Read the statistics and the current memory usage of the cgroup.
+
+        Returns:
+            dict: The change in each statistic since the previous sample, and
+            ``memory_current``, or ``None`` if the cgroup cannot be read.
+        """
+        current = self.read()
+        if not current:
+            return None
+        stats = {
+            key: value - self._previous.get(key, 0) for key, value in current.items()
+        }
+        self._previous = current
+        try:
+            with open(os.path.join(self.path, "memory.current"), "rb") as fhand:
+                stats["memory_current"] = int(fhand.read())
+        except OSError:
+            pass
+        return stats
+
+
+def main(argv):
+    """Create a cgroup, or run a command in one.
+
+    Args:
+        argv (list): The command line arguments, without the program name.
+    """
+    import argparse  # noqa: PLC0415
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+    create_parser = commands.add_parser("create", help="Create a cgroup.")
+    create_parser.add_argument("path")
+    create_parser.add_argument("--cpu", type=float)
+    create_parser.add_argument("--memory")
+    create_parser.add_argument("--io-weight", type=int)
+    exec_parser = commands.add_parser("exec", help="Run a command in a cgroup.")
+    exec_parser.add_argument("path")
+    exec_parser.add_argument("argv", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        try:
+            errors = create(args.path, args.cpu, args.memory, args.io_weight)
+        except OSError as error:
+            # Not fatal: ``exec`` then runs the analytics outside of the slice
+            print("Cannot create {}: {}".format(args.path, error), file=sys.stderr)
+            return
+        for error in errors:
+            print("Cannot set {}".format(error), file=sys.stderr)
+        return
+
+    if not join(args.path):
+        print(
+            "Cannot join {}, running {} outside of it".format(args.path, args.argv[0]),
+            file=sys.stderr,
+        )
+    sys.stdout.flush()
+    os.execvp(args.argv[0], args.argv)  # noqa: S606
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
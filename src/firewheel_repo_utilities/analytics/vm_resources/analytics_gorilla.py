@@ -0,0 +1,438 @@
+"""
+Compress metric samples with the Gorilla time series encoding.
+
+The samples of the analytics collectors (CPU percentages, memory fields, and disk and
+network counters) are slowly varying numbers taken at regular intervals, which the
+encoding from `Gorilla <https://www.vldb.org/pvldb/vol8/p1816-teller.pdf>`_ stores in
+a byte or two per value rather than the tens of bytes of JSON:
+
+* Timestamps (as integers in units of ``10 ** -resolution`` seconds, milliseconds by
+  default) are stored as the difference between consecutive deltas, which is ``0``
+  (a single bit) for a perfectly regular interval and small for one with a little
+  jitter.
+* Values (as ``float64``) are XORed with the previous value, and only the bits which
+  differ are stored, which is a single bit when the value is unchanged.
+
+The samples of a collector share their timestamps, so they are encoded as rows of a
+table (a timestamp and one value per field) in which each column is compressed
+separately. A column of decimals (such as percentages rounded to one decimal place)
+has most of its mantissa bits change from sample to sample, so when it can be done
+exactly, such a column is first scaled to integers (e.g. ``12.3`` is stored as
+``123``), which leaves only a few bits to store.
+
+Rows are encoded in independent blocks, so that a reader can start at any block::
+
+    magic (b"GOR1") | rows (uint32) | columns (uint8) | resolution (uint8) |
+    decimal places of each column (uint8, 255 if not scaled) | bits ...
+
+:py:class:`Encoder` writes blocks of up to ``block_rows`` rows to a binary stream,
+each preceded by its length (uint32), and :py:class:`Decoder` reads them back.
+
+Note:
+    Values are stored and decoded as ``float64``, so integers larger than
+    ``2 ** 53`` lose precision.
+"""
+
+import math
+import struct
+
+MAGIC = b"GOR1"
+
+# magic, rows, columns, timestamp resolution (as a power of ten)
+BLOCK_HEADER = struct.Struct("!4sIBB")
+
+# The length which precedes each block in a stream
+BLOCK_LENGTH = struct.Struct("!I")
+
+# The most decimal places to which a column is scaled, and the marker for unscaled
+MAX_DECIMALS = 6
+UNSCALED = 255
+
+_DOUBLE = struct.Struct("!d")
+_UINT64 = struct.Struct("!Q")
+
+# The prefix, prefix width, and value width of each delta-of-delta bucket after "0"
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12), (0b11110, 5, 20))
+
+
+class BitWriter:
+    """Pack values of any width into bytes, most significant bit first."""
+
+    def __init__(self):
+        """Start with no bits."""
+        self.buffer = bytearray()
+        self._bits = 0
+        self._count = 0
+
+    def write(self, value, width):
+        """
+        Append the low ``width`` bits of ``value``.
+
+        Args:
+            value (int): A non-negative value which fits in ``width`` bits.
+            width (int): The number of bits to write.
+        """
+        self._bits = (self._bits << width) | value
+        self._count += width
+        if self._count >= 64:
+            spare = self._count & 7
+            self.buffer += (self._bits >> spare).to_bytes(self._count >> 3, "big")
+            self._bits &= (1 << spare) - 1
+            self._count = spare
+
+    def getvalue(self):
+        """
+        Get the bytes written so far, padding the last byte with zeros.
+
+        Returns:
+            bytes: The packed bits.
+        """
+        padding = -self._count & 7
+        tail = (self._bits << padding).to_bytes((self._count + padding) >> 3, "big")
+        return bytes(self.buffer) + tail
+
+
+class BitReader:
+    """Unpack values of any width from bytes, most significant bit first."""
+
+    def __init__(self, data, offset=0):
+        """
+        Start reading at ``offset``.
+
+        Args:
+            data (bytes): The packed bits.
+            offset (int): The byte at which to start.
+        """
+        self.data = data
+        self.position = offset
+        self._bits = 0
+        self._count = 0
+
+    def read(self, width):
+        """
+        Read the next ``width`` bits.
+
+        Args:
+            width (int): The number of bits to read.
+
+        Returns:
+            int: The bits as a non-negative integer.
+
+        Raises:
+            ValueError: If there are not enough bits left.
+        """
+        while self._count < width:
+            chunk = self.data[self.position : self.position + 8]
+            if not chunk:
+                raise ValueError("Truncated Gorilla block")
+            self.position += len(chunk)
+            self._bits = (self._bits << (len(chunk) * 8)) | int.from_bytes(chunk, "big")
+            self._count += len(chunk) * 8
+        self._count -= width
+        value = self._bits >> self._count
+        self._bits &= (1 << self._count) - 1
+        return value
+
+
+def _decimals(values):
+    """
+    Find the fewest decimal places to which every value can be scaled exactly.
+
+    Args:
+        values (list): The values of a column.
+
+    Returns:
+        int: The number of decimal places, or :py:data:`UNSCALED`.
+    """
+    if any(value == 0 and math.copysign(1.0, value) < 0 for value in values):
+        # Scaling would lose the sign of -0.0
+        return UNSCALED
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10**decimals
+        try:
+            if all(
+                abs(value * scale) < 1 << 53 and round(value * scale) / scale == value
+                for value in values
+            ):
+                return decimals
+        except (OverflowError, ValueError):
+            # Infinity or NaN
+            return UNSCALED
+    return UNSCALED
+
+
+def _write_timestamps(write, timestamps):
+    """
+    Write integer timestamps as the first timestamp and the deltas of their deltas.
+
+    Args:
+        write (function): :py:meth:`BitWriter.write`.
+        timestamps (list): The timestamps.
+    """
+    previous = timestamps[0]
+    write(previous & 0xFFFFFFFFFFFFFFFF, 64)
+    previous_delta = 0
+    for timestamp in timestamps[1:]:
+        delta = timestamp - previous
+        dod = delta - previous_delta
+        previous, previous_delta = timestamp, delta
+        if dod == 0:
+            write(0, 1)
+            continue
+        for prefix, prefix_width, width in _DOD_BUCKETS:
+            if -(1 << (width - 1)) < dod <= 1 << (width - 1):
+                write(prefix, prefix_width)
+                write(dod + (1 << (width - 1)) - 1, width)
+                break
+        else:
+            write(0b11111, 5)
+            write(dod & 0xFFFFFFFFFFFFFFFF, 64)
+
+
+def _read_timestamps(read, count):
+    """
+    Read the timestamps written by :py:func:`_write_timestamps`.
+
+    Args:
+        read (function): :py:meth:`BitReader.read`.
+        count (int): The number of timestamps.
+
+    Returns:
+        list: The integer timestamps.
+    """
+    timestamp = read(64)
+    if timestamp >= 1 << 63:
+        timestamp -= 1 << 64
+    timestamps = [timestamp]
+    delta = 0
+    for _ in range(count - 1):
+        if read(1):
+            if not read(1):
+                width = 7
+            elif not read(1):
+                width = 9
+            elif not read(1):
+                width = 12
+            elif not read(1):
+                width = 20
+            else:
+                width = 64
+            if width == 64:
+                dod = read(64)
+                if dod >= 1 << 63:
+                    dod -= 1 << 64
+            else:
+                dod = read(width) - (1 << (width - 1)) + 1
+            delta += dod
+        timestamp += delta
+        timestamps.append(timestamp)
+    return timestamps
+
+
+def _write_values(write, values):
+    """
+    Write ``float64`` values XORed with the previous value.
+
+    Args:
+        write (function): :py:meth:`BitWriter.write`.
+        values (list): The values.
+    """
+    pack = _DOUBLE.pack
+    unpack = _UINT64.unpack
+    previous = unpack(pack(values[0]))[0]
+    write(previous, 64)
+    leading = trailing = -1
+    for value in values[1:]:
+        bits = unpack(pack(value))[0]
+        xor = bits ^ previous
+        previous = bits
+        if xor == 0:
+            write(0, 1)
+            continue
+        xor_leading = min(64 - xor.bit_length(), 31)
+        xor_trailing = (xor & -xor).bit_length() - 1
+        if leading >= 0 and xor_leading >= leading and xor_trailing >= trailing:
+            # The differing bits fit in the previous window
+            write(0b10, 2)
+            write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = xor_leading, xor_trailing
+            meaningful = 64 - leading - trailing
+            write(0b11, 2)
+            write(leading, 5)
+            write(meaningful & 63, 6)
+            write(xor >> trailing, meaningful)
+
+
+def _read_values(read, count):
+    """
+    Read the values written by :py:func:`_write_values`.
+
+    Args:
+        read (function): :py:meth:`BitReader.read`.
+        count (int): The number of values.
+
+    Returns:
+        list: The values.
+    """
+    pack = _UINT64.pack
+    unpack = _DOUBLE.unpack
+    bits = read(64)
+    values = [unpack(pack(bits))[0]]
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if read(1):
+            if read(1):
+                leading = read(5)
+                meaningful = read(6) or 64
+                trailing = 64 - leading - meaningful
+            bits ^= read(64 - leading - trailing) << trailing
+        values.append(unpack(pack(bits))[0])
+    return values
+
+
+def encode_block(rows, resolution=3):
+    """
+    Encode rows of a timestamp and one or more values as a block.
+
+    Args:
+        rows (list): The ``(timestamp, value, ...)`` rows, with timestamps in seconds.
+            Every row must have the same number of values.
+        resolution (int): Store timestamps in units of ``10 ** -resolution`` seconds.
+            Defaults to ``3`` (milliseconds), which is ample for the collectors'
+            intervals of a second or more.
+
+    Returns:
+        bytes: The block.
+    """
+    columns = list(zip(*rows))
+    writer = BitWriter()
+    time_scale = 10**resolution
+    _write_timestamps(writer.write, [round(time * time_scale) for time in columns[0]])
+    decimals = bytearray()
+    for values in columns[1:]:
+        column_decimals = _decimals(values)
+        decimals.append(column_decimals)
+        if column_decimals != UNSCALED:
+            scale = 10**column_decimals
+            values = [float(round(value * scale)) for value in values]
+        _write_values(writer.write, values)
+    return (
+        BLOCK_HEADER.pack(MAGIC, len(rows), len(columns) - 1, resolution)
+        + bytes(decimals)
+        + writer.getvalue()
+    )
+
+
+def decode_block(block):
+    """
+    Decode a block created by :py:func:`encode_block`.
+
+    Args:
+        block (bytes): The block.
+
+    Returns:
+        list: The ``(timestamp, value, ...)`` rows, with timestamps in seconds.
+
+    Raises:
+        ValueError: If the block is not valid.
+    """
+    if len(block) < BLOCK_HEADER.size:
+        raise ValueError("Invalid Gorilla block")
+    magic, count, width, resolution = BLOCK_HEADER.unpack_from(block)
+    if magic != MAGIC:
+        raise ValueError("Invalid Gorilla block")
+    if not count:
+        return []
+
+    decimals = block[BLOCK_HEADER.size : BLOCK_HEADER.size + width]
+    read = BitReader(block, BLOCK_HEADER.size + width).read
+    time_scale = 10**resolution
+    columns = [[time / time_scale for time in _read_timestamps(read, count)]]
+    for column_decimals in decimals:
+        values = _read_values(read, count)
+        if column_decimals != UNSCALED:
+            scale = 10**column_decimals
+            values = [value / scale for value in values]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+class Encoder:
+    """Write rows of a timestamp and values to a binary stream as Gorilla blocks."""
+
+    def __init__(self, stream, block_rows=1024, resolution=3):
+        """
+        Start buffering rows for the first block.
+
+        Args:
+            stream (file): The binary stream to write the blocks to.
+            block_rows (int): The number of rows in each block.
+            resolution (int): Store timestamps in units of ``10 ** -resolution``
+                seconds.
+        """
+        self.stream = stream
+        self.block_rows = block_rows
+        self.resolution = resolution
+        self.rows = []
+
+    def add(self, timestamp, *values):
+        """
+        Add a row, writing a block if it is full.
+
+        Args:
+            timestamp (float): The time of the sample, in seconds.
+            *values (float): The values of the sample (the same number in each row).
+        """
+        self.rows.append((timestamp, *values))
+        if len(self.rows) >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as a block, even if it is not full."""
+        if not self.rows:
+            return
+        block = encode_block(self.rows, self.resolution)
+        self.stream.write(BLOCK_LENGTH.pack(len(block)) + block)
+        self.rows = []
+
+
+class Decoder:
+    """Read the rows from a stream of Gorilla blocks."""
+
+    def __init__(self, stream):
+        """
+        Read from the current position of ``stream``.
+
+        Args:
+            stream (file): The binary stream written by an :py:class:`Encoder`.
+        """
+        self.stream = stream
+
+    def blocks(self):
+        """
+        Read the rows block by block.
+
+        Yields:
+            list: The ``(timestamp, value, ...)`` rows of each block.
+
+        Raises:
+            ValueError: If the stream ends within a block.
+        """
+        while True:
+            length = self.stream.read(BLOCK_LENGTH.size)
+            if not length:
+                return
+            if len(length) < BLOCK_LENGTH.size:
+                raise ValueError("Truncated Gorilla stream")
+            yield decode_block(self.stream.read(BLOCK_LENGTH.unpack(length)[0]))
+
+    def __iter__(self):
+        """
+        Read the rows one by one.
+
+        Yields:
+            tuple: Each ``(timestamp, value, ...)`` row.
+        """
+        for block in self.blocks():
+            yield from block
@@ -0,0 +1,118 @@
+"""
+A minimal, pure-Python stand-in for ``pythonjsonlogger.json.JsonFormatter``.
+
+This is bundled into ``analytics.pyz`` in place of
+`python-json-logger <https://pypi.org/project/python-json-logger/>`_, whose import
+(``typing``, ``dataclasses``, ``uuid``, ...) takes longer than the analytics
+collectors themselves. It only supports the features used by the analytics VM
+resources (``%`` style formats and ``static_fields``) and produces the same records.
+"""
+
+import re
+import json
+import logging
+
+# The attributes of every LogRecord, which are not included unless named in ``fmt``
+RESERVED_ATTRS = frozenset(
+    [
+        "args",
+        "asctime",
+        "created",
+        "exc_info",
+        "exc_text",
+        "filename",
+        "funcName",
+        "levelname",
+        "levelno",
+        "lineno",
+        "module",
+        "msecs",
+        "message",
+        "msg",
+        "name",
+        "pathname",
+        "process",
+        "processName",
+        "relativeCreated",
+        "stack_info",
+        "taskName",
+        "thread",
+        "threadName",
+    ]
+)
+
+
+def _default(obj):
+    """Encode the objects that :py:mod:`json` cannot, as ``python-json-logger`` does.
+
+    Args:
+        obj (object): The object to encode.
+
+    Returns:
+        str: The encoded object.
+    """
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if isinstance(obj, type):
+        return obj.__name__
+    if isinstance(obj, BaseException):
+        return "{}: {}".format(obj.__class__.__name__, obj)
+    try:
+        return str(obj)
+    except Exception:  # noqa: BLE001
+        return "__could_not_encode__"
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each log record as a single line of JSON."""
+
+    def __init__(self, fmt=None, datefmt=None, static_fields=None):
+        """Parse the fields to include in every record.
+
+        Args:
+            fmt (str): A ``%`` style format naming the record attributes to include.
+            datefmt (str): The format of the ``asctime`` field.
+            static_fields (dict): Fields with the same value in every record.
+        """
+        super().__init__(fmt, datefmt)
+        self._required_fields = re.findall(r"%\((.+?)\)", fmt or "")
+        self._skip_fields = RESERVED_ATTRS.union(self._required_fields)
+        self.static_fields = dict(static_fields or {})
+
+    def format(self, record):
+        """Serialize a log record to JSON.
+
+        Args:
+            record (logging.LogRecord): The record to format.
+
+        Returns:
+            str: The JSON encoded record.
+        """
+        message_dict = {}
+        if isinstance(record.msg, dict):
+            message_dict = record.msg
+            record.message = ""
+        else:
+            record.message = record.getMessage()
+
+        if "asctime" in self._required_fields:
+            record.asctime = self.formatTime(record, self.datefmt)
+
+        if record.exc_info and not message_dict.get("exc_info"):
+            message_dict["exc_info"] = self.formatException(record.exc_info)
+        if not message_dict.get("exc_info") and record.exc_text:
+            message_dict["exc_info"] = record.exc_text
+        if record.stack_info and not message_dict.get("stack_info"):
+            message_dict["stack_info"] = self.formatStack(record.stack_info)
+
+        log_data = {
+            field: record.__dict__.get(field) for field in self._required_fields
+        }
+        log_data.update(self.static_fields)
+        log_data.update(message_dict)
+        log_data.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in self._skip_fields and not key.startswith("_")
+        )
+        return json.dumps(log_data, default=_default)
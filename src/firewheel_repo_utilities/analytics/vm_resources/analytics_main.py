@@ -0,0 +1,86 @@
+"""
+The entry point (``__main__.py``) of the ``analytics.pyz`` bundle.
+
+The bundle contains every analytics VM resource, renamed to an importable module
+(e.g. ``psutil.cpu_tracking.py`` is stored as ``psutil_cpu_tracking.py``), and the
+``analytics_jsonlog`` formatter. A VM resource is run by passing its original
+filename, so that ``kill_analytics.py`` can still find it with ``pkill -f``::
+
+    python3 /opt/analytics/analytics.pyz psutil.cpu_tracking.py 1
+
+Run ``python3 /opt/analytics/analytics.pyz --compile`` once on the VM to add
+bytecode for that interpreter to the bundle, so that no module is compiled when a
+VM resource starts.
+"""
+
+import os
+import sys
+import runpy
+
+# pylint: disable=consider-using-f-string
+
+
+def module_name(filename):
+    """Get the name of the bundled module for a VM resource.
+
+    Args:
+        filename (str): The filename of the VM resource (e.g. ``analytics.strace.py``).
+
+    Returns:
+        str: The name of the module in the bundle (e.g. ``analytics_strace``).
+    """
+    return filename[: -len(".py")].replace(".", "_")
+
+
+def compile_bundle(path):
+    """Add bytecode for the running interpreter to the bundle.
+
+    The bytecode uses unchecked, hash-based ``.pyc`` files (:pep:`552`) which
+    :py:mod:`zipimport` prefers over the source next to them. A different
+    interpreter ignores them (due to the magic number) and falls back to the source.
+
+    Args:
+        path (str): The path to the bundle.
+    """
+    import marshal  # noqa: PLC0415
+    import zipfile  # noqa: PLC0415
+    import importlib.util  # noqa: PLC0415
+
+    with zipfile.ZipFile(path) as bundle:
+        sources = {
+            info.filename: bundle.read(info)
+            for info in bundle.infolist()
+            if not info.filename.endswith(".pyc")
+        }
+
+    with zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_DEFLATED) as bundle:
+        for filename, source in sources.items():
+            bundle.writestr(filename, source)
+            if filename.endswith(".py"):
+                code = compile(
+                    source, os.path.join(path, filename), "exec", dont_inherit=True
+                )
+                header = (
+                    importlib.util.MAGIC_NUMBER
+                    + (1).to_bytes(4, "little")
+                    + importlib.util.source_hash(source)
+                )
+                bundle.writestr(filename + "c", header + marshal.dumps(code))
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    """Run the VM resource named by the first argument."""
+    if len(sys.argv) < 2:
+        sys.exit("Usage: {} <vm resource> [<arguments> ...]".format(sys.argv[0]))
+
+    if sys.argv[1] == "--compile":
+        compile_bundle(os.path.dirname(os.path.abspath(__file__)))
+        return
+
+    filename = sys.argv.pop(1)
+    runpy.run_module(module_name(filename), run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
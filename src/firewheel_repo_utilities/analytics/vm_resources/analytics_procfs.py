@@ -0,0 +1,397 @@
+"""
+A psutil-free backend for the analytics collectors which reads ``/proc`` directly.
+
+This module implements the subset of the `psutil <https://pypi.org/project/psutil/>`_
+API used by the collectors (with the same results as psutil 5.9 on Linux), so that
+they can run on Python 3.6 or later without installing psutil. Each ``/proc`` file
+is opened once and re-read from the start with :py:func:`os.lseek` and
+:py:func:`os.readv` into a buffer that is reused between samples.
+
+Note:
+    :py:func:`net_if_addrs` only returns the names of the NICs, which is all that the
+    collectors use, and the first call to :py:func:`cpu_percent` returns ``0.0`` for
+    each CPU, as there is no previous sample to compare against.
+"""
+
+import os
+from operator import mul, sub, truediv
+from itertools import repeat
+from collections import namedtuple
+
+svmem = namedtuple(
+    "svmem",
+    "total available percent used free active inactive buffers cached shared slab",
+)
+sdiskio = namedtuple(
+    "sdiskio",
+    "read_count write_count read_bytes write_bytes read_time write_time "
+    "read_merged_count write_merged_count busy_time",
+)
+sdiskusage = namedtuple("sdiskusage", "total used free percent")
+sdiskpart = namedtuple("sdiskpart", "device mountpoint fstype opts")
+snetio = namedtuple(
+    "snetio",
+    "bytes_sent bytes_recv packets_sent packets_recv errin errout dropin dropout",
+)
+
+# The root of the proc file system, which can be changed before the first sample
+PROC = "/proc"
+
+# The size of a sector in /proc/diskstats, which is always 512 bytes
+SECTOR_SIZE = 512
+
+# The times of each ``cpuN`` line of /proc/stat whose percentages ``CPUStats``
+# records, as their index in the line (after the name)
+CPU_PERCENT_FIELDS = {
+    "user": 0,
+    "system": 2,
+    "iowait": 4,
+    "irq": 5,
+    "softirq": 6,
+    "steal": 7,
+}
+
+# The times which make up the total time of a CPU (user, nice, system, idle, iowait,
+# irq, softirq, and steal, as guest time is already included in user and nice)
+CPU_TOTAL_FIELDS = 8
+
+_files = {}
+_last_cpu_times = {}
+_statvfs = os.statvfs
+
+
+class ProcFile:
+    """A ``/proc`` file which is kept open and re-read into the same buffer."""
+
+    def __init__(self, path):
+        """Open the file.
+
+        Args:
+            path (str): The path of the file.
+        """
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buffer = bytearray(4096)
+        self.view = memoryview(self.buffer)
+
+    def read(self):
+        """Read the current contents of the file.
+
+        Returns:
+            bytes: The contents of the file.
+        """
+        while True:
+            # os.preadv() would need Python 3.7
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            size = 0
+            # A seq_file read returns at most about a page of whole records, so a
+            # short read is not the end of the file; only an empty read is
+            while size < len(self.buffer):
+                count = os.readv(self.fd, [self.view[size:]])
+                if not count:
+                    return self.view[:size].tobytes()
+                size += count
+            # The file does not fit, so grow the buffer and read it again
+            self.buffer = bytearray(len(self.buffer) * 2)
+            self.view = memoryview(self.buffer)
+
+
+def _read_lines(name):
+    """Read the lines of a ``/proc`` file, opening it on first use.
+
+    Args:
+        name (str): The path of the file relative to :py:data:`PROC`.
+
+    Returns:
+        list: The lines of the file.
+    """
+    proc_file = _files.get(name)
+    if proc_file is None:
+        proc_file = _files[name] = ProcFile(os.path.join(PROC, name))
+    return proc_file.read().splitlines()
+
+
+def cpu_percent(percpu=False):
+    """
+    Return the CPU utilization since the previous call.
+
+    Args:
+        percpu (bool): Return a list with one entry per CPU.
+
+    Returns:
+        float | list: The utilization as a percentage.
+    """
+    times = []
+    for line in _read_lines("stat"):
+        if not line.startswith(b"cpu"):
+            break
+        if line.startswith(b"cpu ") == percpu:
+            continue
+        # user, nice, system, idle, iowait, irq, softirq, steal (guest time is
+        # already included in user and nice)
+        fields = [int(field) for field in line.split()[1:9]]
+        times.append((sum(fields), fields[3] + fields[4]))
+
+    previous = _last_cpu_times.get(percpu, times)
+    _last_cpu_times[percpu] = times
+    percents = []
+    for (old_total, old_idle), (total, idle) in zip(previous, times):
+        total_delta = total - old_total
+        busy_delta = total_delta - (idle - old_idle)
+        if total_delta <= 0:
+            percents.append(0.0)
+        else:
+            percents.append(round(min(max(busy_delta / total_delta, 0), 1) * 100, 1))
+    return percents if percpu else percents[0]
+
+
+def virtual_memory():
+    """
+    Return the system memory statistics from ``/proc/meminfo``.
+
+    Returns:
+        svmem: The memory statistics in bytes.
+    """
+    mems = {}
+    for line in _read_lines("meminfo"):
+        fields = line.split()
+        mems[fields[0]] = int(fields[1]) * 1024
+
+    total = mems[b"MemTotal:"]
+    free = mems[b"MemFree:"]
+    buffers = mems.get(b"Buffers:", 0)
+    cached = mems.get(b"Cached:", 0) + mems.get(b"SReclaimable:", 0)
+    available = mems.get(b"MemAvailable:", free + buffers + cached)
+    used = total - free - cached - buffers
+    if used < 0:
+        used = total - free
+    percent = round((total - available) / total * 100, 1)
+    return svmem(
+        total,
+        available,
+        percent,
+        used,
+        free,
+        mems.get(b"Active:", 0),
+        mems.get(b"Inactive:", 0),
+        buffers,
+        cached,
+        mems.get(b"Shmem:", 0),
+        mems.get(b"Slab:", 0),
+    )
+
+
+def disk_io_counters(perdisk=False):
+    """
+    Return the disk IO counters from ``/proc/diskstats``.
+
+    Args:
+        perdisk (bool): Return a dictionary keyed by disk name.
+
+    Returns:
+        dict | sdiskio: The IO counters.
+    """
+    counters = {}
+    for line in _read_lines("diskstats"):
+        fields = line.split()
+        reads, rmerged, rsectors, rtime, writes, wmerged, wsectors, wtime = map(
+            int, fields[3:11]
+        )
+        counters[fields[2].decode()] = sdiskio(
+            reads,
+            writes,
+            rsectors * SECTOR_SIZE,
+            wsectors * SECTOR_SIZE,
+            rtime,
+            wtime,
+            rmerged,
+            wmerged,
+            int(fields[12]),
+        )
+    if perdisk:
+        return counters
+    return sdiskio(*[sum(column) for column in zip(*counters.values())])
+
+
+def disk_partitions(all=False):  # noqa: A002
+    """
+    Return the mounted partitions from ``/proc/mounts``.
+
+    Args:
+        all (bool): Include pseudo file systems (those marked ``nodev`` in
+            ``/proc/filesystems``) as well as physical devices.
+
+    Returns:
+        list: A :py:class:`sdiskpart` for each mounted partition.
+    """
+    physical = None
+    if not all:
+        physical = {
+            line.split()[0].decode()
+            for line in _read_lines("filesystems")
+            if not line.startswith(b"nodev")
+        }
+
+    partitions = []
+    for line in _read_lines("mounts"):
+        device, mountpoint, fstype, opts = line.decode().split()[:4]
+        if all or (device and fstype in physical):
+            partitions.append(sdiskpart(device, mountpoint, fstype, opts))
+    return partitions
+
+
+def disk_usage(path):
+    """
+    Return the usage of the file system containing ``path``.
+
+    Args:
+        path (str): A path on the file system, usually its mount point.
+
+    Returns:
+        sdiskusage: The usage statistics in bytes.
+    """
+    stats = _statvfs(path)
+    total = stats.f_blocks * stats.f_frsize
+    used = total - stats.f_bfree * stats.f_frsize
+    free = stats.f_bavail * stats.f_frsize
+    total_user = used + free
+    percent = round(used / total_user * 100, 1) if total_user else 0.0
+    return sdiskusage(total, used, free, percent)
+
+
+def net_io_counters(pernic=False):
+    """
+    Return the network IO counters from ``/proc/net/dev``.
+
+    Args:
+        pernic (bool): Return a dictionary keyed by NIC name.
+
+    Returns:
+        dict | snetio: The IO counters.
+    """
+    counters = {}
+    for line in _read_lines("net/dev")[2:]:
+        name, data = line.split(b":", 1)
+        fields = data.split()
+        counters[name.strip().decode()] = snetio(
+            int(fields[8]),
+            int(fields[0]),
+            int(fields[9]),
+            int(fields[1]),
+            int(fields[2]),
+            int(fields[10]),
+            int(fields[3]),
+            int(fields[11]),
+        )
+    if pernic:
+        return counters
+    return snetio(*[sum(column) for column in zip(*counters.values())])
+
+
+def net_if_addrs():
+    """
+    Return the NICs listed in ``/proc/net/dev``.
+
+    Returns:
+        dict: An empty list of addresses keyed by NIC name.
+    """
+    return {nic: [] for nic in net_io_counters(pernic=True)}
+
+
+class CPUStats:
+    """
+    Read the extended CPU statistics from a single read of ``/proc/stat`` per sample.
+
+    Each sample records, for each CPU, the percentage of the time since the previous
+    sample spent in each of :py:data:`CPU_PERCENT_FIELDS` (as one list per field,
+    indexed by CPU), the context switches (``ctxt``) and interrupts (``intr``) since
+    the previous sample, the processes which are runnable (``procs_running``) and
+    blocked on I/O (``procs_blocked``), and the 1, 5, and 15 minute ``loadavg``.
+
+    The times of every CPU are parsed into one flat list with a single call to
+    :py:func:`int` per value, and each field is a strided slice of that list which
+    is combined with the others with :py:func:`map`, so that no Python code runs per
+    CPU and the cost per CPU stays flat on VMs with many CPUs. The lists of the
+    record are preallocated and updated in place rather than rebuilt each sample.
+    """
+
+    def __init__(self):
+        """Open ``/proc/stat`` and ``/proc/loadavg``."""
+        self._stat = ProcFile(os.path.join(PROC, "stat"))
+        self._loadavg = ProcFile(os.path.join(PROC, "loadavg"))
+        self._times = []
+        self._counters = (0, 0)
+        self.record = {field: [] for field in CPU_PERCENT_FIELDS}
+        self.record.update(
+            ctxt=0, intr=0, procs_running=0, procs_blocked=0, loadavg=[0.0, 0.0, 0.0]
+        )
+
+    def sample(self):
+        """
+        Read the statistics since the previous sample.
+
+        The first sample (and the first after a CPU goes on or offline) records
+        ``0.0`` for each CPU and ``0`` context switches and interrupts, as there is
+        no previous sample to compare against.
+
+        Returns:
+            dict: The record, which is updated in place by the next sample.
+        """
+        data = self._stat.read()
+        # Skip the line with the total of every CPU
+        start = data.index(b"\ncpu") + 1
+        end = data.index(b"\nintr ", start)
+        cpus = data.count(b"\n", start, end) + 1
+        values = data[start:end].split()
+        width = len(values) // cpus
+        # Drop the ``cpuN`` names to leave the times of each CPU, one after another
+        del values[::width]
+        times = list(map(int, values))
+        width -= 1
+
+        previous = self._times
+        self._times = times
+        if len(previous) != len(times):
+            previous = times
+        deltas = list(map(sub, times, previous))
+        columns = [deltas[field::width] for field in range(CPU_TOTAL_FIELDS)]
+        totals = map(max, map(sum, zip(*columns)), repeat(1))
+        # Per mille of each CPU's total time, so that rounding to an integer and
+        # dividing by 10 gives a percentage with one decimal place
+        scales = list(map(truediv, repeat(1000.0), totals))
+        record = self.record
+        for name, field in CPU_PERCENT_FIELDS.items():
+            per_mille = map(mul, deltas[field::width], scales)
+            if name == "iowait":
+                # The iowait time of a CPU can go backwards
+                per_mille = map(max, per_mille, repeat(0.0))
+            record[name][:] = map(truediv, map(round, per_mille), repeat(10))
+
+        intr = _stat_value(data, b"\nintr ", end)
+        ctxt = _stat_value(data, b"\nctxt ", end)
+        old_intr, old_ctxt = self._counters if previous is not times else (intr, ctxt)
+        self._counters = (intr, ctxt)
+        record["intr"] = intr - old_intr
+        record["ctxt"] = ctxt - old_ctxt
+        record["procs_running"] = _stat_value(data, b"\nprocs_running ", end)
+        record["procs_blocked"] = _stat_value(data, b"\nprocs_blocked ", end)
+        record["loadavg"][:] = map(float, self._loadavg.read().split()[:3])
+        return record
+
+
+def _stat_value(data, key, start):
+    """
+    Read the first value after a key in ``/proc/stat``.
+
+    Args:
+        data (bytes): The contents of ``/proc/stat``.
+        key (bytes): The key, with the preceding newline and the following space.
+        start (int): Where to start looking for the key.
+
+    Returns:
+        int: The value.
+    """
+    begin = data.index(key, start) + len(key)
+    end = begin
+    while data[end] not in b" \n":
+        end += 1
+    return int(data[begin:end])
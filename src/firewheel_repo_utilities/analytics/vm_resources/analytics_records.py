@@ -0,0 +1,127 @@
+"""
+A lean emitter for the metric records of the analytics collectors.
+
+The collectors normally log each sample through :py:mod:`logging` and a
+``JsonFormatter``, which looks up the calling stack frame, formats ``asctime``, and
+adds ``pathname``, ``module``, ``lineno``, ``name`` and ``levelname`` to every
+record. With ``--lean``, the collectors instead write each sample with
+:py:class:`RecordEmitter`, which emits only ``host``, ``ts`` (seconds since the
+epoch), and the fields of the sample::
+
+    {"host":"vm1","ts":1760950800.123456,"analytics.system_memory_tracking.total":8343789568,...}
+
+The ``host`` field is serialized once, and `orjson <https://pypi.org/project/orjson/>`_
+is used to serialize the samples if it is installed.
+"""
+
+import os
+import sys
+import time
+
+try:
+    import orjson
+
+    def dumps(obj):
+        """Serialize an object to compact JSON.
+
+        Args:
+            obj (object): The object to serialize.
+
+        Returns:
+            bytes: The JSON encoded object.
+        """
+        return orjson.dumps(obj, default=str)
+
+except ImportError:
+    import json
+
+    _encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+
+    def dumps(obj):
+        """Serialize an object to compact JSON.
+
+        Args:
+            obj (object): The object to serialize.
+
+        Returns:
+            bytes: The JSON encoded object.
+        """
+        return _encoder.encode(obj).encode("utf-8")
+
+
+def parse_options(argv):
+    """Parse the options which the ``psutil`` collectors share.
+
+    Args:
+        argv (list): The command line arguments after the refresh interval, e.g.
+            ``["--lean", "--transport=virtio:///dev/virtio-ports/analytics"]``.
+
+    Returns:
+        dict: The ``lean`` and ``procfs`` flags, and the ``transport`` and
+        ``cgroup`` values (``None`` if they are not given), as keyword arguments
+        for the collector.
+    """
+    options = {
+        "lean": "--lean" in argv,
+        "procfs": "--procfs" in argv,
+        "transport": None,
+        "cgroup": None,
+    }
+    for arg in argv:
+        name, _sep, value = arg.partition("=")
+        if name in {"--transport", "--cgroup"}:
+            options[name[2:]] = value
+    return options
+
+
+def open_streams(path, stdout=True, transport=None):
+    """Open the binary streams to which a collector writes its records.
+
+    Args:
+        path (str): The log file, which is appended to.
+        stdout (bool): Whether to also write the records to stdout.
+        transport (str): A URL to which the records are also sent with
+            ``analytics_transport``, instead of writing them to stdout.
+
+    Returns:
+        list: The binary streams.
+    """
+    # pylint: disable=consider-using-with
+    streams = [open(path, "ab")]
+    if transport:
+        import analytics_transport  # noqa: PLC0415
+
+        streams.append(analytics_transport.Transport(transport))
+    elif stdout:
+        streams.append(sys.stdout.buffer)
+    return streams
+
+
+class RecordEmitter:
+    """Write each record as a single line of JSON to one or more binary streams."""
+
+    def __init__(self, streams):
+        """Pre-serialize the fields that are the same in every record.
+
+        Args:
+            streams (list): The binary streams to write each record to.
+        """
+        self.streams = streams
+        self._prefix = b'{"host":' + dumps(os.uname().nodename) + b',"ts":'
+
+    def emit(self, payload):
+        """Write a record containing the fields of ``payload``.
+
+        Args:
+            payload (dict): The fields of the sample.
+        """
+        body = dumps(payload)
+        line = b"%s%.6f%s%s\n" % (
+            self._prefix,
+            time.time(),
+            b"," if len(body) > 2 else b"",
+            body[1:],
+        )
+        for stream in self.streams:
+            stream.write(line)
+            stream.flush()
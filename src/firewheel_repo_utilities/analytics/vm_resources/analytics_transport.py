@@ -0,0 +1,338 @@
+"""
+Push the records of the analytics collectors to a receiver on the host.
+
+With ``--transport=<url>``, the lean collectors (see ``analytics_records``) add a
+:py:class:`Transport` to the streams that each record is written to. Records are
+buffered in memory and a background thread sends them in batches, so a slow or
+unreachable receiver never delays sampling. Each batch is sent as one frame:
+
+* A header (:py:data:`HEADER`) with the magic ``b"FWT1"``, a random identifier of
+  the sender, the sequence number of the batch, the number of records dropped so
+  far, the number of records in the batch, and the length of the payload.
+* The payload, which is the newline-terminated records compressed with
+  :py:mod:`zlib`.
+
+Supported URLs are:
+
+* ``udp://<host>:<port>`` -- One datagram per frame.
+* ``unix://<path>`` -- A stream socket on which the frames are sent back to back.
+* ``virtio://<path>`` -- A virtio-serial port (e.g. ``/dev/virtio-ports/analytics``)
+  on which the frames are written back to back.
+
+The buffer is bounded. When it is full, the oldest records are dropped and counted,
+and the count is sent with the next batch so that the receiver knows what was lost.
+If a send fails, the batch is kept and the transport reconnects with exponential
+backoff. A socket is closed when a send fails, so the receiver discards the part of
+the frame it got and the whole frame is sent again on the new connection. Closing a
+virtio-serial port does not reset the stream seen by the host, so on a virtio port
+the transport instead remembers how much of the frame was written and resumes from
+there once the port is reopened.
+"""
+
+import os
+import zlib
+import errno
+import socket
+import struct
+import threading
+from collections import deque
+
+MAGIC = b"FWT1"
+
+# magic, sender, sequence number, records dropped, records in the batch, payload length
+HEADER = struct.Struct("!4sIIIII")
+
+# The largest uncompressed batch that is sent in a single UDP datagram
+MAX_DATAGRAM_BATCH_BYTES = 60000
+
+
+def encode_frame(sender, sequence, dropped, records, compresslevel=1):
+    """Encode a batch of records as a frame.
+
+    Args:
+        sender (int): The identifier of the sender.
+        sequence (int): The sequence number of the batch.
+        dropped (int): The number of records dropped before this batch.
+        records (list): The records, each a line of JSON ending with a newline.
+        compresslevel (int): The :py:mod:`zlib` compression level.
+
+    Returns:
+        bytes: The frame.
+    """
+    payload = zlib.compress(b"".join(records), compresslevel)
+    return (
+        HEADER.pack(
+            MAGIC,
+            sender,
+            sequence & 0xFFFFFFFF,
+            dropped & 0xFFFFFFFF,
+            len(records),
+            len(payload),
+        )
+        + payload
+    )
+
+
+def decode_frame(frame):
+    """Decode a frame created by :py:func:`encode_frame`.
+
+    Args:
+        frame (bytes): The frame.
+
+    Returns:
+        tuple: The sender, the sequence number, the number of records dropped, and
+        the records (as one :py:class:`bytes` object containing a line of JSON per
+        record).
+
+    Raises:
+        ValueError: If the frame is not valid.
+    """
+    if len(frame) < HEADER.size:
+        raise ValueError("Invalid analytics transport frame")
+    magic, sender, sequence, dropped, count, length = HEADER.unpack_from(frame)
+    if magic != MAGIC or len(frame) != HEADER.size + length:
+        raise ValueError("Invalid analytics transport frame")
+    try:
+        records = zlib.decompress(memoryview(frame)[HEADER.size :])
+    except zlib.error as error:
+        raise ValueError("Invalid analytics transport frame") from error
+    if records.count(b"\n") != count:
+        raise ValueError("Invalid analytics transport frame")
+    return sender, sequence, dropped, records
+
+
+def parse_url(url):
+    """Split a transport URL into its scheme and address.
+
+    Args:
+        url (str): The URL (e.g. ``udp://10.0.0.1:5140``).
+
+    Returns:
+        tuple: The scheme and the address (a ``(host, port)`` tuple for UDP or a path).
+
+    Raises:
+        ValueError: If the URL is not supported.
+    """
+    scheme, _, address = url.partition("://")
+    if scheme == "udp":
+        host, _, port = address.rpartition(":")
+        return scheme, (host.strip("[]"), int(port))
+    if scheme in {"unix", "virtio"} and address:
+        return scheme, address
+    raise ValueError("Unsupported analytics transport URL: {}".format(url))
+
+
+class Transport:
+    """A binary stream which sends the records written to it in batches."""
+
+    def __init__(
+        self,
+        url,
+        max_records=10000,
+        batch_interval_sec=1.0,
+        max_batch_bytes=262144,
+        max_backoff_sec=30.0,
+    ):
+        """Start the thread which sends the batches.
+
+        Args:
+            url (str): Where to send the records (see :py:func:`parse_url`).
+            max_records (int): The largest number of records which are buffered.
+            batch_interval_sec (float): How often a batch is sent.
+            max_batch_bytes (int): The largest uncompressed size of a batch. This is
+                limited to :py:data:`MAX_DATAGRAM_BATCH_BYTES` for UDP.
+            max_backoff_sec (float): The longest time between reconnection attempts.
+        """
+        self.scheme, self.address = parse_url(url)
+        self.max_records = max_records
+        self.batch_interval_sec = batch_interval_sec
+        self.max_batch_bytes = max_batch_bytes
+        if self.scheme == "udp":
+            self.max_batch_bytes = min(max_batch_bytes, MAX_DATAGRAM_BATCH_BYTES)
+        self.max_backoff_sec = max_backoff_sec
+
+        self.dropped = 0
+        self.sent_records = 0
+        self.sent_batches = 0
+        self.sent_bytes = 0
+        self.connections = 0
+
+        self._records = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._sender = int.from_bytes(os.urandom(4), "big")
+        self._sequence = 0
+        self._pending = None
+        # The bytes of the pending frame already written to the virtio-serial port
+        self._offset = 0
+        self._fd = None
+        self._socket = None
+        self._thread = threading.Thread(
+            target=self._run, name="analytics-transport", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, record):
+        """Buffer a record, dropping the oldest record if the buffer is full.
+
+        Args:
+            record (bytes): A line of JSON ending with a newline.
+
+        Returns:
+            int: The length of the record.
+        """
+        with self._condition:
+            if len(self._records) >= self.max_records:
+                self._records.popleft()
+                self.dropped += 1
+            self._records.append(bytes(record))
+        return len(record)
+
+    def flush(self):
+        """Do nothing, as the records are sent in batches by the background thread."""
+
+    def close(self, timeout=5.0):
+        """Send the buffered records and stop the background thread.
+
+        Args:
+            timeout (float): The longest time to wait for the records to be sent.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._disconnect()
+
+    def stats(self):
+        """Get the counters of the transport.
+
+        Returns:
+            dict: The records sent and dropped, the batches and bytes sent, the
+            number of times the transport connected, and the number of records
+            buffered.
+        """
+        with self._condition:
+            return {
+                "sent_records": self.sent_records,
+                "sent_batches": self.sent_batches,
+                "sent_bytes": self.sent_bytes,
+                "dropped": self.dropped,
+                "connections": self.connections,
+                "buffered": len(self._records),
+            }
+
+    def _next_batch(self):
+        """Remove the next batch of records from the buffer.
+
+        Returns:
+            list: The records in the batch.
+        """
+        batch = []
+        size = 0
+        with self._condition:
+            while self._records and (
+                not batch or size + len(self._records[0]) <= self.max_batch_bytes
+            ):
+                record = self._records.popleft()
+                batch.append(record)
+                size += len(record)
+        return batch
+
+    def _run(self):
+        """Send a batch every ``batch_interval_sec`` until the transport is closed."""
+        backoff = 0.0
+        while True:
+            with self._condition:
+                if not self._closed:
+                    self._condition.wait(max(backoff, self.batch_interval_sec))
+                closed = self._closed
+
+            while True:
+                if self._pending is None:
+                    batch = self._next_batch()
+                    if not batch:
+                        break
+                    with self._condition:
+                        dropped = self.dropped
+                    self._pending = (
+                        len(batch),
+                        encode_frame(self._sender, self._sequence, dropped, batch),
+                    )
+                    self._sequence += 1
+                if not self._send(self._pending[1]):
+                    backoff = min(max(backoff * 2, 0.5), self.max_backoff_sec)
+                    break
+                backoff = 0.0
+                with self._condition:
+                    self.sent_records += self._pending[0]
+                    self.sent_batches += 1
+                    self.sent_bytes += len(self._pending[1])
+                self._pending = None
+
+            if closed:
+                return
+
+    def _connect(self):
+        """Open the socket or virtio-serial port.
+
+        Raises:
+            OSError: If the receiver cannot be reached.
+        """
+        if self.scheme == "virtio":
+            self._fd = os.open(self.address, os.O_WRONLY)
+            return
+        if self.scheme == "udp":
+            family = socket.AF_INET6 if ":" in self.address[0] else socket.AF_INET
+            self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        else:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(self.address)
+        except OSError:
+            self._disconnect()
+            raise
+
+    def _disconnect(self):
+        """Close the socket or virtio-serial port, if it is open."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _send(self, frame):
+        """Send a frame, connecting first if needed.
+
+        On a virtio-serial port, a frame which was partly written by an earlier
+        call is resumed from the first byte which was not written.
+
+        Args:
+            frame (bytes): The frame to send.
+
+        Returns:
+            bool: Whether the frame was sent.
+        """
+        try:
+            if self._socket is None and self._fd is None:
+                self._connect()
+                self.connections += 1
+            if self._fd is not None:
+                view = memoryview(frame)[self._offset :]
+                while view:
+                    written = os.write(self._fd, view)
+                    self._offset += written
+                    view = view[written:]
+                self._offset = 0
+            else:
+                self._socket.sendall(frame)
+        except OSError as error:
+            self._disconnect()
+            if error.errno == errno.EMSGSIZE:
+                # The frame can never be sent, so count its records as dropped
+                with self._condition:
+                    self.dropped += self._pending[0]
+                self._pending = None
+            return False
+        return True
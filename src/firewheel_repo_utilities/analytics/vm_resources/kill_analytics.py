@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
+import os
 import sys
 import logging
-import platform
 import subprocess
 
-from pythonjsonlogger.json import JsonFormatter
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
 
 # pylint: disable=consider-using-f-string
 
@@ -12,7 +16,7 @@ log = logging.getLogger("kill_analytics")
 log.setLevel(logging.DEBUG)
 formatter = JsonFormatter(
     "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
-    static_fields={"hostname": platform.node()},
+    static_fields={"hostname": os.uname().nodename},
 )
 
 # Add logging to stdout
@@ -27,8 +31,12 @@ def kill_all():
     possible_processes = [
         "tcpdump",
         "analytics.port_tracking.py",
+        "analytics.pressure_tracking.py",
+        "analytics.process_lifecycle.py",
         "analytics.strace.py",
         "strace",
+        "analytics.syscall_profile.py",
+        "bpftrace",
         "analytics.tailf_dir.sh",
         "tail -f",
         "psutil.cpu_tracking.py",
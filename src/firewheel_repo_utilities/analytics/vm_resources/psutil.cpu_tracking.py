@@ -1,29 +1,81 @@
+import os
 import sys
 import json
 import logging
 import datetime
-import platform
 from time import sleep
 
-import psutil
-from pythonjsonlogger.json import JsonFormatter
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
 
 
 class CPUTracking:
-    """Track the system CPU usage using psutil."""
+    """Track the system CPU usage using psutil.
 
-    def __init__(self, refresh_interval_sec):
+    With ``extended``, each sample instead records the user, system, iowait, irq,
+    softirq, and steal percentages of each CPU, the context switches, interrupts,
+    runnable and blocked processes, and the load average, all read from a single
+    read of ``/proc/stat`` (and ``/proc/loadavg``) with ``analytics_procfs.CPUStats``.
+    """
+
+    def __init__(
+        self,
+        refresh_interval_sec,
+        lean=False,
+        procfs=False,
+        transport=None,
+        cgroup=None,
+        extended=False,
+    ):
         """Set up the logging system and take in the refresh rate.
 
         Args:
             refresh_interval_sec (int): Interval between tracking the statistics.
+            lean (bool): Write each sample with ``analytics_records.RecordEmitter``
+                rather than as a JSON line with a ``date`` field.
+            procfs (bool): Read the statistics with ``analytics_procfs`` rather
+                than psutil.
+            transport (str): In lean mode, send each sample to this URL with
+                ``analytics_transport``.
+            cgroup (str): Add the throttling statistics of this cgroup since the
+                previous sample to each sample, with ``analytics_cgroup``.
+            extended (bool): Record the extended CPU statistics with
+                ``analytics_procfs.CPUStats`` rather than the busy percentage of each
+                CPU, which does not require psutil.
         """
         self.refresh_interval_sec = refresh_interval_sec
+        self._cpu_stats = None
+        if extended:
+            import analytics_procfs as backend  # noqa: PLC0415
+
+            self._cpu_stats = backend.CPUStats()
+        elif procfs:
+            import analytics_procfs as backend  # noqa: PLC0415
+        else:
+            import psutil as backend  # noqa: PLC0415
+        self.backend = backend
+        self._throttle = None
+        if cgroup:
+            import analytics_cgroup  # noqa: PLC0415
+
+            self._throttle = analytics_cgroup.ThrottleStats(cgroup)
+        self._emitter = None
+        if lean:
+            import analytics_records  # noqa: PLC0415
+
+            self._emitter = analytics_records.RecordEmitter(
+                analytics_records.open_streams(
+                    "/opt/analytics/cpu_tracking.log", stdout=False, transport=transport
+                )
+            )
         self._log = logging.getLogger("cpu_tracking")
         self._log.setLevel(logging.DEBUG)
         formatter = JsonFormatter(
             "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
-            static_fields={"hostname": platform.node()},
+            static_fields={"hostname": os.uname().nodename},
         )
 
         # Add logging to stdout
@@ -36,26 +88,82 @@ class CPUTracking:
         """Start tracking the system CPU."""
         self._log.debug("Starting cpu_tracking")
 
+        if self._emitter is not None:
+            while True:
+                self.sample()
+                sleep(self.refresh_interval_sec)
+
         with open("/opt/analytics/cpu_tracking.log", "a", encoding="utf-8") as outfile:
             # Run every <interval> seconds to get memory statistic
             while True:
-                cpu_percents = psutil.cpu_percent(
-                    percpu=True
-                )  # List of named tuples with stats
+                self.sample(outfile)
+                sleep(self.refresh_interval_sec)
 
-                cpu_dict = {
-                    "date": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
-                }
+    def sample(self, outfile=None):
+        """Write a single sample of the CPU usage.
 
-                for cpu, cpu_percent in enumerate(cpu_percents):
-                    cpu_dict["cpu{}".format(cpu)] = cpu_percent
+        Args:
+            outfile (file): The file to which the sample is written. This is not
+                used in lean mode.
+        """
+        if self._cpu_stats is not None:
+            self.sample_extended(outfile)
+            return
 
-                outfile.write("{}\n".format(json.dumps(cpu_dict)))
-                outfile.flush()
+        cpu_percents = self.backend.cpu_percent(
+            percpu=True
+        )  # List of named tuples with stats
 
-                sleep(self.refresh_interval_sec)
+        if self._emitter is not None:
+            record = {
+                "cpu{}".format(cpu): percent for cpu, percent in enumerate(cpu_percents)
+            }
+            if self._throttle is not None:
+                record["cgroup"] = self._throttle.sample()
+            self._emitter.emit(record)
+            return
+
+        cpu_dict = {
+            "date": datetime.datetime.utcnow().isoformat(timespec="microseconds")
+        }
+
+        for cpu, cpu_percent in enumerate(cpu_percents):
+            cpu_dict["cpu{}".format(cpu)] = cpu_percent
+        if self._throttle is not None:
+            cpu_dict["cgroup"] = self._throttle.sample()
+
+        outfile.write("{}\n".format(json.dumps(cpu_dict)))
+        outfile.flush()
+
+    def sample_extended(self, outfile=None):
+        """Write a single sample of the extended CPU statistics.
+
+        The record of ``analytics_procfs.CPUStats`` is updated in place and written
+        as is, without building a new dictionary.
+
+        Args:
+            outfile (file): The file to which the sample is written. This is not
+                used in lean mode.
+        """
+        record = self._cpu_stats.sample()
+        if self._throttle is not None:
+            record["cgroup"] = self._throttle.sample()
+
+        if self._emitter is not None:
+            self._emitter.emit(record)
+            return
+
+        record["date"] = datetime.datetime.utcnow().isoformat(timespec="microseconds")
+        outfile.write("{}\n".format(json.dumps(record)))
+        outfile.flush()
 
 
 if __name__ == "__main__":
-    cpu_tracking = CPUTracking(int(sys.argv[1]))
+    import analytics_records
+
+    cpu_tracking = CPUTracking(
+        int(sys.argv[1]),
+        extended="--extended" in sys.argv[2:],
+        **analytics_records.parse_options(sys.argv[2:]),
+    )
     cpu_tracking.run()
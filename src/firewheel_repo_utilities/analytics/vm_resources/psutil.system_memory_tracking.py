@@ -1,27 +1,67 @@
+import os
 import sys
 import logging
-import platform
 from time import sleep
 
-import psutil
-from pythonjsonlogger.json import JsonFormatter
+try:
+    # The lightweight formatter bundled into analytics.pyz
+    from analytics_jsonlog import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.json import JsonFormatter
 
 
 class SystemMemoryTracking:
     """Track the system memory using psutil."""
 
-    def __init__(self, refresh_interval_sec):
+    def __init__(
+        self,
+        refresh_interval_sec,
+        lean=False,
+        procfs=False,
+        transport=None,
+        cgroup=None,
+    ):
         """Set up the logging system and take in the refresh rate.
 
         Args:
             refresh_interval_sec (int): Interval between tracking the statistics.
+            lean (bool): Write each sample with ``analytics_records.RecordEmitter``
+                rather than through :py:mod:`logging`.
+            procfs (bool): Read the statistics with ``analytics_procfs`` rather
+                than psutil.
+            transport (str): In lean mode, send each sample to this URL with
+                ``analytics_transport``.
+            cgroup (str): Add the throttling statistics of this cgroup since the
+                previous sample to each sample, with ``analytics_cgroup``.
         """
         self.refresh_interval_sec = refresh_interval_sec
+        if procfs:
+            import analytics_procfs as backend  # noqa: PLC0415
+        else:
+            import psutil as backend  # noqa: PLC0415
+        self.backend = backend
+        self._throttle = None
+        if cgroup:
+            import analytics_cgroup  # noqa: PLC0415
+
+            self._throttle = analytics_cgroup.ThrottleStats(cgroup)
         self._log = logging.getLogger("system_memory_tracking")
         self._log.setLevel(logging.DEBUG)
+        if lean:
+            import analytics_records  # noqa: PLC0415
+
+            self._emit = analytics_records.RecordEmitter(
+                analytics_records.open_streams(
+                    "/opt/analytics/system_memory_tracking.log",
+                    stdout=True,
+                    transport=transport,
+                )
+            ).emit
+            return
+
         formatter = JsonFormatter(
             "%(pathname)s %(module)s %(lineno)d %(name)s %(asctime)s %(message)s %(name)s %(levelname)s",
-            static_fields={"hostname": platform.node()},
+            static_fields={"hostname": os.uname().nodename},
         )
 
         # Add logging to stdout
@@ -35,6 +75,7 @@ class SystemMemoryTracking:
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(formatter)
         self._log.addHandler(file_handler)
+        self._emit = self._log.debug
 
     def run(self):
         """Start tracking the system memory."""
@@ -42,17 +83,26 @@ class SystemMemoryTracking:
 
         # Run every <interval> seconds to get memory statistic
         while True:
-            mem = psutil.virtual_memory()  # Named tuple with stats
+            self.sample()
+            sleep(self.refresh_interval_sec)
 
-            mem_dict = {
-                "analytics.system_memory_tracking.{}".format(k): v
-                for k, v in mem._asdict().items()
-            }
-            self._log.debug(mem_dict)
+    def sample(self):
+        """Log a single sample of the system memory."""
+        mem = self.backend.virtual_memory()  # Named tuple with stats
 
-            sleep(self.refresh_interval_sec)
+        mem_dict = {
+            "analytics.system_memory_tracking.{}".format(k): v
+            for k, v in mem._asdict().items()
+        }
+        if self._throttle is not None:
+            mem_dict["analytics.cgroup"] = self._throttle.sample()
+        self._emit(mem_dict)
 
 
 if __name__ == "__main__":
-    system_memory_tracking = SystemMemoryTracking(int(sys.argv[1]))
+    import analytics_records
+
+    system_memory_tracking = SystemMemoryTracking(
+        int(sys.argv[1]), **analytics_records.parse_options(sys.argv[2:])
+    )
     system_memory_tracking.run()
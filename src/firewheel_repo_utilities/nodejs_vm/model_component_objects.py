@@ -5,6 +5,7 @@ This module contains all necessary MC Objects for ``utilities.nodejs``.
 from pathlib import Path
 
 from linux.ubuntu import UbuntuHost
+from utilities.tools import ScheduleBatch
 
 from firewheel.control.experiment_graph import require_class
 
@@ -17,7 +18,23 @@ class NodeJSVM:
 
     _local_bin_dir = Path("/usr/local/bin")
 
-    def __init__(self, node_version="18.13.0", symlink=False, offline_npm=True):
+    # The ``tar`` options used to extract each supported archive format
+    _archive_formats = {
+        "tar.xz": "-xf",
+        "tar.zst": "-I zstd -xf",
+        "tar": "-xf",
+    }
+
+    # Filesystem image formats which are loop-mounted rather than extracted
+    _image_formats = {"squashfs", "ext4"}
+
+    def __init__(
+        self,
+        node_version="18.13.0",
+        symlink=False,
+        offline_npm=True,
+        node_format="tar.xz",
+    ):
         """
         Initialize and install Node.js on a VM.
 
@@ -43,10 +60,27 @@ class NodeJSVM:
                 npm to run in offline mode. Since VMs in FIREWHEEL
                 experiments typically have no internet access, this
                 defaults to :py:data:`True`.
+            node_format (str): The format of the Node.js VM resource. Archives
+                (``tar.xz``, ``tar.zst``, or an uncompressed ``tar``) are extracted
+                on the VM, while filesystem images (``squashfs`` or ``ext4``) are
+                loop-mounted read-only at the install directory with no extraction.
+                The VM resource must be named
+                ``node-v<Major>.<minor>.<patch>-linux-x64.<node_format>``.
+                Defaults to ``tar.xz``, which is the format distributed by Node.js.
+
+        Raises:
+            ValueError: If ``node_format`` is not a supported format.
         """
+        supported_formats = {*self._archive_formats, *self._image_formats}
+        if node_format not in supported_formats:
+            raise ValueError(
+                f"Unsupported Node.js format '{node_format}'. Choose from: "
+                f"{', '.join(sorted(supported_formats))}"
+            )
         self.node_version = node_version
+        self.node_format = node_format
         self.node_specifier = f"node-v{self.node_version}-linux-x64"
-        self.node_archive = f"{self.node_specifier}.tar.xz"
+        self.node_archive = f"{self.node_specifier}.{self.node_format}"
         self.node_bin = None
         self.node_lib = None
         self.bash_node_prefix = None
@@ -85,21 +119,102 @@ class NodeJSVM:
         # Install Node by extracting the archive and adding symbolic links
         self._unpack_node(node_dir)
         node_bin_dir = node_dir / self.node_specifier / "bin"
-        for exe in ("node", "npm", "npx"):
-            exe_path = node_bin_dir / exe
-            link_path = self._local_bin_dir / exe
-            self.run_executable(-99, "ln", f"-sf {exe_path} {link_path}")
+        with ScheduleBatch(self, -99, "node_links") as batch:
+            for exe in ("node", "npm", "npx"):
+                exe_path = node_bin_dir / exe
+                link_path = self._local_bin_dir / exe
+                batch.add("ln", f"-sf {exe_path} {link_path}")
 
     def _unpack_node(self, extract_dir):
         # Extract and unpack the Node.js archive on the VM
+        if self.node_format in self._image_formats:
+            self._mount_node(extract_dir)
+            return
         self.unpack_tar(
             -100,
             self.node_archive,
-            options="-xf",
+            options=self._archive_formats[self.node_format],
             directory=extract_dir,
             vm_resource=True,
         )
 
+    def _mount_node(self, extract_dir):
+        # Loop-mount a Node.js filesystem image read-only where it would be extracted
+        image_path = Path("/opt/node-images") / self.node_archive
+        mount_dir = extract_dir / self.node_specifier
+        self.drop_file(-101, str(image_path), self.node_archive)
+        self.run_executable(
+            -100,
+            "bash",
+            arguments=(
+                f"-c 'mkdir -p {mount_dir} && "
+                f"mount -t {self.node_format} -o loop,ro {image_path} {mount_dir}'"
+            ),
+            vm_resource=False,
+        )
+
     def _set_offline_npm(self):
         # Set npm to run in offline mode
         self.run_executable(-50, "npm", arguments=["config", "offline", "true"])
+
+    def install_npm_packages(
+        self,
+        rel_time,
+        lockfile_bundle,
+        directory,
+        node_modules_archive=None,
+        npm_cache_archive=None,
+    ):
+        """
+        Install the npm dependencies of an application offline in a single step.
+
+        The ``lockfile_bundle`` (a tarball containing ``package.json`` and
+        ``package-lock.json``) is extracted into ``directory`` on the VM. The
+        dependencies are then installed with one command using either:
+
+        * A prebuilt ``node_modules`` archive, which is simply unpacked. It must be
+          named ``node_modules-<key>.<ext>`` where ``<key>`` is the first 16 hex
+          digits of the SHA-256 hash of ``package-lock.json`` (e.g. created with
+          ``tar -czf node_modules-$(sha256sum package-lock.json | cut -c1-16).tgz
+          node_modules``). An archive which does not match the lockfile is ignored.
+        * An npm cache archive (e.g. a tarball of ``~/.npm``), from which every
+          package is installed with ``npm ci --offline``.
+
+        If both are given, the cache is only used when the prebuilt archive does not
+        match the lockfile.
+
+        Args:
+            rel_time (int): The time at which to install the packages. This must be
+                after Node.js is installed (i.e. greater than -64).
+            lockfile_bundle (str): The VM resource containing ``package.json`` and
+                ``package-lock.json``.
+            directory (str): The application directory on the VM.
+            node_modules_archive (str): The VM resource containing a prebuilt
+                ``node_modules`` directory keyed by the lockfile hash.
+            npm_cache_archive (str): The VM resource containing an npm cache.
+
+        Raises:
+            ValueError: If neither ``node_modules_archive`` nor ``npm_cache_archive``
+                is provided.
+        """
+        if not node_modules_archive and not npm_cache_archive:
+            raise ValueError(
+                "Either a node_modules archive or an npm cache archive is required."
+            )
+
+        arguments = f"-d {directory} -l {lockfile_bundle}"
+        bundles = [lockfile_bundle]
+        if node_modules_archive:
+            arguments += f" -m {node_modules_archive}"
+            bundles.append(node_modules_archive)
+        if npm_cache_archive:
+            arguments += f" -c {npm_cache_archive}"
+            bundles.append(npm_cache_archive)
+        if self.node_bin:
+            arguments += f" -b {self.node_bin}"
+
+        install_sched_entry = self.run_executable(
+            rel_time, "install_npm_packages.sh", arguments, vm_resource=True
+        )
+        for bundle in bundles:
+            install_sched_entry.add_file(bundle, bundle)
@@ -0,0 +1,42 @@
+#!/bin/bash
+
+# This script benchmarks how long it takes before Node.js can run on a VM for
+# each supported VM resource format. It is meant to be run on a stock VM image
+# (e.g. via run_executable with vm_resource=True) with one Node.js artifact per
+# format dropped next to it. Archives are extracted and filesystem images are
+# loop-mounted into a scratch directory (with a cold page cache), then the time
+# until 'node --version' first succeeds is reported as one JSON line per artifact.
+
+# Usage: benchmark_node_startup.sh <artifact> [<artifact> ...]
+
+SCRATCH=$(mktemp -d)
+trap 'umount "${SCRATCH}/out" 2> /dev/null; rm -rf "${SCRATCH}"' EXIT
+
+cd "$(dirname "$0")" || exit 1
+
+for ARTIFACT in "$@"; do
+    sync
+    echo 3 > /proc/sys/vm/drop_caches 2> /dev/null
+    mkdir -p "${SCRATCH}/out"
+
+    START=$(date +%s%N)
+    case "${ARTIFACT}" in
+        *.tar.xz|*.tar) tar -C "${SCRATCH}/out" -xf "${ARTIFACT}" --strip-components=1 ;;
+        *.tar.zst) tar -C "${SCRATCH}/out" -I zstd -xf "${ARTIFACT}" --strip-components=1 ;;
+        *.squashfs) mount -t squashfs -o loop,ro "${ARTIFACT}" "${SCRATCH}/out" ;;
+        *.ext4) mount -t ext4 -o loop,ro "${ARTIFACT}" "${SCRATCH}/out" ;;
+        *)
+            echo "{\"artifact\": \"${ARTIFACT}\", \"error\": \"unknown format\"}"
+            continue
+            ;;
+    esac
+    INSTALLED=$(date +%s%N)
+    "${SCRATCH}/out/bin/node" --version > /dev/null
+    RESULT=$?
+    END=$(date +%s%N)
+
+    umount "${SCRATCH}/out" 2> /dev/null
+    rm -rf "${SCRATCH}/out"
+
+    echo "{\"artifact\": \"${ARTIFACT}\", \"bytes\": $(stat -c %s "${ARTIFACT}"), \"install_ms\": $(( (INSTALLED - START) / 1000000 )), \"first_run_ms\": $(( (END - INSTALLED) / 1000000 )), \"exit_code\": ${RESULT}, \"hostname\": \"$(hostname)\"}"
+done
@@ -0,0 +1,76 @@
+#!/bin/bash
+
+# This script installs the npm dependencies of a Node.js application without
+# network access, using a single command per VM.
+# The lockfile bundle (a tarball with package.json and package-lock.json) is
+# extracted into the target directory. If a prebuilt node_modules archive keyed by
+# the lockfile's hash was provided, it is unpacked directly. Otherwise, 'npm ci
+# --offline' installs every package at once from the provided npm cache tarball.
+
+# Usage: install_npm_packages.sh -d <directory> -l <lockfile bundle>
+#            [-m <node_modules archive>] [-c <npm cache archive>] [-b <node bin dir>]
+
+while getopts "d:l:m:c:b:" OPT; do
+    case "${OPT}" in
+        d) TARGET=${OPTARG} ;;
+        l) LOCKFILE_BUNDLE=${OPTARG} ;;
+        m) MODULES_ARCHIVE=${OPTARG} ;;
+        c) CACHE_ARCHIVE=${OPTARG} ;;
+        b) export PATH="${PATH}:${OPTARG}" ;;
+        *) exit 1 ;;
+    esac
+done
+
+# The bundles are dropped next to this script
+cd "$(dirname "$0")" || exit 1
+SOURCE_DIR=$(pwd)
+
+function report() {
+    echo "{\"vm_resource\": \"install_npm_packages\", \"directory\": \"${TARGET}\", \"method\": \"$1\", \"status\": \"$2\", \"hostname\": \"$(hostname)\"}"
+}
+
+mkdir -p "${TARGET}"
+tar -C "${TARGET}" -xf "${SOURCE_DIR}/${LOCKFILE_BUNDLE}" || exit 1
+if [ ! -f "${TARGET}/package-lock.json" ]; then
+    report "none" "missing_lockfile"
+    exit 1
+fi
+
+# Prebuilt archives are named node_modules-<first 16 hex digits of sha256(package-lock.json)>
+KEY=$(sha256sum "${TARGET}/package-lock.json" | cut -c1-16)
+if [ -n "${MODULES_ARCHIVE}" ]; then
+    case "${MODULES_ARCHIVE}" in
+        node_modules-${KEY}.*)
+            tar -C "${TARGET}" -xf "${SOURCE_DIR}/${MODULES_ARCHIVE}"
+            RESULT=$?
+            if [ ${RESULT} -eq 0 ]; then
+                report "prebuilt" "success"
+            else
+                report "prebuilt" "failure"
+            fi
+            exit ${RESULT}
+            ;;
+        *)
+            report "prebuilt" "stale_archive_expected_node_modules-${KEY}"
+            ;;
+    esac
+fi
+
+if [ -z "${CACHE_ARCHIVE}" ]; then
+    report "none" "no_usable_source"
+    exit 1
+fi
+
+CACHE_DIR=$(mktemp -d)
+trap 'rm -rf "${CACHE_DIR}"' EXIT
+tar -C "${CACHE_DIR}" -xf "${SOURCE_DIR}/${CACHE_ARCHIVE}" || exit 1
+
+cd "${TARGET}" || exit 1
+npm ci --offline --no-audit --no-fund --cache "${CACHE_DIR}"
+RESULT=$?
+if [ ${RESULT} -eq 0 ]; then
+    report "npm_ci" "success"
+else
+    report "npm_ci" "failure"
+fi
+exit ${RESULT}
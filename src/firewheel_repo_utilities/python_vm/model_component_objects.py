@@ -1,9 +1,98 @@
+import os
+import sys
 import json
 import shlex
+import hashlib
+import tempfile
+import subprocess
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 from base_objects import VMEndpoint
 
 from firewheel.control.experiment_graph import require_class
+from firewheel.vm_resource_manager.vm_resource_store import VmResourceStore
+
+# The MC's VM resources, used to detect which compiled runtime layout is installed
+VM_RESOURCES_DIR = Path(__file__).resolve().parent / "vm_resources"
+
+# Directories which do not affect a built wheel and are skipped when hashing sources
+_IGNORED_SOURCE_DIRS = {".git", ".hg", ".tox", ".eggs", "__pycache__", "build", "dist"}
+
+
+def _hash_source_tree(source_dir):
+    """
+    Compute a content hash of a Python source tree.
+
+    Arguments:
+        source_dir (str): The path to the source tree.
+
+    Returns:
+        str: The hex-encoded SHA-256 digest of every file's path and contents.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(source_dir):
+        # Sort in place so that the walk (and therefore the hash) is deterministic
+        dirs[:] = sorted(
+            d
+            for d in dirs
+            if d not in _IGNORED_SOURCE_DIRS and not d.endswith(".egg-info")
+        )
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, source_dir).encode())
+            with open(path, "rb") as fhand:
+                for chunk in iter(partial(fhand.read, 1024 * 1024), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _build_wheel(source_dir, cache_dir):
+    """
+    Build a wheel for a source tree, reusing a cached wheel if the sources are unchanged.
+
+    This is run from a worker thread so that multiple source trees can be hashed
+    and built in parallel.
+
+    Arguments:
+        source_dir (str): The path to the source tree on the host.
+        cache_dir (str): The directory in which wheels are cached by source hash.
+
+    Returns:
+        str: The path to the built (or cached) wheel.
+
+    Raises:
+        RuntimeError: If ``pip wheel`` fails or does not produce exactly one wheel.
+    """
+    wheel_dir = Path(cache_dir) / _hash_source_tree(source_dir)
+    wheels = list(wheel_dir.glob("*.whl"))
+    if len(wheels) != 1:
+        wheel_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=wheel_dir.parent) as build_dir:
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "pip",
+                    "wheel",
+                    "--no-deps",
+                    "--wheel-dir",
+                    build_dir,
+                    source_dir,
+                ],
+                capture_output=True,
+                check=False,
+            )
+            wheels = list(Path(build_dir).glob("*.whl"))
+            if result.returncode != 0 or len(wheels) != 1:
+                raise RuntimeError(
+                    f"Unable to build a wheel for {source_dir}: {result.stderr.decode()}"
+                )
+            # Move into place only once the build succeeded so that partial
+            # builds are never mistaken for cached wheels
+            wheels = [wheels[0].rename(wheel_dir / wheels[0].name)]
+    return str(wheels[0])
 
 
 @require_class(VMEndpoint)
@@ -13,14 +102,85 @@ class PythonVM:
     packages onto a VM.
     """
 
-    def __init__(self):
-        """Initialize the installed python version (if any)."""
+    # Maps an image name to the set of Python executables which are known to
+    # already ship with a recent enough pip. This is shared by every decorated
+    # VM so that a capability only needs to be discovered once per image.
+    _image_capabilities = {}
+
+    # The minimum pip version which satisfies the bundled ``get-pip.py`` install.
+    _required_pip_version = "22.2.2"
+
+    # The archive extension and ``tar`` decompression option for each codec
+    # supported for compiled Python runtimes.
+    _runtime_codecs = {
+        "gzip": ("tar.gz", '-I "$(command -v pigz || echo gzip)"'),
+        "zstd": ("tar.zst", "-I zstd"),
+        "lz4": ("tar.lz4", "-I lz4"),
+        "none": ("tar", ""),
+    }
+
+    def __init__(self, probe=False):
+        """
+        Initialize the installed python version (if any).
+
+        Arguments:
+            probe (bool): Whether to check the VM for an existing pip before running
+                ``get-pip.py``. When :py:data:`True`, the ``ensure_pip.sh`` VM resource
+                only runs ``get-pip.py`` if pip is missing or out of date. The graph is
+                built before any VM boots, so ``get-pip.py`` and its wheels are still
+                copied to every VM. Nothing is scheduled at all (neither the pip
+                bootstrap files nor the Python packages) only for images registered
+                with :py:meth:`utilities.python.PythonVM.register_image_capabilities`.
+                Defaults to :py:data:`False`.
+        """
         self.python_version_installed = {}
+        self.probe = probe
+
+    @classmethod
+    def register_image_capabilities(cls, image, python_versions):
+        """
+        Record that an image already provides the given Python executables with pip.
+
+        When a VM using ``image`` is decorated with ``probe=True``, the install steps
+        for these executables are skipped entirely. This is typically populated from
+        the output of the ``ensure_pip.sh`` VM resource on a previous experiment.
+
+        >>> PythonVM.register_image_capabilities("ubuntu-22.04-server.qcow2", "python3")
+
+        Arguments:
+            image (str): The name of the VM image.
+            python_versions (list): Python executables (e.g. ``python3.10``) which
+                already have pip available on the image.
+        """
+        if isinstance(python_versions, str):
+            python_versions = [python_versions]
+        cls._image_capabilities.setdefault(image, set()).update(python_versions)
+
+    def _image_provides(self, python_version):
+        """
+        Check whether this VM's image is known to already provide an executable.
+
+        Arguments:
+            python_version (str): The Python executable to check (e.g. ``python3``).
+
+        Returns:
+            bool: :py:data:`True` if probing is enabled and the image is registered as
+            providing the executable with pip, :py:data:`False` otherwise.
+        """
+        if not self.probe:
+            return False
+        image = getattr(self, "vm", {}).get("image")
+        return python_version in self._image_capabilities.get(image, ())
 
     def _install_pip(self, python_version="python"):
         """
         Install a version of pip at time -1000.
 
+        If probing is enabled, the ``ensure_pip.sh`` VM resource is used so that
+        ``get-pip.py`` only runs when the VM does not already have a recent enough pip.
+        The bootstrap files are still dropped on the VM, unless the image is registered
+        with :py:meth:`utilities.python.PythonVM.register_image_capabilities`.
+
         Arguments:
             python_version (str): Python executable to use e.g. ``python`` for default,
                 ``python3``, ``python3.5`` etc..
@@ -40,13 +200,23 @@ class PythonVM:
             raise NotImplementedError
         else:
             raise NotImplementedError
+        if self._image_provides(python_version):
+            self.python_version_installed[python_version] = True
         if (
             python_version not in self.python_version_installed
             or not self.python_version_installed[python_version]
         ):
-            pip_install_sched_entry = self.run_executable(
-                -1000, python_version, "get-pip.py *.whl", vm_resource=False
-            )
+            if self.probe:
+                pip_install_sched_entry = self.run_executable(
+                    -1000,
+                    "ensure_pip.sh",
+                    f"{python_version} {self._required_pip_version}",
+                    vm_resource=True,
+                )
+            else:
+                pip_install_sched_entry = self.run_executable(
+                    -1000, python_version, "get-pip.py *.whl", vm_resource=False
+                )
             elems = [
                 "get-pip.py",
                 "setuptools-65.5.1-py3-none-any.whl",
@@ -57,17 +227,32 @@ class PythonVM:
                 pip_install_sched_entry.add_file(elem, elem)
             self.python_version_installed[python_version] = True
 
-    def install_python(self, python_version="3.7", compiled=False):
+    def install_python(self, python_version="3.7", compiled=False, codec="gzip"):
         """
         Install a newer version of Python on a VM at time -1001.
 
+        The compiled runtime is read from the single ``xenial_python3.7_compiled``
+        archive. Installs which predate it and only have the per-directory
+        ``xenial_python3.7_{bin,include,lib}.tgz`` resources keep using those.
+
         Arguments:
             python_version (str): Python minor version to use e.g. ``3.7`` for default.
             compiled (bool): Whether to use the compiled version or pre-built packages.
+            codec (str): The compression codec of the compiled runtime archive. One of
+                ``gzip`` (decompressed with ``pigz`` when available), ``zstd``, ``lz4``,
+                or ``none`` for an uncompressed tarball. Only used when ``compiled`` is
+                :py:data:`True`. Defaults to ``gzip``.
 
         Raises:
             NotImplementedError: If the OS or Python version is not supported by this MC.
+            ValueError: If ``codec`` is not a supported compression codec.
         """
+        if compiled and codec not in self._runtime_codecs:
+            raise ValueError(
+                f"Unsupported codec '{codec}'. Choose from: "
+                f"{', '.join(sorted(self._runtime_codecs))}"
+            )
+
         determined_os = ""
         for dec in self.decorators:
             if "ubuntu1604" in dec.__name__.lower():
@@ -92,55 +277,18 @@ class PythonVM:
                 f"Currently only support Python versions {', '.join(supported_python_versions)}"
             )
 
+        if self._image_provides(f"python{python_version}"):
+            # The image already ships this interpreter, so there is nothing to do
+            self.python_version_installed[python_version] = True
+            return
+
         if determined_os == "xenial" and python_version == "3.7":
             if not compiled:
                 self.install_debs(-1001, "xenial_python_3.7.tgz")
+            elif self._has_legacy_runtime(python_version, codec):
+                self._unpack_legacy_runtime(python_version)
             else:
-                self.drop_file(
-                    -1002,
-                    "/home/ubuntu/xenial_python3.7_lib.tgz",
-                    "xenial_python3.7_lib.tgz",
-                )
-                self.drop_file(
-                    -1002,
-                    "/home/ubuntu/xenial_python3.7_bin.tgz",
-                    "xenial_python3.7_bin.tgz",
-                )
-                self.drop_file(
-                    -1002,
-                    "/home/ubuntu/xenial_python3.7_include.tgz",
-                    "xenial_python3.7_include.tgz",
-                )
-                self.run_executable(
-                    -1001,
-                    "/bin/tar",
-                    arguments=[
-                        "-C /usr/local/lib/",
-                        "-xvzf",
-                        "/home/ubuntu/xenial_python3.7_lib.tgz",
-                    ],
-                    vm_resource=False,
-                )
-                self.run_executable(
-                    -1001,
-                    "/bin/tar",
-                    arguments=[
-                        "-C /usr/local/bin/",
-                        "-xvzf",
-                        "/home/ubuntu/xenial_python3.7_bin.tgz",
-                    ],
-                    vm_resource=False,
-                )
-                self.run_executable(
-                    -1001,
-                    "/bin/tar",
-                    arguments=[
-                        "-C /usr/local/include/",
-                        "-xvzf",
-                        "/home/ubuntu/xenial_python3.7_include.tgz",
-                    ],
-                    vm_resource=False,
-                )
+                self._unpack_runtime(f"xenial_python{python_version}_compiled", codec)
             self.python_version_installed[python_version] = True
         elif determined_os == "jammy" and python_version == "3.10":
             # Python3.10 comes preinstalled on Jammy, so no need to do anything
@@ -150,7 +298,87 @@ class PythonVM:
                 f"No support for installing {python_version} on {determined_os}"
             )
 
-    def install_from_source(self, rel_time, paths, python_version="python"):
+    def _unpack_runtime(self, runtime_name, codec):
+        """
+        Extract a compiled Python runtime into ``/usr/local`` at time -1001.
+
+        The runtime is a single archive containing the ``bin``, ``lib``, and
+        ``include`` directories relative to ``/usr/local``, so it is extracted
+        in one quiet pass and removed afterwards.
+
+        Arguments:
+            runtime_name (str): The archive name without its extension
+                (e.g. ``xenial_python3.7_compiled``).
+            codec (str): The compression codec of the archive.
+        """
+        extension, decompress = self._runtime_codecs[codec]
+        archive = f"{runtime_name}.{extension}"
+        unpack_sched_entry = self.run_executable(
+            -1001,
+            "/bin/bash",
+            arguments=f"-c 'tar -C /usr/local/ {decompress} -xf {archive} && rm -f {archive}'",
+            vm_resource=False,
+        )
+        unpack_sched_entry.add_file(archive, archive)
+
+    @classmethod
+    def _has_legacy_runtime(cls, python_version, codec):
+        """
+        Check whether only the legacy per-directory compiled runtime is installed.
+
+        Arguments:
+            python_version (str): The Python minor version (e.g. ``3.7``).
+            codec (str): The compression codec of the single-archive runtime.
+
+        Returns:
+            bool: :py:data:`True` if the single-archive runtime is missing from the MC's
+            VM resources but every legacy ``.tgz`` archive is present.
+        """
+        extension = cls._runtime_codecs[codec][0]
+        archive = f"xenial_python{python_version}_compiled.{extension}"
+        if any(VM_RESOURCES_DIR.rglob(archive)):
+            return False
+        return all(
+            any(VM_RESOURCES_DIR.rglob(f"xenial_python{python_version}_{part}.tgz"))
+            for part in ("bin", "include", "lib")
+        )
+
+    def _unpack_legacy_runtime(self, python_version):
+        """
+        Extract the legacy per-directory compiled Python runtime at time -1001.
+
+        Each of the ``bin``, ``include``, and ``lib`` archives is dropped at
+        time -1002 and extracted into the matching ``/usr/local`` directory.
+
+        Arguments:
+            python_version (str): The Python minor version (e.g. ``3.7``).
+        """
+        for part in ("lib", "bin", "include"):
+            archive = f"xenial_python{python_version}_{part}.tgz"
+            self.drop_file(-1002, f"/home/ubuntu/{archive}", archive)
+            self.run_executable(
+                -1001,
+                "/bin/tar",
+                arguments=[
+                    f"-C /usr/local/{part}/",
+                    "-xvzf",
+                    f"/home/ubuntu/{archive}",
+                ],
+                vm_resource=False,
+            )
+
+    # Maps a host source directory and wheel cache to the name of its wheel in the VM
+    # resource store so that each source tree is only built once per experiment.
+    _source_wheels = {}
+
+    def install_from_source(
+        self,
+        rel_time,
+        paths,
+        python_version="python",
+        build_on_host=False,
+        cache_dir=None,
+    ):
         """
         Install a list python packages from source. It expects to find a path to
         the source code for the various packages. That is, if you want
@@ -162,22 +390,77 @@ class PythonVM:
         Then on the system, the folder ``/home/ubuntu/requests`` should contain the
         requests source code.
 
+        Alternatively, with ``build_on_host=True``, ``paths`` are source trees on the
+        host. A wheel is built for each tree once (in parallel ``pip wheel`` processes),
+        cached by a hash of the sources, added to the VM resource store, and then
+        installed with :py:meth:`utilities.python.PythonVM.install_pip_package_list`.
+        This means VMs never compile the sources. Note that the wheels are built with
+        the host's Python, so this is best suited to pure-Python packages or hosts
+        matching the VM's Python version and platform.
+
         Args:
             rel_time (int): Relative time at which to run the installation.
                 Must be greater than -1000.
             paths (list): List of folder names for the package being installed.
             python_version (str): python executable to use e.g. python for default, python3, etc.
+            build_on_host (bool): Whether ``paths`` are host source trees which should be
+                built into wheels on the host. Defaults to :py:data:`False`.
+            cache_dir (str): The host directory in which built wheels are cached. Defaults
+                to ``~/.cache/firewheel/wheels``.
         """
-        self._install_pip(python_version)
         if isinstance(paths, str):
             paths = [paths]
 
+        if build_on_host:
+            self.install_pip_package_list(
+                rel_time,
+                self._build_source_wheels(paths, cache_dir),
+                python_version=python_version,
+            )
+            return
+
+        self._install_pip(python_version)
+
         # Need to change dir, then install
         for path in paths:
             self.run_executable(
                 rel_time, "cd", arguments=f"{path}; {python_version} setup.py install"
             )
 
+    def _build_source_wheels(self, paths, cache_dir=None):
+        """
+        Build wheels for host source trees and add them to the VM resource store.
+
+        Arguments:
+            paths (list): Source trees on the host.
+            cache_dir (str): The host directory in which built wheels are cached.
+
+        Returns:
+            list: The wheel names (as VM resources) in the same order as ``paths``.
+        """
+        if cache_dir is None:
+            cache_dir = Path.home() / ".cache" / "firewheel" / "wheels"
+        cache_dir = str(Path(cache_dir).resolve())
+        paths = [str(Path(path).resolve()) for path in paths]
+
+        new_paths = [
+            path for path in paths if (path, cache_dir) not in self._source_wheels
+        ]
+        if new_paths:
+            # Each build runs in its own ``pip wheel`` process and hashlib releases
+            # the GIL while hashing, so threads are enough to drive them in parallel
+            workers = min(len(new_paths), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                wheels = executor.map(
+                    _build_wheel, new_paths, [cache_dir] * len(new_paths)
+                )
+                vm_resource_store = VmResourceStore()
+                for path, wheel in zip(new_paths, wheels):
+                    vm_resource_store.add_file(wheel)
+                    self._source_wheels[path, cache_dir] = Path(wheel).name
+
+        return [self._source_wheels[path, cache_dir] for path in paths]
+
     def install_pip_package_list(
         self, rel_time, package_names, pip_args=None, python_version="python"
     ):
@@ -0,0 +1,45 @@
+#!/bin/bash
+
+# This script benchmarks how long it takes to extract a compiled Python runtime
+# archive with each supported codec. It is meant to be run on a stock VM image
+# (e.g. via run_executable with vm_resource=True) with one archive per codec dropped
+# next to it. Each archive is extracted into a fresh scratch directory with the page
+# cache dropped beforehand, and one JSON line is printed per archive.
+
+# Usage: benchmark_runtime_extract.sh <archive> [<archive> ...]
+
+SCRATCH=$(mktemp -d)
+trap 'rm -rf "${SCRATCH}"' EXIT
+
+cd "$(dirname "$0")" || exit 1
+
+function decompress_option() {
+    case "$1" in
+        *.tar.gz|*.tgz) echo "-I $(command -v pigz || echo gzip)" ;;
+        *.tar.zst) echo "-I zstd" ;;
+        *.tar.lz4) echo "-I lz4" ;;
+        *.tar) echo "" ;;
+        *) return 1 ;;
+    esac
+}
+
+for ARCHIVE in "$@"; do
+    if ! OPTION=$(decompress_option "${ARCHIVE}"); then
+        echo "{\"archive\": \"${ARCHIVE}\", \"error\": \"unknown codec\"}"
+        continue
+    fi
+
+    # Start each run with a cold page cache so the archives are compared fairly
+    sync
+    echo 3 > /proc/sys/vm/drop_caches 2> /dev/null
+
+    mkdir -p "${SCRATCH}/out"
+    START=$(date +%s%N)
+    # shellcheck disable=SC2086
+    tar -C "${SCRATCH}/out" ${OPTION} -xf "${ARCHIVE}"
+    RESULT=$?
+    END=$(date +%s%N)
+    rm -rf "${SCRATCH}/out"
+
+    echo "{\"archive\": \"${ARCHIVE}\", \"option\": \"${OPTION}\", \"bytes\": $(stat -c %s "${ARCHIVE}"), \"milliseconds\": $(( (END - START) / 1000000 )), \"exit_code\": ${RESULT}, \"hostname\": \"$(hostname)\"}"
+done
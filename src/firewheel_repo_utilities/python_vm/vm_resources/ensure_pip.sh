@@ -0,0 +1,54 @@
+#!/bin/bash
+
+# This script installs pip for a Python interpreter only when it is needed.
+# If the interpreter already provides a pip at least as new as the required
+# version, the (comparatively slow) get-pip.py installation is skipped.
+# The result of the probe is printed as JSON so that it can be used to
+# register the capabilities of an image with PythonVM.register_image_capabilities.
+
+# PYTHON is the Python executable to check (e.g. python3.10)
+# REQUIRED_PIP is the minimum acceptable pip version (e.g. 22.2.2)
+
+PYTHON=$1
+REQUIRED_PIP=$2
+
+# The get-pip.py script and wheels are dropped next to this script
+cd "$(dirname "$0")" || exit 1
+
+function report() {
+    echo "{\"vm_resource\": \"ensure_pip\", \"python\": \"${PYTHON}\", \"hostname\": \"$(hostname)\", \"status\": \"$1\"}"
+}
+
+if ! command -v "${PYTHON}" > /dev/null 2>&1; then
+    report "missing_interpreter"
+    exit 1
+fi
+
+if "${PYTHON}" - "${REQUIRED_PIP}" <<'PROBE'
+import sys
+
+try:
+    import pip
+except ImportError:
+    sys.exit(1)
+
+
+def version(text):
+    return tuple(int(part) for part in text.split(".")[:3] if part.isdigit())
+
+
+sys.exit(0 if version(pip.__version__) >= version(sys.argv[1]) else 1)
+PROBE
+then
+    report "pip_present"
+    exit 0
+fi
+
+"${PYTHON}" get-pip.py *.whl
+RESULT=$?
+if [ ${RESULT} -eq 0 ]; then
+    report "pip_installed"
+else
+    report "pip_install_failed"
+fi
+exit ${RESULT}
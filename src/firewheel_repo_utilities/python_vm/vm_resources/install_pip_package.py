@@ -3,6 +3,8 @@ import os
 import sys
 import json
 import time
+import fcntl
+import hashlib
 import tarfile
 from subprocess import PIPE, Popen
 
@@ -78,41 +80,130 @@ class InstallPipPackage(object):
 
         self.static_file = static_file
 
-        self.pip_lock = "/tmp/pip-lock"
+        self.pip_lock = "/tmp/pip.lock"
 
-    def run(self):
+    def _bundle_digest(self):
         """
-        Perform all the major work of installing 1 or more Python packages.
+        Compute a content hash which uniquely identifies this installation.
+
+        The digest covers the bytes of the static tarball as well as the
+        requested packages and interpreter, so installing a different set of
+        packages from the same bundle is not mistaken for a repeat run.
+
+        Returns:
+            str: The hex-encoded SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        with open(self.static_file, "rb") as fhand:
+            for chunk in iter(lambda: fhand.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest.update(
+            json.dumps(
+                [self.config["packages"], self.config.get("python_version")]
+            ).encode("utf-8")
+        )
+        return digest.hexdigest()
+
+    def _read_marker(self, marker):
+        """
+        Read a previously written marker file.
+
+        Arguments:
+            marker (str): The path to the marker file.
+
+        Returns:
+            str: The digest stored in the marker or ``None`` if it does not exist.
+        """
+        try:
+            with open(marker, "r", encoding="utf-8") as fhand:
+                return fhand.read().strip()
+        except OSError:
+            return None
+
+    def _write_marker(self, marker, bundle_digest):
+        """
+        Atomically record that a phase completed for the given digest.
+
+        Arguments:
+            marker (str): The path to the marker file.
+            bundle_digest (str): The digest to store.
+        """
+        tmp_marker = "%s.%d" % (marker, os.getpid())
+        with open(tmp_marker, "w", encoding="utf-8") as fhand:
+            fhand.write(bundle_digest)
+        os.rename(tmp_marker, marker)
+
+    def _find_static_dir(self):
+        """
+        Locate the extracted directory which contains the pip files.
+
+        Returns:
+            str: The path to the directory containing the pip packages.
 
         Raises:
             OSError: If the tarfile is in an invalid format.
         """
-        # untar the static files
-        with tarfile.open(self.static_file) as tar:
-            tar.extractall(path=self.install_dir)
-
-        # Verify our extract and get the directory name with actual pip files.
-        untared_contents = os.listdir(self.install_dir)
+        # Marker files are hidden so they are not counted as tarball contents.
+        untared_contents = [
+            name for name in os.listdir(self.install_dir) if not name.startswith(".")
+        ]
         if len(untared_contents) != 1 or not os.path.isdir(
             os.path.join(self.install_dir, untared_contents[0])
         ):
             raise OSError("Invalid tarfile format: Need exactly 1 directory.")
+        return os.path.join(self.install_dir, untared_contents[0])
+
+    def run(self):
+        """
+        Perform all the major work of installing 1 or more Python packages.
+
+        The work is split into phases (hashing, extracting, waiting on the pip
+        lock, and installing) whose durations are reported when the run completes.
+        Extraction and installation are skipped when the marker files show that
+        the same bundle was already handled on this VM.
+
+        Raises:
+            OSError: If the tarfile is in an invalid format.
+        """
+        timings = {}
+        start = time.time()
+        bundle_digest = self._bundle_digest()
+        timings["hash"] = time.time() - start
+
+        installed_marker = os.path.join(self.install_dir, ".installed")
+        if self._read_marker(installed_marker) == bundle_digest:
+            self._report(
+                "skipped",
+                "Packages %s already installed" % ", ".join(self.config["packages"]),
+                timings,
+            )
+            return
 
-        # Acquire a file-system lock for running pip
-        while True:
-            try:
-                os.mkdir(self.pip_lock)
-                break
-            except OSError:
-                time.sleep(1)
+        # untar the static files
+        start = time.time()
+        extracted_marker = os.path.join(self.install_dir, ".extracted")
+        if self._read_marker(extracted_marker) != bundle_digest:
+            with tarfile.open(self.static_file) as tar:
+                tar.extractall(path=self.install_dir)
+            self._write_marker(extracted_marker, bundle_digest)
+        static_dir = self._find_static_dir()
+        timings["extract"] = time.time() - start
 
-        # now that we have the files to install, install them
-        static_dir = os.path.join(self.install_dir, untared_contents[0])
         if self.config.get("python_version"):
             python_version = self.config["python_version"]
         else:
             python_version = "python"
-        for package in self.config["packages"]:
+
+        # Acquire a file-system lock for running pip. The lock is released
+        # by the kernel if this process dies, so it can never be left stale.
+        start = time.time()
+        with open(self.pip_lock, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            timings["lock_wait"] = time.time() - start
+
+            # Install every package in a single pip invocation so that the
+            # dependency resolution and interpreter start-up only happen once.
+            start = time.time()
             # pylint: disable=consider-using-with
             install = Popen(
                 [
@@ -122,29 +213,54 @@ class InstallPipPackage(object):
                     "install",
                     "--no-index",
                     "--find-links=%s" % static_dir,
-                    package,
-                ],
+                ]
+                + list(self.config["packages"]),
                 stdout=PIPE,
                 stderr=PIPE,
             )
-
             output = install.communicate()
-            if install.returncode != 0:
-                # Output is a tuple (<stdout>, <stderr>)
-                print(output[1])
+            timings["install"] = time.time() - start
 
-            print(
-                json.dumps(
-                    {
-                        "vm_resource": "InstallPipPackage",
-                        "status": "success",
-                        "message": "Installed package %s" % package,
-                    }
-                )
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        if install.returncode != 0:
+            # Output is a tuple (<stdout>, <stderr>)
+            print(output[1])
+            self._report(
+                "failure",
+                "Failed to install packages %s" % ", ".join(self.config["packages"]),
+                timings,
             )
+            return
+
+        self._write_marker(installed_marker, bundle_digest)
+        self._report(
+            "success",
+            "Installed packages %s" % ", ".join(self.config["packages"]),
+            timings,
+        )
 
-        # Release the file-system pip lock
-        os.rmdir(self.pip_lock)
+    def _report(self, status, message, timings):
+        """
+        Print the result of the run along with the time spent in each phase.
+
+        Arguments:
+            status (str): The status of the installation.
+            message (str): A human readable description of the result.
+            timings (dict): A mapping of phase names to durations in seconds.
+        """
+        print(
+            json.dumps(
+                {
+                    "vm_resource": "InstallPipPackage",
+                    "status": status,
+                    "message": message,
+                    "timings": {
+                        phase: round(duration, 3) for phase, duration in timings.items()
+                    },
+                }
+            )
+        )
 
 
 if __name__ == "__main__":
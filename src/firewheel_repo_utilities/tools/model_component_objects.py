@@ -1,11 +1,166 @@
 """This module contains all necessary Model Component Objects for utilities.tools."""
 
+import json
+import shlex
+
+
+class ScheduleBatch:
+    """
+    Collects independent shell steps for a VM so that they run from a single
+    generated script (and therefore a single schedule entry) rather than one
+    schedule entry and agent dispatch per step.
+
+    Each step has a time, which defaults to the ``time`` of the batch. Steps whose
+    times are within ``window`` seconds of the earliest step not yet merged run
+    together at that earliest time, ordered by their times (and then in the order
+    they were added). A step is therefore moved earlier by at most ``window``
+    seconds, so it must not depend on any other schedule entry in between (such as
+    a file dropped by another model component); with the default ``window`` of
+    ``0``, only steps at exactly the same time are merged.
+
+    A failing step does not prevent later steps from running; instead, each step's
+    exit status is printed as a JSON line and the script exits with the status of
+    the last failing step (if any). This is typically used via
+    :py:meth:`utilities.tools.Utilities.batched_steps`, although it can be used on
+    any VM vertex without the ``Utilities`` decorator.
+    """
+
+    def __init__(self, vm, time, name, window=0):
+        """
+        Initialize an empty batch.
+
+        Arguments:
+            vm (Vertex): The VM on which the steps will run.
+            time (int): The default time of the steps.
+            name (str): A short name for the batch, used to name the generated script.
+            window (int): How many seconds after the earliest step later steps may
+                be and still be merged with it. Defaults to ``0``.
+        """
+        self.vm = vm
+        self.time = time
+        self.name = name
+        self.window = window
+        self.steps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, program, arguments="", time=None):
+        """
+        Append a shell step to the batch.
+
+        Arguments:
+            program (str): The program to run (e.g. ``ln``).
+            arguments (str): The arguments for the program.
+            time (int): The time at which the step would otherwise be scheduled.
+                Defaults to the ``time`` of the batch.
+        """
+        self.steps.append((self.time if time is None else time, program, arguments))
+
+    def groups(self):
+        """
+        Split the steps into the groups which are merged into one schedule entry.
+
+        Returns:
+            list: The ``(time, steps)`` of each group, where ``steps`` are the
+            ``(program, arguments)`` of its steps, in the order in which they run.
+        """
+        groups = []
+        for time, program, arguments in sorted(self.steps, key=lambda step: step[0]):
+            if not groups or time - groups[-1][0] > self.window:
+                groups.append((time, []))
+            groups[-1][1].append((program, arguments))
+        return groups
+
+    def script(self, steps=None):
+        """
+        Generate the script which runs the steps.
+
+        Arguments:
+            steps (list): The ``(program, arguments)`` of the steps to run. Defaults
+                to every step in the batch.
+
+        Returns:
+            str: The contents of the bash script.
+        """
+        if steps is None:
+            steps = [step for _time, group in self.groups() for step in group]
+        lines = ["#!/bin/bash", "FAILED=0"]
+        for index, (program, arguments) in enumerate(steps):
+            # Everything but the (dynamic) exit status of the JSON status line
+            status_prefix = (
+                json.dumps({"batch": self.name, "step": index, "program": program})[:-1]
+                + ', "exit_code": '
+            )
+            lines += [
+                f"{program} {arguments}".strip(),
+                "STATUS=$?",
+                '[ "${STATUS}" -ne 0 ] && FAILED=${STATUS}',
+                f'echo {shlex.quote(status_prefix)}"${{STATUS}}}}"',
+            ]
+        lines.append("exit ${FAILED}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """
+        Schedule the batch on the VM, as one schedule entry per group of steps
+        (see :py:meth:`groups`).
+
+        A group with a single step is scheduled directly, as generating a script
+        would not save anything.
+
+        Returns:
+            list: The schedule entries running the batch.
+        """
+        sched_entries = []
+        for time, steps in self.groups():
+            if len(steps) == 1:
+                program, arguments = steps[0]
+                sched_entries.append(
+                    self.vm.run_executable(time, program, arguments, vm_resource=False)
+                )
+                continue
+            script_name = f"batch_{self.name}_{time}.sh"
+            batch_sched_entry = self.vm.run_executable(
+                time, "/bin/bash", script_name, vm_resource=False
+            )
+            batch_sched_entry.add_content(script_name, self.script(steps))
+            sched_entries.append(batch_sched_entry)
+        return sched_entries
+
 
 class Utilities:
     """
     An object which provides various utility functions for VMs.
     """
 
+    def batched_steps(self, time, name, window=0):
+        """
+        Create a batch of independent shell steps which run as one schedule entry.
+
+        >>> with self.batched_steps(-99, "links") as batch:
+        ...     batch.add("ln", "-sf /opt/node/bin/node /usr/local/bin/node")
+        ...     batch.add("ln", "-sf /opt/node/bin/npm /usr/local/bin/npm")
+
+        The batch is scheduled when the ``with`` block exits. Steps added with a
+        ``time`` up to ``window`` seconds after the earliest step are merged with it
+        and run at that time (see :py:class:`utilities.tools.ScheduleBatch`).
+
+        Arguments:
+            time (int): The default time of the steps.
+            name (str): A short name for the batch, used to name the generated script.
+            window (int): How many seconds after the earliest step later steps may
+                be and still be merged with it. Defaults to ``0``.
+
+        Returns:
+            ScheduleBatch: The (initially empty) batch.
+        """
+        return ScheduleBatch(self, time, name, window)
+
     def add_wireshark(self):
         """
         Install Wireshark on a VM.
@@ -15,33 +170,46 @@ class Utilities:
         if determined_os == "ubuntu2204":
             self.install_debs(-40, "wireshark-3.6.2.tgz")
 
-    def add_tcpdump(self):
-        """Install ``libpcap`` and tcpdump on a VM."""
-        self.install_build_tools()
+    def add_tcpdump(self, prebuilt=False):
+        """
+        Install ``libpcap`` and tcpdump on a VM.
 
-        # Install libpcap
-        libpcap_name = "libpcap-1.10.4"
-        self.drop_file(-58, f"/tmp/{libpcap_name}.tar.gz", f"{libpcap_name}.tar.gz")  # noqa: S108
-        self.run_executable(
-            -57, "/bin/tar", f"-C /tmp/ -xzf /tmp/{libpcap_name}.tar.gz"
-        )
-        self.run_executable(
-            -56,
-            "/bin/bash",
-            f"-c 'cd /tmp/{libpcap_name}; ./configure; make; make install;'",
-        )
+        Compiling both packages takes minutes of CPU time on every VM, so the
+        build also captures the installed files into a prebuilt archive at
+        ``/tmp/tcpdump-<version>-libpcap-<version>-<os>.tgz`` on the VM. Once that
+        archive has been copied into this MC's ``vm_resources`` directory, VMs with
+        the same OS can use ``prebuilt=True`` to simply unpack it instead.
 
-        # Install tcpdump
+        Arguments:
+            prebuilt (bool): Whether to unpack the prebuilt archive for this OS
+                rather than compiling from source. Defaults to :py:data:`False`.
+        """
+        libpcap_name = "libpcap-1.10.4"
         tcpdump_name = "tcpdump-4.99.4"
-        self.drop_file(-55, f"/tmp/{tcpdump_name}.tar.gz", f"{tcpdump_name}.tar.gz")  # noqa: S108
-        self.run_executable(
-            -54, "/bin/tar", f"-C /tmp/ -xzf /tmp/{tcpdump_name}.tar.gz"
-        )
-        self.run_executable(
-            -53,
-            "/bin/bash",
-            f"-c 'cd /tmp/{tcpdump_name}; ./configure; make; make install;'",
+        determined_os = self.get_and_validate_vm_os({"ubuntu2204"})
+        prebuilt_name = f"{tcpdump_name}-{libpcap_name}-{determined_os}.tgz"
+
+        if prebuilt:
+            unpack_sched_entry = self.run_executable(
+                -53,
+                "/bin/bash",
+                f"-c 'tar -C / --no-overwrite-dir -xzf {prebuilt_name} && ldconfig'",
+                vm_resource=False,
+            )
+            unpack_sched_entry.add_file(prebuilt_name, prebuilt_name)
+            return
+
+        self.install_build_tools()
+
+        # Compile and install libpcap, then tcpdump, capturing the result
+        build_sched_entry = self.run_executable(
+            -56,
+            "build_tcpdump.sh",
+            f"{libpcap_name} {tcpdump_name} /tmp/{prebuilt_name}",
+            vm_resource=True,
         )
+        for name in (libpcap_name, tcpdump_name):
+            build_sched_entry.add_file(f"{name}.tar.gz", f"{name}.tar.gz")
 
     def add_docker(self):
         """
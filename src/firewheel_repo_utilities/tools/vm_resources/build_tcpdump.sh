@@ -0,0 +1,40 @@
+#!/bin/bash
+
+# This script compiles and installs libpcap and tcpdump from source.
+# Both packages are built in parallel using every available CPU. The installed
+# files are also captured into a prebuilt archive (rooted at '/') so that other
+# VMs using the same image can simply unpack it instead of compiling again.
+# Only the installed tree ('usr') is archived, so that unpacking the archive
+# never changes the mode of '/' (the staging directory from mktemp is 0700).
+
+# LIBPCAP is the libpcap source name (e.g. libpcap-1.10.4)
+# TCPDUMP is the tcpdump source name (e.g. tcpdump-4.99.4)
+# ARCHIVE is the path of the prebuilt archive to create
+
+LIBPCAP=$1
+TCPDUMP=$2
+ARCHIVE=$3
+
+# The source tarballs are dropped next to this script
+cd "$(dirname "$0")" || exit 1
+SOURCE_DIR=$(pwd)
+
+STAGE=$(mktemp -d)
+trap 'rm -rf "${STAGE}"' EXIT
+
+JOBS=$(nproc 2> /dev/null || echo 1)
+
+for NAME in "${LIBPCAP}" "${TCPDUMP}"; do
+    tar -C /tmp/ -xzf "${SOURCE_DIR}/${NAME}.tar.gz" || exit 1
+    cd "/tmp/${NAME}" || exit 1
+    ./configure || exit 1
+    make -j"${JOBS}" || exit 1
+    # Install for this VM (tcpdump links against the installed libpcap)
+    # and into the staging directory which becomes the prebuilt archive
+    make install || exit 1
+    make install DESTDIR="${STAGE}" || exit 1
+done
+
+ldconfig
+tar -C "${STAGE}" -czf "${ARCHIVE}" usr
+echo "{\"vm_resource\": \"build_tcpdump\", \"archive\": \"${ARCHIVE}\", \"jobs\": ${JOBS}, \"hostname\": \"$(hostname)\"}"